@@ -1,9 +1,29 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
 from ml_service import run_analysis
 from routes import enrichment, prediction, segment_analysis  
+from utils.executors import start_executors, shutdown_executors, CpuPoolBusy
+from utils.result_cache import cache_stats
+import mongo_utils
 import uvicorn
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ✅ One Mongo pool for the whole process, opened before the first request
+    mongo_utils.connect()
+    # ✅ Warm enrichment workers before the first request arrives
+    start_executors()
+    yield
+    shutdown_executors()
+    mongo_utils.close()
+
+app = FastAPI(lifespan=lifespan)
+
+# ✅ Shed load instead of queueing without bound when the enrichment pool is saturated
+@app.exception_handler(CpuPoolBusy)
+async def cpu_pool_busy(request, exc):
+    return JSONResponse(status_code=503, content={"detail": "Enrichment pool busy, retry later"})
 
 # ✅ Legacy analyze endpoint
 @app.get("/analyze")
@@ -11,6 +31,16 @@ def analyze(stravaId: int = Query(...)):
     result = run_analysis(stravaId)
     return result
 
+# ✅ Mongo connection pool counters
+@app.get("/ml/db-stats")
+def db_stats():
+    return mongo_utils.connection_stats()
+
+# ✅ Result cache hit/miss counters
+@app.get("/ml/cache-stats")
+def result_cache_stats():
+    return cache_stats()
+
 # ✅ Include routers
 app.include_router(enrichment.router)
 app.include_router(prediction.router)
@@ -0,0 +1,128 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import gzip
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from utils.best_efforts import BEST_EFFORT_TARGETS, detect_best_efforts
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+
+
+def legacy_detect_best_efforts(df, starts=None, targets=None):
+    """
+    The original nested loop from routes/prediction.py. `starts` restricts the
+    outer loop to a subset of start samples so its runtime can be extrapolated.
+    """
+    best_efforts = {}
+    starts = range(len(df) - 1) if starts is None else starts
+
+    for name, dist_target in (targets or BEST_EFFORT_TARGETS).items():
+        best_time = None
+        for i in starts:
+            for j in range(i + 5, len(df)):
+                dist_diff = df["distance"].iloc[j] - df["distance"].iloc[i]
+                if dist_diff >= dist_target:
+                    time_diff = df["time_sec"].iloc[j] - df["time_sec"].iloc[i]
+                    if not best_time or time_diff < best_time:
+                        best_time = time_diff
+                    break
+        if best_time:
+            best_efforts[name] = {"type": "measured", "time_sec": best_time}
+    return best_efforts
+
+
+def synthetic_run_stream(n_samples, seed=42):
+    """1 Hz running stream alternating easy running and faster reps."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples, dtype=float)
+    speed = 3.0 + 0.8 * (np.sin(t / 300.0) > 0.6) + rng.normal(0, 0.15, n_samples)
+    distance = np.cumsum(np.clip(speed, 0, None))
+    return pd.DataFrame({"time_sec": t, "distance": distance})
+
+
+def dipping_run_stream(n_samples, seed=42, dip_every=15):
+    """Synthetic run whose cumulative distance steps back now and then, like GPS corrections."""
+    rng = np.random.default_rng(seed)
+    df = synthetic_run_stream(n_samples, seed)
+    dips = rng.choice(n_samples, size=max(1, n_samples // dip_every), replace=False)
+    step = np.diff(df["distance"].to_numpy(), prepend=0.0)
+    step[dips] = -rng.uniform(5, 60, len(dips))
+    df["distance"] = np.cumsum(step)
+    return df
+
+
+def corpus_run_streams(corpus_dir=CORPUS_DIR):
+    """{fixture name: time_sec/distance frame} for every corpus document with a distance stream."""
+    streams = {}
+    for path in sorted(corpus_dir.glob("*.json.gz")):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            stream = json.load(f)["stream_data_full"]
+        if "distance" in stream:
+            streams[path.name.removesuffix(".json.gz")] = pd.DataFrame(
+                {"time_sec": stream["time_sec"], "distance": stream["distance"]}
+            )
+    return streams
+
+
+def same_efforts(legacy, result):
+    return legacy.keys() == result.keys() and all(
+        legacy[name]["time_sec"] == result[name]["time_sec"] for name in legacy
+    )
+
+
+def check_against_legacy(targets=None):
+    """Asserts the vectorized results equal the full legacy loop on the corpus and on dipping streams."""
+    cases = {**corpus_run_streams(), **{f"dipping-{seed}": dipping_run_stream(900, seed) for seed in range(3)}}
+    for name, df in cases.items():
+        legacy = legacy_detect_best_efforts(df, targets=targets)
+        result = detect_best_efforts(df, targets)
+        assert same_efforts(legacy, result), f"{name}: legacy {legacy} != vectorized {result}"
+        print(f"✅ {name}: {len(df)} samples, {len(result)} efforts identical to the legacy loop")
+
+
+def time_call(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(sizes, legacy_starts):
+    rows = []
+    for n in sizes:
+        df = synthetic_run_stream(n)
+        result, vectorized_sec = time_call(detect_best_efforts, df)
+
+        # The legacy loop is far too slow to run in full: time a sample of start
+        # indices and scale up to the whole stream.
+        starts = np.linspace(0, n - 2, num=min(legacy_starts, n - 1), dtype=int)
+        _, sampled_sec = time_call(legacy_detect_best_efforts, df, starts)
+        legacy_sec = sampled_sec * (n - 1) / len(starts)
+
+        rows.append({
+            "samples": n,
+            "vectorized_sec": vectorized_sec,
+            "legacy_sec_est": legacy_sec,
+            "speedup": legacy_sec / vectorized_sec if vectorized_sec else float("inf"),
+            "efforts_found": len(result),
+        })
+        print(f"⏱️ {n:>9} samples | vectorized {vectorized_sec:8.4f}s | legacy ~{legacy_sec:12.1f}s | ×{rows[-1]['speedup']:.0f}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark best-effort detection against the legacy loop")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Stream lengths to test")
+    parser.add_argument("--legacy-starts", type=int, default=3, help="Start samples timed for the legacy extrapolation")
+    parser.add_argument("--check", action="store_true", help="First assert identical results to the full legacy loop (slow)")
+    args = parser.parse_args()
+
+    if args.check:
+        # Short targets keep the full legacy loop affordable while still covering every fixture
+        check_against_legacy({"400m": 400, "1k": 1000, "5k": 5000})
+    run_benchmark(args.sizes, args.legacy_starts)
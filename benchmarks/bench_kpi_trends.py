@@ -0,0 +1,277 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import contextlib
+import io
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from dateutil import parser
+
+from utils.segment_kpis import calculate_pace_consistency, compute_kpi_trends_with_sessions
+
+
+def legacy_compute_kpi_trends_with_sessions(activities, start_date=None, end_date=None, activity_type=None):
+    """The per-row implementation from utils/segment_kpis.py before vectorization."""
+
+    segment_rows = []
+    session_map = defaultdict(list)
+    total_segments = 0
+    valid_segments = 0
+    logged_example = False
+    scanned = 0
+
+    # Iterated once, so a Mongo cursor can be passed directly
+    for activity in activities:
+        scanned += 1
+        if activity_type and activity.get("type") != activity_type:
+            continue
+
+        start_date_raw = activity.get("startDate")
+        date = start_date_raw if isinstance(start_date_raw, datetime) else parser.parse(start_date_raw)
+
+        if start_date and date < parser.parse(start_date):
+            continue
+        if end_date and date > parser.parse(end_date):
+            continue
+
+        week = date.strftime("%Y-W%U")
+        iso_date = date.strftime("%Y-%m-%d")
+        activity_id = activity.get("stravaId") or activity.get("_id")
+
+        # Store metadata for plotting
+        session_map[week].append({
+            "activity_id": activity_id,
+            "activity_type": activity.get("type"),
+            "activity_name": activity.get("name"),
+            "date": date.isoformat(),
+        })
+
+        for seg in activity.get("segments", []):
+            total_segments += 1
+
+            if not logged_example:
+                print("🔎 Example segment keys:", seg.keys())
+                print("🔎 Example segment content:", seg)
+                logged_example = True
+
+            hr_avg = seg.get("avg_heart_rate")
+            pace = seg.get("avg_speed")
+            watts_avg = seg.get("avg_watts")
+            duration_min = seg.get("duration_sec", 0) / 60
+            distance_km = seg.get("avg_distance", 0) / 1000
+            zone_score = seg.get("zone_match_score")
+            hr_recovery = seg.get("hr_recovery_60s")
+            hr_drift = seg.get("hr_drift_ratio")
+
+            segment_rows.append({
+                "week": week,
+                "date": iso_date,
+                "hr": hr_avg,
+                "watts": watts_avg,
+                "pace": pace,
+                "distance_km": distance_km,
+                "duration_min": duration_min,
+                "zone_score": zone_score,
+                "activity_type": activity.get("type"),
+                "activity_id": activity_id,
+                "hr_recovery_60s": hr_recovery,
+                "hr_drift_ratio": hr_drift,
+            })
+            valid_segments += 1
+
+    print(f"✅ Processed {len(segment_rows)} segment rows from {scanned} activities.")
+    print(f"🔎 Total segments scanned: {total_segments}, valid segments used: {valid_segments}")
+
+    df = pd.DataFrame(segment_rows)
+    if df.empty:
+        print("⚠️ No segment rows found after filtering. Returning empty trends.")
+        return []
+
+    df_by_week = df.groupby("week")
+    print(f"📊 KPI groups by week: {df_by_week.size().to_dict()}")
+
+    all_trends = []
+    metric_values = defaultdict(list)
+
+    for week, group in df_by_week:
+        metrics = {}
+        dates = group["date"].tolist()
+        rep_date = sorted(dates)[-1] if dates else week  # use most recent date of the week
+
+        if (group["distance_km"] > 0).any():
+            hr_eff = (group["hr"] / group["distance_km"]).mean()
+            metrics["hr_efficiency"] = hr_eff
+
+        metrics["pace_consistency"] = calculate_pace_consistency(group["pace"].dropna().tolist())
+
+        if (group["zone_score"] > 0).any():
+            metrics["zone_compliance"] = group["zone_score"].mean()
+
+        metrics["effort_matching"] = group["zone_score"].mean()
+        metrics["completion_delta"] = group["duration_min"].std()
+
+        high_intensity = group[group["duration_min"] < 5]
+        if not high_intensity.empty:
+            metrics["high_intensity_watts"] = high_intensity["watts"].mean()
+
+        if (group["duration_min"] > 0).any():
+            metrics["load_efficiency"] = (group["watts"] / group["duration_min"]).mean()
+
+        if (group["hr_recovery_60s"].notna()).any():
+            metrics["hr_recovery_60s"] = group["hr_recovery_60s"].dropna().mean()
+
+        if (group["hr_drift_ratio"].notna()).any():
+            metrics["hr_drift_ratio"] = group["hr_drift_ratio"].dropna().mean()
+
+        for metric, value in metrics.items():
+            all_trends.append({
+                "metric": metric,
+                "week": week,
+                "date": rep_date,
+                "value": value,
+                "sessions": session_map[week]
+            })
+            metric_values[metric].append((week, value))
+
+    # Segment count
+    segment_counts = df.groupby("week").size().reset_index(name='count')
+    for _, row in segment_counts.iterrows():
+        rep_date = sorted([s["date"] for s in session_map[row["week"]]])[-1]
+        all_trends.append({
+            "metric": "segment_frequency",
+            "week": row["week"],
+            "date": rep_date,
+            "value": row["count"],
+            "sessions": session_map[row["week"]]
+        })
+        metric_values["segment_frequency"].append((row["week"], row["count"]))
+
+    # Normalize
+    normalized_trends = []
+    for metric, week_values in metric_values.items():
+        filtered = [(week, v) for week, v in week_values if v is not None]
+        if not filtered:
+            continue  # skip this metric if all values are None
+
+        weeks, values = zip(*filtered)
+        values = np.array(values)
+
+        if len(set(values)) == 1:
+            norm_values = [0.5 for _ in values]
+        else:
+            min_v, max_v = values.min(), values.max()
+            norm_values = [(v - min_v) / (max_v - min_v) for v in values]
+
+        for week, norm in zip(weeks, norm_values):
+            rep_date = sorted([s["date"] for s in session_map[week]])[-1]
+            normalized_trends.append({
+                "metric": metric + "_norm",
+                "week": week,
+                "date": rep_date,
+                "value": norm,
+                "sessions": session_map[week]
+            })
+
+    # Fitness index (composite)
+    fitness_index = defaultdict(lambda: defaultdict(float))
+    weights = {
+        "hr_efficiency_norm": 0.4,
+        "zone_compliance_norm": 0.3,
+        "completion_delta_norm": 0.3
+    }
+
+    for row in normalized_trends:
+        metric = row["metric"]
+        if metric in weights:
+            fitness_index[row["week"]]["sum"] += row["value"] * weights[metric]
+            fitness_index[row["week"]]["weight"] += weights[metric]
+
+    for week, val in fitness_index.items():
+        score = val["sum"] / val["weight"]
+        rep_date = sorted([s["date"] for s in session_map[week]])[-1]
+        normalized_trends.append({
+            "metric": "fitness_index",
+            "week": week,
+            "date": rep_date,
+            "value": score,
+            "sessions": session_map[week]
+        })
+
+    return normalized_trends
+
+
+def synthetic_history(n_activities, seed=42):
+    """About five activities a week, each with a handful of segments carrying every KPI field."""
+    rng = np.random.default_rng(seed)
+    start = datetime(2019, 1, 6, 7, 30)
+    activities = []
+    for i in range(n_activities):
+        segments = []
+        for _ in range(int(rng.integers(1, 9))):
+            segments.append({
+                "type": "steady",
+                "avg_heart_rate": float(rng.uniform(110, 180)),
+                "avg_speed": float(rng.uniform(2.5, 5.5)),
+                "avg_watts": float(rng.uniform(120, 320)) if rng.random() < 0.6 else None,
+                "duration_sec": float(rng.uniform(20, 1800)),
+                "avg_distance": float(rng.uniform(0, 5000)),
+                "zone_match_score": float(rng.random()) if rng.random() < 0.5 else None,
+                "hr_recovery_60s": float(rng.uniform(5, 40)) if rng.random() < 0.3 else None,
+                "hr_drift_ratio": float(rng.uniform(0.9, 1.2)) if rng.random() < 0.3 else None,
+            })
+        activities.append({
+            "_id": i,
+            "stravaId": 10_000_000 + i,
+            "type": "Run" if rng.random() < 0.6 else "Ride",
+            "name": f"Activity {i}",
+            "startDate": start + timedelta(hours=float(i * 33.6 + rng.uniform(0, 6))),
+            "segments": segments,
+        })
+    return activities
+
+
+def time_call(fn, *args, **kwargs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(sizes, repeat):
+    rows = []
+    for n in sizes:
+        activities = synthetic_history(n)
+        cases = {
+            "all": {},
+            "filtered": {"activity_type": "Run", "start_date": "2019-06-01", "end_date": "2021-06-01"},
+        }
+        for case, kwargs in cases.items():
+            legacy, legacy_sec = min((time_call(legacy_compute_kpi_trends_with_sessions, activities, **kwargs) for _ in range(repeat)), key=lambda r: r[1])
+            result, vectorized_sec = min((time_call(compute_kpi_trends_with_sessions, activities, **kwargs) for _ in range(repeat)), key=lambda r: r[1])
+            identical = repr(result) == repr(legacy)
+            rows.append({
+                "activities": n,
+                "case": case,
+                "legacy_sec": legacy_sec,
+                "vectorized_sec": vectorized_sec,
+                "speedup": legacy_sec / vectorized_sec if vectorized_sec else float("inf"),
+                "identical": identical,
+            })
+            print(f"⏱️ {n:>6} activities ({case:>8}) | legacy {legacy_sec:7.3f}s | vectorized {vectorized_sec:7.3f}s | "
+                  f"×{rows[-1]['speedup']:.1f} | {'identical' if identical else '❌ OUTPUT DIFFERS'}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser_ = argparse.ArgumentParser(description="Benchmark KPI trends against the legacy per-row implementation")
+    parser_.add_argument("--sizes", type=int, nargs="+", default=[500, 5_000], help="Activity history lengths to test")
+    parser_.add_argument("--repeat", type=int, default=3, help="Runs per case; the fastest is reported")
+    args = parser_.parse_args()
+
+    run_benchmark(args.sizes, args.repeat)
@@ -0,0 +1,98 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import contextlib
+import io
+import time
+import numpy as np
+import pandas as pd
+
+from utils.enrichment_helpers import parse_streams
+from utils.stream_codec import encode_streams
+
+
+def legacy_parse_stream_frame(streams):
+    """The derived-feature part of the original parse_streams, kept for comparison."""
+    df = pd.DataFrame(streams)
+    for col in df.columns:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    df = df.dropna(subset=["time_sec", "watts"])
+
+    window = 30
+    delta_cols = {}
+    rolling_means = {}
+    rolling_deltas = {}
+
+    for col in df.columns:
+        if col == "time_sec":
+            continue
+
+        delta = df[col].diff()
+        delta_cols[f"delta_{col}"] = delta
+        rolling_means[f"rolling_{col}_mean"] = df[col].rolling(window, min_periods=1).mean()
+        rolling_deltas[f"rolling_{col}_trend"] = delta.rolling(window, min_periods=1).mean()
+
+    df = pd.concat([df, pd.DataFrame(delta_cols), pd.DataFrame(rolling_means), pd.DataFrame(rolling_deltas)], axis=1)
+    df = df.apply(pd.to_numeric, errors="coerce")
+    return df
+
+
+def synthetic_ride(hours, seed=7):
+    """1 Hz ride as it comes out of Mongo: a dict of plain Python lists with a few gaps."""
+    rng = np.random.default_rng(seed)
+    n = int(hours * 3600)
+    t = np.arange(n, dtype=float)
+    watts = np.clip(180 + 60 * np.sin(t / 240.0) + rng.normal(0, 25, n), 0, None).round()
+    speed = (8 + watts / 60 + rng.normal(0, 0.3, n)).round(3)
+    hr = (110 + watts / 5 + rng.normal(0, 2, n)).round()
+    hr[rng.choice(n, n // 200, replace=False)] = np.nan
+    streams = {
+        "time_sec": t,
+        "distance": np.cumsum(speed).round(3),
+        "heart_rate": hr,
+        "watts": watts,
+        "cadence": (85 + rng.normal(0, 4, n)).round(),
+        "altitude": (50 + np.cumsum(rng.normal(0, 0.05, n))).round(3),
+        "speed": speed,
+    }
+    return {col: [None if np.isnan(v) else float(v) for v in values] for col, values in streams.items()}
+
+
+def best_of(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def run_benchmark(hours_list, repeat):
+    for hours in hours_list:
+        streams = synthetic_ride(hours)
+        legacy, legacy_sec = best_of(lambda: legacy_parse_stream_frame(streams), repeat)
+        parsed, new_sec = best_of(lambda: parse_streams({"stream_data_full": streams}), repeat)
+        encoded = encode_streams(streams)
+        _, codec_sec = best_of(lambda: parse_streams({"stream_data_full": encoded}), repeat)
+
+        shared = [col for col in parsed.columns if col in legacy.columns]
+        max_diff = np.nanmax(np.abs(parsed[shared].to_numpy() - legacy[shared].to_numpy()))
+        print(
+            f"⏱️ {hours:>4}h ({len(parsed):>6} rows) | legacy {legacy_sec:7.3f}s ({legacy.shape[1]} cols)"
+            f" | new {new_sec:7.3f}s ({parsed.shape[1]} cols) | ×{legacy_sec / new_sec:.1f}"
+            f" | from codec {codec_sec:7.3f}s | max diff {max_diff:.2e}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parse_streams against the legacy per-column builder")
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 6, 12], help="Ride lengths to test")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size (best is reported)")
+    args = parser.parse_args()
+
+    run_benchmark(args.hours, args.repeat)
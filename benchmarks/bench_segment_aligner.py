@@ -0,0 +1,114 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import json
+import time
+
+from utils.fit_engine.segment_aligner import align_blocks, compatible_type_cost, score_segment_accuracy
+
+
+def legacy_iou_range(range_a, range_b):
+    set_a = set(range(range_a[0], range_a[1] + 1))
+    set_b = set(range(range_b[0], range_b[1] + 1))
+    intersection = set_a & set_b
+    union = set_a | set_b
+    return len(intersection) / len(union) if union else 0
+
+
+def legacy_align_planned_to_detected(planned_blocks, detected_blocks):
+    """The greedy implementation from utils/fit_engine/segment_aligner.py before the DP aligner."""
+    results = []
+    detected_used = set()
+
+    current_index = 0  # Index into detected_blocks
+
+    for i, planned in enumerate(planned_blocks):
+        best_match = None
+        best_iou = 0
+        planned_duration = planned.get("duration_sec", 0)
+
+        for j in range(current_index, len(detected_blocks)):
+            detected = detected_blocks[j]
+            if j in detected_used:
+                continue
+
+            if planned["type"] != detected["type"]:
+                continue
+
+            detected_duration = detected["duration_sec"]
+            duration_diff = abs(planned_duration - detected_duration)
+
+            if duration_diff > 0.5 * planned_duration:
+                continue
+
+            iou = legacy_iou_range(
+                (current_index, current_index + planned_duration),
+                (detected["start_index"], detected["end_index"])
+            )
+
+            if iou > best_iou:
+                best_match = detected
+                best_iou = iou
+
+        results.append({
+            "planned_type": planned["type"],
+            "planned_duration": planned.get("duration_sec"),
+            "matched": bool(best_match),
+            "match_iou": round(best_iou, 2) if best_match else 0.0,
+            "detected_start_index": best_match.get("start_index") if best_match else None,
+            "detected_duration": best_match.get("duration_sec") if best_match else None
+        })
+
+        if best_match:
+            detected_used.add(detected_blocks.index(best_match))
+            current_index = best_match["end_index"]
+
+    return results
+
+
+def load_pairs(path):
+    """(planned_blocks, segmentSequence) pairs stored by scripts/fit_align_runner.py."""
+    pairs = []
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.get("planned_blocks") and entry.get("matched_segments"):
+                pairs.append((entry["planned_blocks"], entry["matched_segments"]))
+    return pairs
+
+
+def score(pairs, align):
+    matched = planned = 0
+    start = time.perf_counter()
+    for planned_blocks, detected_blocks in pairs:
+        metrics = score_segment_accuracy(align(planned_blocks, detected_blocks))
+        matched += metrics["matched"]
+        planned += metrics["planned_total"]
+    return time.perf_counter() - start, matched, planned
+
+
+def run_benchmark(path, repeat):
+    pairs = load_pairs(path)
+    print(f"📂 {len(pairs)} alignments from {path}")
+    aligners = {
+        "legacy greedy": legacy_align_planned_to_detected,
+        "dp exact types": lambda p, d: align_blocks(p, d)["alignment"],
+        "dp compatible types": lambda p, d: align_blocks(p, d, type_cost=compatible_type_cost)["alignment"],
+    }
+    rows = []
+    for name, align in aligners.items():
+        elapsed, matched, planned = min((score(pairs, align) for _ in range(repeat)), key=lambda r: r[0])
+        rows.append({"aligner": name, "sec": elapsed, "files_per_sec": len(pairs) / elapsed, "matched": matched, "planned": planned})
+        print(f"⏱️ {name:>20} | {elapsed:7.3f}s | {len(pairs) / elapsed:8.0f} files/s | matched {matched}/{planned}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the DP segment aligner against the legacy greedy aligner")
+    parser.add_argument("--results", type=str, default="fit_alignment_results.jsonl", help="Output of scripts/fit_align_runner.py")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per aligner; the fastest is reported")
+    args = parser.parse_args()
+
+    run_benchmark(args.results, args.repeat)
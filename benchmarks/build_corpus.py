@@ -0,0 +1,99 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import gzip
+import json
+import numpy as np
+import pandas as pd
+from fitparse import FitFile
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+FIT_ROOT = Path(__file__).resolve().parent.parent / "fit_data"
+
+# One recording per sport is stretched or trimmed to each benchmark length
+SOURCES = {
+    "Run": FIT_ROOT / "Run" / "2024-01-06-15-03-42.fit",
+    "Swim": FIT_ROOT / "Swim" / "2024-01-11-18-17-26.fit",
+    "VirtualRide": FIT_ROOT / "VirtualRide" / "FIT files" / "2024-03-15-20-13-02.fit",
+}
+LENGTHS_SEC = {
+    "short": 15 * 60,
+    "1h": 3600,
+    "6h": 6 * 3600,
+}
+# FIT record field -> stream channel, first match wins
+FIT_CHANNELS = {
+    "distance": ["distance"],
+    "heart_rate": ["heart_rate"],
+    "watts": ["power"],
+    "cadence": ["cadence"],
+    "speed": ["enhanced_speed", "speed"],
+    "altitude": ["enhanced_altitude", "altitude"],
+}
+CUMULATIVE_CHANNELS = ["time_sec", "distance"]
+
+
+def fit_records(path):
+    """Record samples only: no timestamps, positions or device metadata survive."""
+    records = pd.DataFrame([msg.get_values() for msg in FitFile(str(path)).get_messages("record")])
+    records = records.dropna(subset=["timestamp"])
+    streams = pd.DataFrame({"time_sec": (records["timestamp"] - records["timestamp"].iloc[0]).dt.total_seconds()})
+    for channel, fields in FIT_CHANNELS.items():
+        field = next((f for f in fields if f in records and records[f].notna().any()), None)
+        streams[channel] = pd.to_numeric(records[field], errors="coerce").to_numpy() if field else np.nan
+    return streams.reset_index(drop=True)
+
+
+def fit_to_length(streams, length_sec):
+    """Repeats the recording back to back (continuing time and distance) and cuts it at `length_sec`."""
+    duration = streams["time_sec"].iloc[-1] + 1
+    laps = []
+    offset = pd.Series(0.0, index=CUMULATIVE_CHANNELS)
+    while offset["time_sec"] < length_sec:
+        lap = streams.copy()
+        for channel in CUMULATIVE_CHANNELS:
+            lap[channel] = lap[channel] + offset[channel]
+        laps.append(lap)
+        offset["time_sec"] += duration
+        offset["distance"] += np.nan_to_num(streams["distance"].max())
+    tiled = pd.concat(laps, ignore_index=True)
+    return tiled[tiled["time_sec"] < length_sec]
+
+
+def to_document(sport, label, streams):
+    # Like Strava, a sensor the device never recorded has no stream at all
+    stream_data = {
+        col: [None if np.isnan(v) else float(v) for v in streams[col].round(3)]
+        for col in streams.columns
+        if streams[col].notna().any()
+    }
+    return {
+        "_id": f"bench-{sport.lower()}-{label}",
+        "userId": "bench-user",
+        "type": sport,
+        "name": f"{sport} {label}",
+        "startDate": "2024-01-01T08:00:00",
+        "stream_data_full": stream_data,
+    }
+
+
+def build_corpus(output_dir=CORPUS_DIR):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for sport, path in SOURCES.items():
+        streams = fit_records(path)
+        for label, length_sec in LENGTHS_SEC.items():
+            doc = to_document(sport, label, fit_to_length(streams, length_sec))
+            target = output_dir / f"{doc['_id']}.json.gz"
+            with gzip.open(target, "wt", encoding="utf-8") as f:
+                json.dump(doc, f, separators=(",", ":"))
+            print(f"💾 {target.name}: {len(doc['stream_data_full']['time_sec'])} samples")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the anonymized benchmark corpus from the FIT recordings in fit_data/")
+    parser.add_argument("--output", type=Path, default=CORPUS_DIR, help="Directory for the .json.gz documents")
+    args = parser.parse_args()
+
+    build_corpus(args.output)
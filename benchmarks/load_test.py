@@ -0,0 +1,109 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import asyncio
+import contextlib
+import copy
+import gzip
+import io
+import json
+import time
+import numpy as np
+
+from utils.enrichment_pipeline import enrich_activity_document
+from utils.executors import run_cpu, run_db, start_executors, shutdown_executors
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+
+
+def load_fixture(name):
+    with gzip.open(CORPUS_DIR / f"{name}.json.gz", "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def small_query():
+    """Stand-in for a light request: one short Mongo round trip."""
+    time.sleep(0.002)
+    return {"ok": True}
+
+
+def enrich_quietly(activity):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return enrich_activity_document(activity)
+
+
+async def small_request():
+    start = time.perf_counter()
+    await run_db(small_query)
+    return time.perf_counter() - start
+
+
+async def large_request(activity, mode):
+    if mode == "inline":
+        # What the endpoints did before: CPU work directly on the event loop
+        enrich_quietly(copy.deepcopy(activity))
+        await asyncio.sleep(0)
+    else:
+        await run_cpu(enrich_quietly, activity)
+
+
+async def small_traffic(duration, rate):
+    latencies = []
+    tasks = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        tasks.append(asyncio.ensure_future(small_request()))
+        await asyncio.sleep(1 / rate)
+    latencies.extend(await asyncio.gather(*tasks))
+    return latencies
+
+
+async def large_traffic(activity, mode, duration, concurrency):
+    done = 0
+    end = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal done
+        while time.perf_counter() < end:
+            await large_request(activity, mode)
+            done += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return done
+
+
+def percentiles(latencies):
+    ms = np.array(latencies) * 1e3
+    return f"p50 {np.percentile(ms, 50):7.1f} ms | p99 {np.percentile(ms, 99):7.1f} ms | n={len(ms)}"
+
+
+async def run_load_test(mode, fixture, duration, rate, concurrency):
+    activity = load_fixture(fixture)
+
+    idle = await small_traffic(duration, rate)
+    print(f"📶 small requests, idle server       {percentiles(idle)}")
+
+    loaded, enriched = await asyncio.gather(
+        small_traffic(duration, rate),
+        large_traffic(activity, mode, duration, concurrency),
+    )
+    print(f"📶 small requests, {concurrency} × {fixture} ({mode}) {percentiles(loaded)} | {enriched} rides enriched")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="p50/p99 latency of small requests while large rides are enriched")
+    parser.add_argument("--mode", choices=["pool", "inline", "both"], default="both", help="Where large enrichments run")
+    parser.add_argument("--fixture", default="bench-virtualride-6h", help="Corpus document used for large requests")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per phase")
+    parser.add_argument("--rate", type=float, default=50, help="Small requests per second")
+    parser.add_argument("--concurrency", type=int, default=2, help="Large enrichments in flight")
+    args = parser.parse_args()
+
+    start_executors()
+    try:
+        for mode in (["inline", "pool"] if args.mode == "both" else [args.mode]):
+            asyncio.run(run_load_test(mode, args.fixture, args.duration, args.rate, args.concurrency))
+    finally:
+        shutdown_executors()
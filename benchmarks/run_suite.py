@@ -0,0 +1,186 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import contextlib
+import copy
+import gzip
+import io
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils.enrichment_helpers import parse_streams, detect_segments
+from utils.segment_sequencer import infer_segment_sequence
+from utils.segment_kpis import compute_kpi_trends_with_sessions
+
+BENCH_DIR = Path(__file__).resolve().parent
+CORPUS_DIR = BENCH_DIR / "corpus"
+RESULTS_DIR = BENCH_DIR / "results"
+DEFAULT_BASELINE = RESULTS_DIR / "baseline.json"
+STAGES = ["parse_streams", "detect_segments", "infer_segment_sequence", "compute_kpi_trends"]
+# Stages faster than this are dominated by timer noise and never flagged
+MIN_COMPARABLE_SEC = 0.002
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    docs = []
+    for path in sorted(corpus_dir.glob("*.json.gz")):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            docs.append(json.load(f))
+    if not docs:
+        raise FileNotFoundError(f"No corpus documents in {corpus_dir}; run benchmarks/build_corpus.py")
+    return docs
+
+
+def measure(fn, repeat):
+    """
+    Peak memory from one run under tracemalloc (which doubles as a warm-up), then
+    the best wall time over `repeat` untraced runs.
+    """
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings), peak
+
+
+def record(results, stage, name, rows, wall_sec, peak_bytes):
+    results[f"{stage}/{name}"] = {
+        "stage": stage,
+        "fixture": name,
+        "rows": rows,
+        "wall_sec": wall_sec,
+        "peak_mb": peak_bytes / 1e6,
+        "rows_per_sec": rows / wall_sec if wall_sec > 0 else None,
+    }
+
+
+def kpi_history(enriched, weeks):
+    """Repeats the enriched corpus once per week so KPI trends have a season to aggregate."""
+    start = datetime(2024, 1, 1, 8, 0)
+    activities = []
+    for week in range(weeks):
+        for doc in enriched:
+            activity = copy.deepcopy(doc)
+            activity["startDate"] = start + timedelta(weeks=week)
+            activities.append(activity)
+    return activities
+
+
+def run_suite(docs, repeat=5, kpi_weeks=52):
+    results = {}
+    enriched = []
+
+    for doc in docs:
+        name = doc["_id"]
+        df, wall, peak = measure(lambda: parse_streams(doc), repeat)
+        rows = len(df)
+        record(results, "parse_streams", name, rows, wall, peak)
+
+        segment_result, wall, peak = measure(lambda: detect_segments(df, doc), repeat)
+        record(results, "detect_segments", name, rows, wall, peak)
+        segments = segment_result["segments"] if segment_result else []
+
+        _, wall, peak = measure(lambda: infer_segment_sequence(copy.deepcopy(segments), df), repeat)
+        record(results, "infer_segment_sequence", name, rows, wall, peak)
+
+        enriched.append({"_id": name, "type": doc["type"], "name": doc["name"], "segments": segments})
+        print(f"⏱️ {name}: {rows} rows, {len(segments)} segments")
+
+    activities = kpi_history(enriched, kpi_weeks)
+    segment_rows = sum(len(a["segments"]) for a in activities)
+    _, wall, peak = measure(lambda: compute_kpi_trends_with_sessions(activities), repeat)
+    record(results, "compute_kpi_trends", f"{kpi_weeks}_weeks", segment_rows, wall, peak)
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Flags every stage whose wall time or peak memory grew by more than `threshold`."""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get("results", {}).get(key)
+        if not previous:
+            print(f"🆕 {key}: no baseline entry")
+            continue
+
+        wall_ratio = current["wall_sec"] / previous["wall_sec"] if previous["wall_sec"] else float("inf")
+        mem_ratio = current["peak_mb"] / previous["peak_mb"] if previous["peak_mb"] else float("inf")
+        slower = wall_ratio > 1 + threshold and current["wall_sec"] >= MIN_COMPARABLE_SEC
+        heavier = mem_ratio > 1 + threshold
+        flag = "❌" if slower or heavier else "✅"
+        print(
+            f"{flag} {key:<55} {previous['wall_sec'] * 1e3:9.2f} → {current['wall_sec'] * 1e3:9.2f} ms (×{wall_ratio:.2f})"
+            f" | {previous['peak_mb']:7.2f} → {current['peak_mb']:7.2f} MB (×{mem_ratio:.2f})"
+        )
+        if slower or heavier:
+            regressions.append(key)
+    return regressions
+
+
+def environment():
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def print_results(results):
+    for stage in STAGES:
+        for key, r in results.items():
+            if r["stage"] != stage:
+                continue
+            rate = f"{r['rows_per_sec']:12,.0f} rows/s" if r["rows_per_sec"] else ""
+            print(f"📊 {key:<55} {r['wall_sec'] * 1e3:9.2f} ms | {r['peak_mb']:7.2f} MB | {rate}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline enrichment benchmark over the checked-in fixture corpus")
+    parser.add_argument("--corpus", type=Path, default=CORPUS_DIR, help="Directory of .json.gz activity documents")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per stage (best is kept)")
+    parser.add_argument("--kpi-weeks", type=int, default=52, help="Weeks of history fed to compute_kpi_trends")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "latest.json", help="Where to write this run's results")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative slowdown / memory growth (0.25 = 25%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the new baseline")
+    args = parser.parse_args()
+
+    results = run_suite(load_corpus(args.corpus), repeat=args.repeat, kpi_weeks=args.kpi_weeks)
+    report = {"environment": environment(), "repeat": args.repeat, "results": results}
+    print_results(results)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"💾 Results written to {args.output}")
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"📌 Baseline updated: {args.baseline}")
+    elif args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"✅ No regressions above {args.threshold:.0%}")
+    else:
+        print(f"⚠️ No baseline at {args.baseline}; run with --update-baseline to create one")
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from mongo_utils import get_db_connection, fetch_activity_by_strava_id
+from mongo_utils import get_db, fetch_activity_by_strava_id
 from segment_analysis import parse_streams, detect_segments
 
 # ✅ Load environment variables
@@ -13,12 +13,9 @@ DB_NAME = os.getenv("DB_NAME")
 if not MONGO_URL or not MONGO_URL.startswith("mongodb"):
     raise RuntimeError(f"❌ Invalid MONGO_URL: {MONGO_URL}")
 
-# ✅ Connect to DB
-db = get_db_connection(MONGO_URL, DB_NAME)
-
 def run_analysis(strava_id):
     print(f"🔍 Starting analysis for stravaId: {strava_id}")
-    activity = fetch_activity_by_strava_id(db, strava_id)
+    activity = fetch_activity_by_strava_id(get_db(), strava_id)
 
     if not activity:
         print("⚠️ Activity not found in DB.")
@@ -1,16 +1,188 @@
-from pymongo import MongoClient
+"""
+Shared Mongo access for the API, the fit engine and scripts.
+
+One MongoClient (and therefore one connection pool) per process, created by
+connect() in the FastAPI lifespan or lazily on first use elsewhere. Route
+handlers await the async helpers below, which use motor when MONGO_ASYNC_DRIVER=motor
+and it is installed, and otherwise run the pymongo call on the DB thread pool.
+"""
+from pymongo import MongoClient, monitoring
 
 from dotenv import load_dotenv
 import os
+import threading
+
+from utils.executors import run_db
 
 load_dotenv()  # Loads variables from .env
 
 MONGO_URL = os.getenv("MONGO_URL")
-DB_NAME = os.getenv("DB_NAME")
+DB_NAME = os.getenv("DB_NAME", "test")
+
+ACTIVITIES = "stravaactivities"
+USER_CURVES = "userbestcurves"
+KPI_ROLLUPS = "kpiweeklyrollups"
+KPI_ROLLUP_STATUS = "kpirollupstatus"
+RESULT_CACHE = "resultcache"
+DATA_VERSIONS = "userdataversions"
+
+# Pool tuning, passed straight to MongoClient
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000)),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000)),
+    "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 60000)),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000)),
+}
+MONGO_ASYNC_DRIVER = os.getenv("MONGO_ASYNC_DRIVER", "threads")  # "threads" or "motor"
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters, shared by the sync and async clients."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {
+            "created": 0,
+            "closed": 0,
+            "checked_out": 0,
+            "checked_in": 0,
+            "checkout_failed": 0,
+            "pools_cleared": 0,
+        }
+
+    def _bump(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["open"] = stats["created"] - stats["closed"]
+        stats["in_use"] = stats["checked_out"] - stats["checked_in"]
+        return stats
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+    def pool_cleared(self, event): self._bump("pools_cleared")
+    def connection_created(self, event): self._bump("created")
+    def connection_closed(self, event): self._bump("closed")
+    def connection_check_out_failed(self, event): self._bump("checkout_failed")
+    def connection_checked_out(self, event): self._bump("checked_out")
+    def connection_checked_in(self, event): self._bump("checked_in")
+
+
+pool_stats = PoolStats()
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def connect():
+    """Creates the process-wide client(s). Safe to call more than once."""
+    global _client, _async_client
+    if not MONGO_URL or not MONGO_URL.startswith("mongodb"):
+        raise RuntimeError(f"❌ Invalid or missing MONGO_URL: {MONGO_URL}")
+
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(MONGO_URL, event_listeners=[pool_stats], **MONGO_CLIENT_OPTIONS)
+            print(f"✅ MongoDB client ready (maxPoolSize={MONGO_CLIENT_OPTIONS['maxPoolSize']})")
+        if MONGO_ASYNC_DRIVER == "motor" and _async_client is None:
+            try:
+                from motor.motor_asyncio import AsyncIOMotorClient
+            except ImportError:
+                print("⚠️ MONGO_ASYNC_DRIVER=motor but motor is not installed; using the DB thread pool")
+            else:
+                _async_client = AsyncIOMotorClient(MONGO_URL, event_listeners=[pool_stats], **MONGO_CLIENT_OPTIONS)
+    return _client
+
+
+def close():
+    global _client, _async_client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        if _async_client is not None:
+            _async_client.close()
+        _client = _async_client = None
+    print("🛑 MongoDB client closed")
+
+
+def get_client():
+    return _client or connect()
+
+
+def get_db():
+    return get_client()[DB_NAME]
+
+
+def get_collection(name=ACTIVITIES):
+    return get_db()[name]
+
+
+def get_async_collection(name=ACTIVITIES):
+    """Motor collection, or None when the async driver is not in use."""
+    get_client()
+    return _async_client[DB_NAME][name] if _async_client is not None else None
+
+
+def connection_stats():
+    return {
+        "driver": "motor" if _async_client is not None else "pymongo",
+        "options": MONGO_CLIENT_OPTIONS,
+        "pool": pool_stats.snapshot(),
+    }
+
+
+# Awaitable helpers for route handlers
+
+async def find_one(name, query, projection=None, **kwargs):
+    async_collection = get_async_collection(name)
+    if async_collection is not None:
+        return await async_collection.find_one(query, projection, **kwargs)
+    return await run_db(get_collection(name).find_one, query, projection, **kwargs)
+
+
+async def find_all(name, query, projection=None, **kwargs):
+    async_collection = get_async_collection(name)
+    if async_collection is not None:
+        return await async_collection.find(query, projection, **kwargs).to_list(length=None)
+    return await run_db(lambda: list(get_collection(name).find(query, projection, **kwargs)))
+
+
+async def update_one(name, query, update, **kwargs):
+    async_collection = get_async_collection(name)
+    if async_collection is not None:
+        return await async_collection.update_one(query, update, **kwargs)
+    return await run_db(get_collection(name).update_one, query, update, **kwargs)
+
+
+async def update_many(name, query, update, **kwargs):
+    async_collection = get_async_collection(name)
+    if async_collection is not None:
+        return await async_collection.update_many(query, update, **kwargs)
+    return await run_db(get_collection(name).update_many, query, update, **kwargs)
+
+
+async def bulk_write(name, requests, **kwargs):
+    async_collection = get_async_collection(name)
+    if async_collection is not None:
+        return await async_collection.bulk_write(requests, **kwargs)
+    return await run_db(get_collection(name).bulk_write, requests, **kwargs)
+
+
+# Legacy helpers
 
-def get_db_connection(uri, db_name):
-    client = MongoClient(uri)
-    return client[db_name]
+def get_db_connection(uri=None, db_name=None):
+    """Kept for older callers; returns a database on the shared client instead of a new one."""
+    return get_client()[db_name or DB_NAME]
 
 def fetch_activity_by_strava_id(db, strava_id):
     # Ensure we are comparing using an integer
@@ -1,37 +1,28 @@
+import asyncio
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from bson import ObjectId
+from bson.errors import InvalidId
 import os
-from pymongo import MongoClient
+from typing import List
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
 from datetime import datetime, UTC  # ✅ Use UTC from datetime
-from utils.segment_sequencer import infer_segment_sequence
 
-
-from utils.enrichment_helpers import (
-    parse_streams,
-    extract_aggregated_features,
-    detect_segments,
-    generate_ml_windows,
-    convert_numpy_types,
-    prepare_activity_for_storage
-
-)
+import mongo_utils as mongo
+from mongo_utils import ACTIVITIES, USER_CURVES, KPI_ROLLUPS
+from utils.enrichment_helpers import build_user_curve_update, merge_mean_max_curves
+from utils.enrichment_pipeline import enrich_activity_document
+from utils.kpi_rollup import build_rollup_cleanup, build_rollup_update
+from utils.executors import run_cpu, CpuPoolBusy
+from utils import result_cache
 
 # ✅ Load environment variables
 load_dotenv()
 
-# ✅ Get MongoDB configuration
-mongo_url = os.getenv("MONGO_URL")
-db_name = os.getenv("DB_NAME", "test")
-
-if not mongo_url or not mongo_url.startswith("mongodb"):
-    raise ValueError(f"❌ Invalid or missing MONGO_URL: {mongo_url}")
-
-# ✅ Set up MongoDB client
-client = MongoClient(mongo_url)
-db = client[db_name]
-collection = db["stravaactivities"]
+# Largest number of activities accepted by /ml/enrich-batch
+ENRICH_BATCH_MAX = int(os.getenv("ENRICH_BATCH_MAX", 100))
 
 # ✅ FastAPI router
 router = APIRouter()
@@ -46,7 +37,7 @@ async def enrich_activity(request: EnrichmentRequest):
     print(f"🚀 Starting enrichment for activity_id={request.activity_id}, user_id={request.user_id}")
 
     try:
-        activity = collection.find_one({
+        activity = await mongo.find_one(ACTIVITIES, {
             "_id": ObjectId(request.activity_id),
             "userId": request.user_id
         })
@@ -54,59 +45,163 @@ async def enrich_activity(request: EnrichmentRequest):
             raise HTTPException(status_code=404, detail="Activity not found for this user")
 
         strava_id = activity.get("stravaId")
-        print(f"📌 Processing stravaId={strava_id}")
-
-        if activity.get("type") == "WeightTraining":
-            print("⏭ Skipping WeightTraining activity")
-            return {"skipped": True, "reason": "WeightTraining activity"}
-
-        # STEP 1: parse streams
-        print("📊 Parsing streams...")
-        df = parse_streams(activity)
-        print(f"✅ Parsed stream shape: {df.shape}")
-
-        if df.empty or df.shape[0] < 30:
-            print(f"⏭ Skipping {strava_id}: insufficient stream data.")
-            return {"skipped": True, "reason": "Insufficient stream data"}
-
-        # STEP 2: extract aggregated features
-        print("📈 Extracting aggregated features...")
-        aggregated = extract_aggregated_features(activity)
-
-        # STEP 3: detect segments
-        print("🔍 Detecting segments...")
-        segments_result = detect_segments(df, activity)
-
-        # STEP 3.1: infer sequence
-        print("🧠 Inferring segment sequence...")
-        segment_sequence = infer_segment_sequence(segments_result["segments"], df)
-
-        # STEP 4: cleanup stream and legacy fields
-        print("🧹 Preparing activity for storage...")
-        activity = prepare_activity_for_storage(activity, df, segments_result)
-
-        # STEP 5: Add metadata
-        print("🧬 Injecting metadata...")
-        activity.update({
-            "aggregatedFeatures": convert_numpy_types(aggregated),
-            "segments": convert_numpy_types(segments_result["segments"]),
-            "segmentSummary": convert_numpy_types(segments_result["summary"]),
-            "segmentSequence": convert_numpy_types(segment_sequence),  # ✅ new field
-            "enriched": True,
-            "enrichmentVersion": 1.4,
-            "updatedAt": datetime.now(UTC)
-        })
+        # Parsing, segment detection and sequencing run in the worker pool
+        outcome = await run_cpu(enrich_activity_document, activity)
+        if outcome["status"] == "skipped":
+            return {"skipped": True, "reason": outcome["reason"]}
+        activity = outcome["activity"]
 
         # STEP 6: Write to DB
         print("💾 Writing updated activity to MongoDB...")
-        result = collection.update_one({"_id": activity["_id"]}, {"$set": activity})
+        result = await mongo.update_one(ACTIVITIES, {"_id": activity["_id"]}, outcome["update"])
         if result.modified_count == 0:
             print(f"⚠️ MongoDB update failed or document unchanged for stravaId={strava_id}")
         else:
             print(f"✅ MongoDB update complete for stravaId={strava_id}")
 
+        # STEP 7: fold curves into the user's best-of curve
+        curve_update = build_user_curve_update(outcome["meanMaxCurves"])
+        if curve_update:
+            curve_update["$set"]["updatedAt"] = datetime.now(UTC)
+            await mongo.update_one(
+                USER_CURVES,
+                {"userId": request.user_id, "sport": activity.get("type")},
+                curve_update,
+                upsert=True
+            )
+
+        # STEP 8: refresh this activity's entry in the weekly KPI rollup
+        rollup_cleanup = build_rollup_cleanup(activity)
+        if rollup_cleanup:
+            await mongo.update_many(KPI_ROLLUPS, *rollup_cleanup)
+        rollup_update = build_rollup_update(activity)
+        if rollup_update:
+            await mongo.update_one(KPI_ROLLUPS, *rollup_update, upsert=True)
+
+        # Cached trends and predictions for this user are now stale
+        await result_cache.invalidate_user(request.user_id)
+
         return {"success": True, "stravaId": strava_id}
 
+    except asyncio.TimeoutError:
+        print(f"⏱️ Enrichment of stravaId={strava_id} timed out")
+        raise HTTPException(status_code=504, detail="Enrichment timed out")
+    except CpuPoolBusy:
+        print(f"🚦 Enrichment pool busy, rejected stravaId={strava_id}")
+        raise HTTPException(status_code=503, detail="Enrichment pool busy, retry later")
     except Exception as e:
         print(f"❌ ERROR during enrichment of stravaId={strava_id}: {repr(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class BatchEnrichmentRequest(BaseModel):
+    activity_ids: List[str]
+    user_id: str
+    force: bool = False  # re-enrich even when the stored fingerprint still matches
+
+@router.post("/ml/enrich-batch")
+async def enrich_batch(request: BatchEnrichmentRequest):
+    if not request.activity_ids:
+        raise HTTPException(status_code=400, detail="No activity_ids given")
+    if len(request.activity_ids) > ENRICH_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {ENRICH_BATCH_MAX} activities per batch")
+
+    print(f"🚀 Starting batch enrichment of {len(request.activity_ids)} activities for user_id={request.user_id}")
+
+    # Per-activity status, reported back in request order
+    statuses = {}
+    object_ids = []
+    for activity_id in dict.fromkeys(request.activity_ids):
+        try:
+            object_ids.append(ObjectId(activity_id))
+            statuses[activity_id] = {"activity_id": activity_id, "status": "not_found"}
+        except (InvalidId, TypeError):
+            statuses[activity_id] = {"activity_id": activity_id, "status": "error", "reason": "Invalid activity id"}
+
+    try:
+        activities = await mongo.find_all(ACTIVITIES, {"_id": {"$in": object_ids}, "userId": request.user_id})
+
+        # Every activity is enriched in parallel across the worker pool
+        outcomes = await asyncio.gather(
+            *(run_cpu(enrich_activity_document, activity, skip_unchanged=not request.force) for activity in activities),
+            return_exceptions=True
+        )
+
+        writes = []
+        written_ids = []
+        rollup_updates = {}
+        best_curves = {}
+        for activity, outcome in zip(activities, outcomes):
+            activity_id = str(activity["_id"])
+            strava_id = activity.get("stravaId")
+            if isinstance(outcome, Exception):
+                if isinstance(outcome, asyncio.TimeoutError):
+                    reason = "Enrichment timed out"
+                elif isinstance(outcome, CpuPoolBusy):
+                    reason = "Enrichment pool busy, retry later"
+                else:
+                    reason = str(outcome)
+                print(f"❌ ERROR during enrichment of stravaId={strava_id}: {repr(outcome)}")
+                statuses[activity_id] = {"activity_id": activity_id, "stravaId": strava_id, "status": "error", "reason": reason}
+                continue
+
+            if outcome["status"] != "enriched":
+                statuses[activity_id] = {"activity_id": activity_id, "stravaId": strava_id, "status": outcome["status"], "reason": outcome["reason"]}
+                continue
+
+            enriched = outcome["activity"]
+            writes.append(UpdateOne({"_id": enriched["_id"]}, outcome["update"]))
+            written_ids.append(activity_id)
+            statuses[activity_id] = {"activity_id": activity_id, "stravaId": strava_id, "status": "enriched"}
+            rollup_updates[activity_id] = (build_rollup_cleanup(enriched), build_rollup_update(enriched))
+
+            sport = enriched.get("type")
+            best_curves[sport] = merge_mean_max_curves(best_curves.get(sport), outcome["meanMaxCurves"])
+
+        # STEP 6: one unordered round trip for every enriched activity
+        if writes:
+            print(f"💾 Writing {len(writes)} enriched activities to MongoDB...")
+            try:
+                await mongo.bulk_write(ACTIVITIES, writes, ordered=False)
+            except BulkWriteError as bwe:
+                for error in bwe.details.get("writeErrors", []):
+                    activity_id = written_ids[error["index"]]
+                    statuses[activity_id].update({"status": "error", "reason": error.get("errmsg")})
+                print(f"⚠️ {len(bwe.details.get('writeErrors', []))} activity writes failed")
+
+        # STEP 7: one best-of curve update per sport, already merged across the batch
+        curve_writes = []
+        for sport, curves in best_curves.items():
+            curve_update = build_user_curve_update(curves)
+            if curve_update:
+                curve_update["$set"]["updatedAt"] = datetime.now(UTC)
+                curve_writes.append(UpdateOne({"userId": request.user_id, "sport": sport}, curve_update, upsert=True))
+        if curve_writes:
+            await mongo.bulk_write(USER_CURVES, curve_writes, ordered=False)
+
+        # STEP 8: weekly KPI rollup entries for the activities that were written
+        rollup_writes = []
+        for activity_id, (rollup_cleanup, rollup_update) in rollup_updates.items():
+            if statuses[activity_id]["status"] != "enriched":
+                continue
+            if rollup_cleanup:
+                rollup_writes.append(UpdateMany(*rollup_cleanup))
+            if rollup_update:
+                rollup_writes.append(UpdateOne(*rollup_update, upsert=True))
+        if rollup_writes:
+            await mongo.bulk_write(KPI_ROLLUPS, rollup_writes, ordered=False)
+
+        if writes:
+            await result_cache.invalidate_user(request.user_id)
+
+    except Exception as e:
+        print(f"❌ ERROR during batch enrichment for user_id={request.user_id}: {repr(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    results = [statuses[activity_id] for activity_id in dict.fromkeys(request.activity_ids)]
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    print(f"✅ Batch enrichment done: {counts}")
+
+    return {"success": True, "counts": counts, "results": results}
@@ -1,61 +1,54 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
 import pandas as pd
-from typing import Dict
+from collections.abc import Mapping
+from typing import Dict, Optional
+from utils.best_efforts import (
+    BEST_EFFORT_TARGETS,
+    compute_best_effort_curve,
+    best_effort_curve_from_arrays,
+    merge_best_effort_curve,
+    best_efforts_from_curve
+)
+from utils.stream_codec import decode_streams
+from utils.executors import run_db
+from utils import result_cache
+from mongo_utils import get_collection
 
 # ✅ Load environment variables
 load_dotenv()
 
-# ✅ Get MongoDB config from .env
-mongo_url = os.getenv("MONGO_URL")
-db_name = os.getenv("DB_NAME")
-
-if not mongo_url or not mongo_url.startswith("mongodb"):
-    raise RuntimeError(f"❌ Invalid or missing MONGO_URL: {mongo_url}")
-
-client = MongoClient(mongo_url)
-db = client[db_name]
-collection = db["stravaactivities"]
-
 router = APIRouter()
 
+# Documents per cursor batch; bounds how many streams are held in memory at once
+PREDICT_BATCH_SIZE = int(os.getenv("PREDICT_BATCH_SIZE", "20"))
+CURVE_PROJECTION = {"_id": 0, "bestEffortCurve": 1}
+STREAM_PROJECTION = {
+    "_id": 0,
+    "stream_data_full._codec": 1,
+    "stream_data_full.time_sec": 1,
+    "stream_data_full.distance": 1
+}
+
 class PredictRequest(BaseModel):
     user_id: str
 
-def detect_best_efforts(df: pd.DataFrame) -> Dict:
-    best_efforts = {}
-    targets = {
-        "5k": 5000,
-        "10k": 10000,
-        "half_marathon": 21097,
-        "marathon": 42195
-    }
-
-    for name, dist_target in targets.items():
-        best_time = None
-        for i in range(len(df) - 1):
-            for j in range(i + 5, len(df)):
-                dist_diff = df["distance"].iloc[j] - df["distance"].iloc[i]
-                if dist_diff >= dist_target:
-                    time_diff = df["time_sec"].iloc[j] - df["time_sec"].iloc[i]
-                    if not best_time or time_diff < best_time:
-                        best_time = time_diff
-                    break
-        if best_time:
-            best_efforts[name] = {"type": "measured", "time_sec": best_time}
-    return best_efforts
+def stream_best_effort_curve(stream) -> Optional[Dict]:
+    stream = decode_streams(stream)
+    if isinstance(stream, Mapping):
+        if "time_sec" in stream and "distance" in stream:
+            return best_effort_curve_from_arrays(stream["distance"], stream["time_sec"])
+    elif isinstance(stream, list):
+        df = pd.DataFrame(stream)
+        if not df.empty and "time_sec" in df and "distance" in df:
+            return compute_best_effort_curve(df)
+    return None
 
 def estimate_remaining_efforts(known: Dict) -> Dict:
     predictions = known.copy()
-    targets = {
-        "5k": 5000,
-        "10k": 10000,
-        "half_marathon": 21097,
-        "marathon": 42195
-    }
+    targets = BEST_EFFORT_TARGETS
 
     if len(known) == 0:
         return predictions
@@ -71,48 +64,60 @@ def estimate_remaining_efforts(known: Dict) -> Dict:
 
     return predictions
 
-@router.post("/ml/predict-user")
-async def predict_user(payload: PredictRequest):
-    try:
-        docs = collection.find({
-            "userId": payload.user_id,
+def predict_user_sync(user_id: str) -> Dict:
+    collection = get_collection()
+    best = {}
+
+    # ✅ Activities enriched with a best-effort curve: only the small arrays are read
+    curve_docs = collection.find(
+        {"userId": user_id, "bestEffortCurve": {"$exists": True}},
+        CURVE_PROJECTION,
+        batch_size=PREDICT_BATCH_SIZE
+    )
+    for doc in curve_docs:
+        merge_best_effort_curve(best, doc.get("bestEffortCurve"))
+
+    # ⚠️ Not yet re-enriched: stream only time/distance and fold each activity into the running best
+    legacy_docs = collection.find(
+        {
+            "userId": user_id,
+            "bestEffortCurve": {"$exists": False},
             "stream_data_full": {"$exists": True}
-        })
-
-        dfs = []
-        for doc in docs:
-            stream = doc.get("stream_data_full")
-            if isinstance(stream, (dict, list)):
-                df = pd.DataFrame(stream)
-                # Only append if valid structure
-                if not df.empty and "time_sec" in df and "distance" in df:
-                    dfs.append(df)
-
-        # ✅ Filter and check again before concat
-        dfs = [df for df in dfs if not df.empty and "time_sec" in df.columns and "distance" in df.columns]
-
-        if not dfs:
-            return {"error": "No valid stream data found for prediction."}
-
-        full_df = pd.concat(dfs, ignore_index=True).sort_values("time_sec")
-        best_efforts = detect_best_efforts(full_df)
-        predictions = estimate_remaining_efforts(best_efforts)
-
-        readable = {}
-        for k, v in predictions.items():
-            minutes = int(v["time_sec"] // 60)
-            seconds = int(v["time_sec"] % 60)
-            readable[k] = {
-                "type": v["type"],
-                "time_sec": v["time_sec"],
-                "formatted": f"{minutes}m {seconds}s"
-            }
-
-        return {
-            "user_id": payload.user_id,
-            "predictions": readable
+        },
+        STREAM_PROJECTION,
+        batch_size=PREDICT_BATCH_SIZE
+    )
+    for doc in legacy_docs:
+        merge_best_effort_curve(best, stream_best_effort_curve(doc.get("stream_data_full")))
+
+    if not best:
+        return {"error": "No valid stream data found for prediction."}
+
+    best_efforts = best_efforts_from_curve(best)
+    predictions = estimate_remaining_efforts(best_efforts)
+
+    readable = {}
+    for k, v in predictions.items():
+        minutes = int(v["time_sec"] // 60)
+        seconds = int(v["time_sec"] % 60)
+        readable[k] = {
+            "type": v["type"],
+            "time_sec": v["time_sec"],
+            "formatted": f"{minutes}m {seconds}s"
         }
 
+    return {
+        "user_id": user_id,
+        "predictions": readable
+    }
+
+@router.post("/ml/predict-user")
+async def predict_user(payload: PredictRequest):
+    try:
+        # Cursor iteration blocks on Mongo, so the whole fold runs on a DB thread
+        return await result_cache.get_or_compute(
+            "predict-user", payload.user_id, payload.model_dump(),
+            lambda: run_db(predict_user_sync, payload.user_id)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
@@ -1,15 +1,26 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
-import os
-from pymongo import MongoClient
+from dateutil import parser
 from dotenv import load_dotenv
-from utils.segment_kpis import compute_kpi_trends_with_sessions as compute_kpi_trends
+import mongo_utils as mongo
+from mongo_utils import ACTIVITIES, KPI_ROLLUPS, KPI_ROLLUP_STATUS
+from utils.segment_kpis import compute_kpi_trends_with_sessions as compute_kpi_trends, KPI_PROJECTION
+from utils.kpi_rollup import trends_from_rollups, week_key
+from utils.executors import run_cpu
+from utils import result_cache
 
+from datetime import timedelta
 import math
+import os
 
 load_dotenv()
 
+TRENDS_MAX_TIME_MS = int(os.getenv("TRENDS_MAX_TIME_MS", 5000))
+TRENDS_BATCH_SIZE = 500
+# Serve trends from the weekly rollups of users whose rollups were rebuilt (see scripts/rebuild_kpi_rollups.py)
+USE_KPI_ROLLUPS = os.getenv("USE_KPI_ROLLUPS", "true").lower() == "true"
+
 router = APIRouter()
 
 class TrendAnalysisRequest(BaseModel):
@@ -18,11 +29,6 @@ class TrendAnalysisRequest(BaseModel):
     start_date: Optional[str] = None
     end_date: Optional[str] = None
 
-# Connect to MongoDB
-client = MongoClient(os.getenv("MONGO_URL"))
-db = client[os.getenv("DB_NAME", "test")]
-collection = db["stravaactivities"]
-
 def clean_nan_values(data):
     if isinstance(data, dict):
         return {k: clean_nan_values(v) for k, v in data.items()}
@@ -32,26 +38,97 @@ def clean_nan_values(data):
         return None
     return data
 
-@router.post("/ml/analyze-trends")
-async def analyze_trends(request: TrendAnalysisRequest):
+def build_trends_query(request: TrendAnalysisRequest) -> dict:
     query = {
         "userId": request.user_id,
         "segments": {"$exists": True, "$ne": []}
     }
     if request.activity_type:
         query["type"] = request.activity_type
+    # startDate is stored as a BSON date
+    date_range = {}
+    if request.start_date:
+        date_range["$gte"] = parser.parse(request.start_date)
+    if request.end_date:
+        date_range["$lte"] = parser.parse(request.end_date)
+    if date_range:
+        query["startDate"] = date_range
+    return query
+
+async def kpi_trends_for_query(query: dict, **kwargs):
+    """
+    Reads the projected activities on the DB pool and computes their KPI trends in
+    the worker pool, which never touches Mongo. Returns (activities read, trends).
+    """
+    activities = await mongo.find_all(
+        ACTIVITIES, query, KPI_PROJECTION, batch_size=TRENDS_BATCH_SIZE, max_time_ms=TRENDS_MAX_TIME_MS
+    )
+    trends = await run_cpu(compute_kpi_trends, activities, **kwargs)
+    return len(activities), trends
 
-    activities = list(collection.find(query, max_time_ms=5000))
+async def kpi_trends_from_rollups(query: dict, start_date=None, end_date=None, activity_type=None):
+    """
+    Sums the user's weekly rollup entries and recomputes only the partial first and
+    last week of a date range from raw activities; the sums run in the worker pool.
+    Returns (activities used, trends), or None unless rebuild_kpi_rollups.py has
+    completed for this user, since rollups before that may be missing weeks.
+    """
+    if not await mongo.find_one(KPI_ROLLUP_STATUS, {"_id": query["userId"], "complete": True}, {"_id": 1}):
+        return None
+    rollup_query = {"userId": query["userId"]}
+    if activity_type:
+        rollup_query["sport"] = activity_type
 
-    if not activities:
-        raise HTTPException(status_code=404, detail="No activities with segments found for this user.")
+    start = parser.parse(start_date) if start_date else None
+    end = parser.parse(end_date) if end_date else None
+    boundary_weeks = {week_key(date) for date in (start, end) if date}
+    week_range = {}
+    if start:
+        week_range["$gte"] = week_key(start)
+    if end:
+        week_range["$lte"] = week_key(end)
+    if week_range:
+        rollup_query["week"] = week_range
 
-    trends = compute_kpi_trends(
-        activities,
-        start_date=request.start_date,
-        end_date=request.end_date,
-        activity_type=request.activity_type
+    rollup_docs = await mongo.find_all(KPI_ROLLUPS, rollup_query, {"week": 1, "activities": 1}, max_time_ms=TRENDS_MAX_TIME_MS)
+
+    boundary_activities = []
+    if boundary_weeks:
+        # A week is at most 7 days, so these windows cover both partial weeks
+        week = timedelta(days=7)
+        windows = []
+        if start:
+            windows.append({"$gte": start, "$lte": min(end, start + week) if end else start + week})
+        if end:
+            windows.append({"$gte": max(start, end - week) if start else end - week, "$lte": end})
+        raw_query = {**query, "$or": [{"startDate": window} for window in windows]}
+        boundary_activities = await mongo.find_all(
+            ACTIVITIES, raw_query, KPI_PROJECTION, batch_size=TRENDS_BATCH_SIZE, max_time_ms=TRENDS_MAX_TIME_MS
+        )
+
+    return await run_cpu(trends_from_rollups, rollup_docs, boundary_activities, boundary_weeks)
+
+@router.post("/ml/analyze-trends")
+async def analyze_trends(request: TrendAnalysisRequest):
+    # Dashboards repeat identical requests; results only change when the user's data version does
+    return await result_cache.get_or_compute(
+        "analyze-trends", request.user_id, request.model_dump(), lambda: compute_trends_response(request)
     )
 
+async def compute_trends_response(request: TrendAnalysisRequest):
+    query = build_trends_query(request)
+    kwargs = {"start_date": request.start_date, "end_date": request.end_date, "activity_type": request.activity_type}
+
+    outcome = await kpi_trends_from_rollups(query, **kwargs) if USE_KPI_ROLLUPS else None
+    if outcome is None:
+        outcome = await kpi_trends_for_query(query, **kwargs)
+    read, trends = outcome
+
+    if not read:
+        # Keep the 404 for users without any segmented activities; an empty date range is just empty
+        query.pop("startDate", None)
+        if not await mongo.find_one(ACTIVITIES, query, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="No activities with segments found for this user.")
+
     # ✅ FINAL FIX: align with frontend expectation
     return {"version": "v1", "data": clean_nan_values(trends)}
@@ -4,17 +4,12 @@ import json
 from pathlib import Path
 from fitparse import FitFile
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from utils.fit_engine.fit_parser import parse_fit_schedule
 from utils.fit_engine.fit_matcher import match_fit_file_to_activity
 
 # Load Mongo credentials
 load_dotenv()
 USER_ID = os.getenv("FIT_MATCH_USER_ID")
-MONGO_URL = os.getenv("MONGO_URL")
-DB_NAME = os.getenv("DB_NAME", "test")
-client = MongoClient(MONGO_URL)
-collection = client[DB_NAME]["stravaactivities"]
 
 def format_block(block):
     result = {
@@ -53,10 +48,9 @@ def analyze_fit_folder(folder_path: str, output_path: str):
                 print(f"❌ No matching activity found for {fit_path.name}")
                 continue
 
-            # Trim .0 from stravaId and get startDate from Mongo
+            # Trim .0 from stravaId; the matched activity (cached or from Mongo) already carries startDate
             strava_id_clean = str(int(float(activity["stravaId"])))
-            mongo_doc = collection.find_one({"stravaId": activity["stravaId"]})
-            start_date_local = mongo_doc.get("startDate").isoformat() if mongo_doc and mongo_doc.get("startDate") else None
+            start_date_local = activity.get("startDate").isoformat() if activity.get("startDate") else None
 
             formatted = {
                 "stravaId": strava_id_clean,
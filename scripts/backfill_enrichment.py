@@ -0,0 +1,334 @@
+"""
+Offline backfill: re-enriches every stored activity without going through the API.
+
+The _id space is split into shards with $bucketAuto and each shard is processed
+in its own worker process, in _id order, writing enriched documents and user
+curve updates with unordered bulk_writes. After every batch the shard's last
+_id is written to <checkpoint-dir>/shard-NN.json, so re-running the same
+command after a crash or Ctrl-C resumes each shard where it stopped. Activities
+that failed to enrich or write are listed in the checkpoint and retried on the
+next run, even for shards that already finished.
+
+    python -m scripts.backfill_enrichment --workers 4
+    python -m scripts.backfill_enrichment --user <userId> --force --restart
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, UTC
+from pathlib import Path
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from mongo_utils import get_collection, ACTIVITIES, USER_CURVES, KPI_ROLLUPS
+from utils.enrichment_helpers import build_user_curve_update, merge_mean_max_curves
+from utils.enrichment_pipeline import enrich_activity_document
+from utils.kpi_rollup import build_rollup_cleanup, build_rollup_update
+from utils import result_cache
+from utils.stream_codec import CODEC_KEY
+
+load_dotenv()
+
+DEFAULT_CHECKPOINT_DIR = ".backfill"
+PROGRESS_INTERVAL_SEC = 5
+
+
+def build_query(user_id=None):
+    query = {"stream_data_full": {"$exists": True}, "type": {"$ne": "WeightTraining"}}
+    if user_id:
+        query["userId"] = user_id
+    return query
+
+
+def shard_query(query, shard, after_id=None):
+    id_range = {}
+    if after_id:
+        id_range["$gt"] = ObjectId(after_id)
+    elif shard["min"]:
+        id_range["$gte"] = ObjectId(shard["min"])
+    if shard["max"]:
+        id_range["$lt"] = ObjectId(shard["max"])
+    return {**query, "_id": id_range} if id_range else dict(query)
+
+
+def plan_shards(collection, query, shards):
+    """Splits matching _ids into roughly equal [min, max) ranges; the last range is open-ended."""
+    buckets = list(collection.aggregate([
+        {"$match": query},
+        {"$bucketAuto": {"groupBy": "$_id", "buckets": shards}},
+    ]))
+    bounds = [str(b["_id"]["min"]) for b in buckets]
+    return [
+        {"index": i, "min": lo, "max": bounds[i + 1] if i + 1 < len(bounds) else None}
+        for i, lo in enumerate(bounds)
+    ]
+
+
+# Checkpoint files
+
+def checkpoint_path(checkpoint_dir, index):
+    return Path(checkpoint_dir) / f"shard-{index:02d}.json"
+
+
+def read_json(path):
+    return json.loads(path.read_text()) if path.exists() else None
+
+
+def write_json(path, data):
+    """Atomic replace, so a killed process never leaves a half-written checkpoint."""
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def load_plan(checkpoint_dir, collection, query, args):
+    plan_path = Path(checkpoint_dir) / "plan.json"
+    signature = {"query": json.dumps(query, sort_keys=True, default=str), "force": args.force}
+
+    if args.restart and Path(checkpoint_dir).exists():
+        shutil.rmtree(checkpoint_dir)
+    plan = read_json(plan_path)
+    if plan and plan["signature"] == signature:
+        print(f"♻️ Resuming backfill from {checkpoint_dir}")
+        return plan["shards"]
+    if plan:
+        raise SystemExit(f"❌ {checkpoint_dir} belongs to a run with different options; pass --restart to discard it")
+
+    Path(checkpoint_dir).mkdir(parents=True, exist_ok=True)
+    shards = plan_shards(collection, query, args.shards or args.workers * 4)
+    write_json(plan_path, {"signature": signature, "shards": shards, "createdAt": datetime.now(UTC).isoformat()})
+    return shards
+
+
+# Worker side
+
+def flush(collections, ops, op_ids, rollup_updates, best_curves):
+    """Writes one batch; returns the indexes of the activity writes that failed."""
+    collection, curves_collection, rollups_collection = collections
+    failed_indexes = set()
+    if ops:
+        try:
+            collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as bwe:
+            for error in bwe.details.get("writeErrors", []):
+                failed_indexes.add(error["index"])
+                print(f"❌ Write failed for {op_ids[error['index']]}: {error.get('errmsg')}")
+
+    curve_writes = []
+    for (user_id, sport), curves in best_curves.items():
+        curve_update = build_user_curve_update(curves)
+        if curve_update:
+            curve_update["$set"]["updatedAt"] = datetime.now(UTC)
+            curve_writes.append(UpdateOne({"userId": user_id, "sport": sport}, curve_update, upsert=True))
+    if curve_writes:
+        curves_collection.bulk_write(curve_writes, ordered=False)
+
+    rollup_writes = []
+    for i, (rollup_cleanup, rollup_update) in enumerate(rollup_updates):
+        if i in failed_indexes:
+            continue
+        if rollup_cleanup:
+            rollup_writes.append(UpdateMany(*rollup_cleanup))
+        if rollup_update:
+            rollup_writes.append(UpdateOne(*rollup_update, upsert=True))
+    if rollup_writes:
+        rollups_collection.bulk_write(rollup_writes, ordered=False)
+
+    # Invalidates cached API results; only a Mongo-backed cache is shared with the API
+    if result_cache.RESULT_CACHE_BACKEND == "mongo":
+        for user_id in {user_id for user_id, _ in best_curves}:
+            result_cache.bump_user_version(user_id)
+    return failed_indexes
+
+
+def process_shard(shard, query, checkpoint_dir, batch_size, force, verbose, progress):
+    """
+    Enriches one shard in _id order, checkpointing after every bulk_write.
+    Activities whose enrichment or write failed are kept in the checkpoint's
+    failed_ids and retried first the next time the shard is run.
+    """
+    collections = (get_collection(ACTIVITIES), get_collection(USER_CURVES), get_collection(KPI_ROLLUPS))
+    collection = collections[0]
+    path = checkpoint_path(checkpoint_dir, shard["index"])
+    state = read_json(path) or {"last_id": None, "done": False, "enriched": 0, "unchanged": 0, "skipped": 0, "failed": 0}
+    retry_ids = state.get("failed_ids", [])
+    if state["done"] and not retry_ids:
+        return state
+
+    sources = []
+    if retry_ids:
+        print(f"🔁 Shard {shard['index']}: retrying {len(retry_ids)} failed activities")
+        retry_query = {**query, "_id": {"$in": [ObjectId(i) for i in retry_ids]}}
+        sources.append((collection.find(retry_query, batch_size=batch_size).sort("_id", 1), False))
+    if not state["done"]:
+        sources.append((collection.find(shard_query(query, shard, state["last_id"]), batch_size=batch_size).sort("_id", 1), True))
+
+    # Ids stay here until their write succeeds, so a crash never loses a pending retry
+    failed_ids = dict.fromkeys(retry_ids)
+    ops, op_ids, rollup_updates, best_curves = [], [], [], {}
+    seen = samples = 0
+    last_id = state["last_id"]
+
+    def commit_batch():
+        nonlocal ops, op_ids, rollup_updates, best_curves, seen, samples
+        failed = flush(collections, ops, op_ids, rollup_updates, best_curves)
+        for i, activity_id in enumerate(op_ids):
+            if i in failed:
+                failed_ids[activity_id] = None
+            else:
+                failed_ids.pop(activity_id, None)
+        state.update(
+            last_id=last_id,
+            enriched=state["enriched"] + len(ops) - len(failed),
+            failed=len(failed_ids),
+            failed_ids=list(failed_ids),
+        )
+        write_json(path, state)
+        progress.put((shard["index"], seen, samples))
+        ops, op_ids, rollup_updates, best_curves = [], [], [], {}
+        seen = samples = 0
+
+    for cursor, advances in sources:
+        retried = set()
+        for doc in cursor:
+            activity_id = str(doc["_id"])
+            if advances:
+                last_id = activity_id
+            else:
+                retried.add(activity_id)
+            seen += 1
+            try:
+                if verbose:
+                    outcome = enrich_activity_document(doc, skip_unchanged=not force)
+                else:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        outcome = enrich_activity_document(doc, skip_unchanged=not force)
+            except Exception as e:
+                print(f"❌ Enrichment failed for {activity_id}: {e}")
+                failed_ids[activity_id] = None
+                outcome = None
+
+            if outcome and outcome["status"] == "enriched":
+                enriched = outcome["activity"]
+                samples += enriched["stream_data_full"][CODEC_KEY].get("length", 0)
+                ops.append(UpdateOne({"_id": enriched["_id"]}, outcome["update"]))
+                op_ids.append(activity_id)
+                rollup_updates.append((build_rollup_cleanup(enriched), build_rollup_update(enriched)))
+                key = (enriched.get("userId"), enriched.get("type"))
+                best_curves[key] = merge_mean_max_curves(best_curves.get(key), outcome["meanMaxCurves"])
+            elif outcome:
+                state[outcome["status"]] += 1
+                failed_ids.pop(activity_id, None)
+
+            if seen >= batch_size:
+                commit_batch()
+
+        if not advances:
+            # Failed activities that were deleted or no longer match the query are dropped
+            for activity_id in set(retry_ids) - retried:
+                failed_ids.pop(activity_id, None)
+
+    state["done"] = True
+    commit_batch()
+    return state
+
+
+# Parent side
+
+def format_eta(seconds):
+    if seconds is None:
+        return "?"
+    minutes, sec = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{sec:02d}s"
+
+
+def backfill(args):
+    collection = get_collection(ACTIVITIES)
+    query = build_query(args.user)
+    shards = load_plan(args.checkpoint_dir, collection, query, args)
+
+    pending = []
+    remaining = 0
+    for shard in shards:
+        state = read_json(checkpoint_path(args.checkpoint_dir, shard["index"]))
+        retries = len(state.get("failed_ids", [])) if state else 0
+        if state and state["done"] and not retries:
+            continue
+        pending.append(shard)
+        remaining += retries
+        if not (state and state["done"]):
+            remaining += collection.count_documents(shard_query(query, shard, state and state["last_id"]))
+
+    print(f"🔁 Backfilling {remaining} activities in {len(pending)}/{len(shards)} shards with {args.workers} workers...")
+    if not pending:
+        return
+
+    manager = multiprocessing.get_context("spawn").Manager()
+    progress = manager.Queue()
+    processed = samples = 0
+    started = last_report = time.monotonic()
+
+    def report():
+        elapsed = max(time.monotonic() - started, 1e-9)
+        rate = processed / elapsed
+        eta = (remaining - processed) / rate if rate else None
+        print(
+            f"⏱ [{processed}/{remaining}] {processed / max(remaining, 1):.1%} | "
+            f"{rate:.1f} activities/s | {samples / elapsed:,.0f} samples/s | ETA {format_eta(eta)}"
+        )
+
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {
+            pool.submit(process_shard, shard, query, args.checkpoint_dir, args.batch_size, args.force, args.verbose, progress): shard
+            for shard in pending
+        }
+        not_done = set(futures)
+        while not_done:
+            done, not_done = wait(not_done, timeout=1, return_when=FIRST_COMPLETED)
+            while True:
+                try:
+                    _, seen, batch_samples = progress.get_nowait()
+                except queue.Empty:
+                    break
+                processed += seen
+                samples += batch_samples
+            for future in done:
+                shard = futures[future]
+                try:
+                    state = future.result()
+                    print(f"✅ Shard {shard['index']} finished: {state['enriched']} enriched, "
+                          f"{state['unchanged']} unchanged, {state['skipped']} skipped, {state['failed']} failed")
+                except Exception as e:
+                    print(f"❌ Shard {shard['index']} stopped: {e} (re-run to resume it)")
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL_SEC or not not_done:
+                report()
+                last_report = time.monotonic()
+
+    manager.shutdown()
+    print(f"✅ Backfill finished in {format_eta(time.monotonic() - started)}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel, resumable offline re-enrichment of stored activities")
+    parser.add_argument("--user", type=str, help="User ID to filter activities")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="Worker processes")
+    parser.add_argument("--shards", type=int, help="Number of _id shards (default: 4 per worker)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Documents per bulk_write and checkpoint")
+    parser.add_argument("--checkpoint-dir", type=str, default=DEFAULT_CHECKPOINT_DIR, help="Where shard checkpoints are kept")
+    parser.add_argument("--restart", action="store_true", help="Discard existing checkpoints and start over")
+    parser.add_argument("--force", action="store_true", help="Re-enrich even when the fingerprint is unchanged")
+    parser.add_argument("--verbose", action="store_true", help="Keep the per-activity pipeline logs")
+    args = parser.parse_args()
+
+    backfill(args)
@@ -0,0 +1,245 @@
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import pickle
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from utils.enrichment_helpers import parse_streams, detect_segments
+from utils.enrichment_pipeline import MIN_STREAM_ROWS, SEQUENCER_MODE
+from utils.fit_engine.fit_parser import read_fit_file
+from utils.fit_engine.segment_aligner import align_blocks, exact_type_cost, compatible_type_cost
+from utils.segment_sequencer import infer_segment_sequence
+
+# Offline evaluation of segment detection rules.
+#
+# The corpus is every .fit file under --folder: its workout_step messages are the
+# planned blocks, its record messages the streams the detectors run on. Decoding
+# FIT files is by far the slowest step, so the parsed corpus is cached in
+# --cache and only new or modified files are decoded again. Each evaluation then
+# runs detect_segments -> infer_segment_sequence -> align_blocks for every file
+# with a plan, across a process pool, without touching Mongo.
+
+DEFAULT_CACHE = ".rule_eval/corpus.pkl"
+
+
+def file_signature(path):
+    stat = path.stat()
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def parse_fit_entry(path):
+    fit = read_fit_file(path, records=True)
+    return {"planned_blocks": fit["planned_blocks"], "streams": fit["streams"]}
+
+
+def _parse_job(job):
+    key, path = job
+    try:
+        return key, parse_fit_entry(Path(path)), None
+    except Exception as e:
+        return key, None, repr(e)
+
+
+def load_corpus(fit_folder, cache_path=DEFAULT_CACHE, workers=None):
+    """{relative path: entry} for every .fit file, decoding only files not already in the cache."""
+    cache_path = Path(cache_path)
+    cached = {}
+    if cache_path.exists():
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+
+    corpus, jobs = {}, []
+    signatures = {}
+    for path in sorted(Path(fit_folder).rglob("*.fit")):
+        key = str(path.relative_to(fit_folder))
+        signatures[key] = file_signature(path)
+        entry = cached.get(key)
+        if entry and entry["signature"] == signatures[key]:
+            corpus[key] = entry
+        else:
+            jobs.append((key, str(path)))
+
+    if jobs:
+        print(f"📦 Decoding {len(jobs)} new or modified .fit file(s)...")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+            for key, entry, error in pool.map(_parse_job, jobs, chunksize=4):
+                if error:
+                    print(f"❌ Failed to parse {key}: {error}")
+                    continue
+                entry["signature"] = signatures[key]
+                corpus[key] = entry
+        corpus = dict(sorted(corpus.items()))
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(corpus, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+
+    return with_sports(corpus)
+
+
+def with_sports(corpus):
+    # fit_data/<sport>/..., however deeply the files are nested
+    for key, entry in corpus.items():
+        entry["sport"] = Path(key).parts[0]
+    return corpus
+
+
+def load_rules(path):
+    """rules_by_sport from a .json file (bare or under "rules_by_sport") or a .py module like segment_detection_rules."""
+    if path is None:
+        return None
+    path = Path(path)
+    if path.suffix == ".json":
+        with open(path) as f:
+            rules = json.load(f)
+        return rules.get("rules_by_sport", rules)
+    spec = importlib.util.spec_from_file_location("candidate_rules", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.rules_by_sport
+
+
+# Worker state: set once per process by init_worker
+_corpus = None
+_options = None
+
+
+def init_worker(cache_path, options):
+    global _corpus, _options
+    with open(cache_path, "rb") as f:
+        _corpus = with_sports(pickle.load(f))
+    _options = options
+
+
+def evaluate_entry(entry, rules=None, sequencer_mode=SEQUENCER_MODE, type_cost=exact_type_cost):
+    """Alignment rows and cost of one corpus entry under `rules`; no segments when the stream is too short."""
+    activity = {"type": entry["sport"], "stream_data_full": entry["streams"]}
+    df = parse_streams(activity)
+    sequence = []
+    if not df.empty and df.shape[0] >= MIN_STREAM_ROWS:
+        segments = detect_segments(df, activity, rules=rules)["segments"]
+        sequence = infer_segment_sequence(segments, df, mode=sequencer_mode)
+    return align_blocks(entry["planned_blocks"], sequence, type_cost=type_cost)
+
+
+def evaluate_keys(keys):
+    type_cost = compatible_type_cost if _options["compatible_types"] else exact_type_cost
+    results = []
+    for key in keys:
+        entry = _corpus[key]
+        try:
+            # The pipeline logs every step; keep the workers quiet
+            with contextlib.redirect_stdout(io.StringIO()):
+                aligned = evaluate_entry(entry, _options["rules"], _options["sequencer_mode"], type_cost)
+            results.append((key, entry["sport"], aligned, None))
+        except Exception as e:
+            results.append((key, entry["sport"], None, repr(e)))
+    return results
+
+
+def summarize(rows):
+    matched = [r for r in rows if r["matched"]]
+    return {
+        "planned": len(rows),
+        "matched": len(matched),
+        "match_rate": round(len(matched) / len(rows), 4) if rows else 0,
+        "avg_iou": round(sum(r["match_iou"] for r in matched) / len(matched), 4) if matched else 0,
+    }
+
+
+def build_report(results):
+    rows, by_sport, by_type = [], defaultdict(list), defaultdict(list)
+    costs, failures = [], []
+    for key, sport, aligned, error in results:
+        if error:
+            failures.append({"file": key, "error": error})
+            continue
+        costs.append(aligned["cost"])
+        for row in aligned["alignment"]:
+            rows.append(row)
+            by_sport[sport].append(row)
+            by_type[row["planned_type"]].append(row)
+    return {
+        "files": len(costs),
+        "overall": {**summarize(rows), "avg_cost": round(sum(costs) / len(costs), 4) if costs else 0},
+        "by_sport": {sport: summarize(r) for sport, r in sorted(by_sport.items())},
+        "by_planned_type": {t: summarize(r) for t, r in sorted(by_type.items())},
+        "failures": failures,
+    }
+
+
+def evaluate_rules(corpus, cache_path=DEFAULT_CACHE, rules=None, workers=None,
+                   sequencer_mode=SEQUENCER_MODE, compatible_types=False, chunk_size=4):
+    """Scores a candidate rule set (None = rules_by_sport) on every corpus entry with planned blocks."""
+    keys = [key for key, entry in corpus.items() if entry["planned_blocks"]]
+    chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+    options = {"rules": rules, "sequencer_mode": sequencer_mode, "compatible_types": compatible_types}
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context("spawn"),
+        initializer=init_worker,
+        initargs=(str(cache_path), options),
+    ) as pool:
+        # map keeps chunk order, so reports are identical across runs
+        for chunk_results in pool.map(evaluate_keys, chunks):
+            results.extend(chunk_results)
+    return build_report(results)
+
+
+def print_report(report):
+    def line(label, stats):
+        print(f"  {label:<18} {stats['matched']:>4}/{stats['planned']:<4} match_rate {stats['match_rate']:.3f}  avg_iou {stats['avg_iou']:.3f}")
+
+    overall = report["overall"]
+    print(f"\n📊 {report['files']} files | avg alignment cost {overall['avg_cost']:.3f}")
+    line("overall", overall)
+    print("🏷️ By sport")
+    for sport, stats in report["by_sport"].items():
+        line(sport, stats)
+    print("🧩 By planned block type")
+    for block_type, stats in report["by_planned_type"].items():
+        line(block_type, stats)
+    for failure in report["failures"]:
+        print(f"❌ {failure['file']}: {failure['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate segment detection rules against the planned blocks of every .fit file, offline")
+    parser.add_argument("--folder", type=str, default="fit_data", help="Path to folder with .fit files")
+    parser.add_argument("--rules", type=str, help="Candidate rules (.py defining rules_by_sport, or .json); defaults to utils/segment_detection_rules.py")
+    parser.add_argument("--cache", type=str, default=DEFAULT_CACHE, help="Parsed corpus cache file")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--sequencer-mode", choices=["greedy", "optimal"], default=SEQUENCER_MODE, help="Segment sequencing mode")
+    parser.add_argument("--compatible-types", action="store_true", help="Let planned block types match related detected types")
+    parser.add_argument("--output", type=str, help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    corpus = load_corpus(args.folder, args.cache, args.workers)
+    loaded = time.perf_counter()
+    print(f"📂 {len(corpus)} corpus entries ({sum(1 for e in corpus.values() if e['planned_blocks'])} with planned blocks) in {loaded - started:.1f}s")
+
+    report = evaluate_rules(
+        corpus,
+        cache_path=args.cache,
+        rules=load_rules(args.rules),
+        workers=args.workers,
+        sequencer_mode=args.sequencer_mode,
+        compatible_types=args.compatible_types,
+    )
+    print_report(report)
+    print(f"\n⏱️ Evaluated in {time.perf_counter() - loaded:.1f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report saved to: {args.output}")
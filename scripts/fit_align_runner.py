@@ -1,37 +1,99 @@
+"""
+Aligns the planned workout of every .fit file with the segmentSequence of the
+matching activity.
+
+Each file is decoded once (fit_parser.read_fit_file) and handled end to end -
+match, forced re-enrichment, alignment - in a worker process. Results come back
+in input order and go through one buffered writer, so the output file is the
+same whatever the number of workers; every file ends up aligned, skipped (with a
+reason) or failed (with the error).
+
+    python -m scripts.fit_align_runner --workers 4
+"""
 import os
 import argparse
-from pathlib import Path
-from fitparse import FitFile
+import contextlib
+import io
 import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+from pathlib import Path
 from dotenv import load_dotenv
-from bson import ObjectId
-from datetime import datetime
-from pymongo import MongoClient
-
-from utils.fit_engine.fit_parser import parse_fit_schedule
-from utils.fit_engine.fit_matcher import match_fit_file_to_activity
-from utils.fit_engine.segment_aligner import align_planned_to_detected, score_segment_accuracy
-from utils.enrichment_helpers import (
-    parse_streams,
-    detect_segments,
-    prepare_activity_for_storage,
-    extract_aggregated_features,
-    convert_numpy_types,
+
+from utils.fit_engine.fit_parser import read_fit_file
+from utils.fit_engine.fit_matcher import match_fit_to_activity
+from utils.fit_engine.segment_aligner import (
+    align_blocks,
+    score_segment_accuracy,
+    exact_type_cost,
+    compatible_type_cost,
 )
-from scripts.rerun_enrichment import enrich_activity_by_id
 
 
 # Load Mongo credentials
 load_dotenv()
 USER_ID = os.getenv("FIT_MATCH_USER_ID")
-MONGO_URL = os.getenv("MONGO_URL")
-DB_NAME = os.getenv("DB_NAME", "test")
-client = MongoClient(MONGO_URL)
-collection = client[DB_NAME]["stravaactivities"]
-
-def run_fit_alignment(fit_folder: str, output_path: str = "fit_alignment_results.jsonl"):
-    fit_files = list(Path(fit_folder).rglob("*.fit")) #=> process all
-    #fit_files = list(Path(fit_folder).rglob("*.fit"))[:10]
+# Output is flushed in blocks of this size rather than reopened per entry
+WRITE_BUFFER_BYTES = 1 << 20
+
+
+def align_fit_file(fit_path: str, sport_type: str, user_id: str, compatible_types: bool = False) -> dict:
+    """Outcome for one file: {"file", "status": aligned|skipped, "reason" or "entry"}."""
+    # Imported here: rerun_enrichment connects to Mongo at import time, which only the workers need
+    from scripts.rerun_enrichment import enrich_activity_by_id
+
+    fit = read_fit_file(fit_path)
+    planned_blocks = fit["planned_blocks"]
+
+    activity = match_fit_to_activity(fit["start_time"], fit["sport"], user_id=user_id, fallback_sport=sport_type)
+    if not activity:
+        return {"file": fit_path, "status": "skipped", "reason": "No activity match found"}
+
+    # ✅ Force re-enrichment for all activities
+    print(f"🔁 Forcing enrichment for stravaId={activity.get('stravaId')}...")
+    activity = enrich_activity_by_id(str(activity["_id"]), force=True)
+    if not activity or not activity.get("segments"):
+        return {"file": fit_path, "status": "skipped", "reason": "Enrichment failed or returned no segments"}
+
+    actual_blocks = activity.get("segmentSequence", [])
+    all_segments = activity.get("segments", [])
+    if not actual_blocks:
+        return {"file": fit_path, "status": "skipped", "reason": "No segmentSequence found even after enrichment"}
+
+    type_cost = compatible_type_cost if compatible_types else exact_type_cost
+    aligned = align_blocks(planned_blocks, actual_blocks, type_cost=type_cost)
+    alignment = aligned["alignment"]
+
+    entry = {
+        "file": fit_path,
+        "sport_type": sport_type,
+        "stravaId": activity.get("stravaId"),
+        "planned_blocks": planned_blocks,
+        "matched_segments": actual_blocks,
+        "raw_segments": all_segments,
+        "alignment": alignment,
+        "alignment_cost": aligned["cost"],
+        "score": score_segment_accuracy(alignment),
+    }
+    return {"file": fit_path, "status": "aligned", "entry": entry}
+
+
+def process_fit_file(fit_path: str, sport_type: str, user_id: str, compatible_types: bool, verbose: bool) -> dict:
+    """Worker entry point: never raises, so one bad file cannot stop the run."""
+    try:
+        if verbose:
+            return align_fit_file(fit_path, sport_type, user_id, compatible_types)
+        # The matcher and the enrichment pipeline log every step; keep the workers quiet
+        with contextlib.redirect_stdout(io.StringIO()):
+            return align_fit_file(fit_path, sport_type, user_id, compatible_types)
+    except Exception as e:
+        return {"file": fit_path, "status": "failed", "reason": repr(e)}
+
+
+def run_fit_alignment(fit_folder: str, output_path: str = "fit_alignment_results.jsonl", compatible_types: bool = False,
+                      workers: int = None, verbose: bool = False):
+    fit_files = sorted(Path(fit_folder).rglob("*.fit"))  # Sorted, so every run writes the same order
     total = len(fit_files)
     print(f"🔍 Found {total} .fit file(s) in {fit_folder}")
 
@@ -39,64 +101,38 @@ def run_fit_alignment(fit_folder: str, output_path: str = "fit_alignment_results
         print("❌ No .fit files found.")
         return
 
-    results = []
-    for i, fit_path in enumerate(fit_files):
-        sport_from_folder = fit_path.parent.name
-        print(f"\n[{i+1}/{total}] 📂 Processing {fit_path.name} (sport: {sport_from_folder})")
-
-        try:
-            fitfile = FitFile(str(fit_path))
-            planned_blocks = parse_fit_schedule(str(fit_path))
-
-            sport_type = sport_from_folder
-            print(f"🏷️ Detected sport type from folder: {sport_type}")
-
-            if not USER_ID:
-                raise ValueError("❌ FIT_MATCH_USER_ID not set in your .env file")
-
-            activity = match_fit_file_to_activity(fitfile, user_id=USER_ID, fallback_sport=sport_type)
-            if not activity:
-                print(f"❌ No activity match found for {fit_path.name}")
-                continue
-
-            # ✅ Force re-enrichment for all activities
-            print(f"🔁 Forcing enrichment for stravaId={activity.get('stravaId')}...")
-            activity = enrich_activity_by_id(str(activity["_id"]))
-            if not activity or not activity.get("segments"):
-                print(f"❌ Enrichment failed or returned no segments for {activity.get('stravaId')}")
-                continue
-
-            actual_blocks = activity.get("segmentSequence", [])
-            all_segments = activity.get("segments", [])
-
-            if not actual_blocks:
-                print(f"⚠️ No segmentSequence found even after enrichment.")
-                continue
-
-            alignment = align_planned_to_detected(planned_blocks, actual_blocks)
-            metrics = score_segment_accuracy(alignment)
-
-            entry = {
-                "file": str(fit_path),
-                "sport_type": sport_type,
-                "stravaId": activity.get("stravaId"),
-                "planned_blocks": planned_blocks,
-                "matched_segments": actual_blocks,
-                "raw_segments": all_segments,
-                "alignment": alignment,
-                "score": metrics,
-            }
-
-            results.append(entry)
-
-            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-            with open(output_path, "a") as out:
+    if not USER_ID:
+        raise ValueError("❌ FIT_MATCH_USER_ID not set in your .env file")
+
+    # fit_data/<sport>/..., however deeply the files are nested
+    sports = [path.relative_to(fit_folder).parts[0] for path in fit_files]
+    worker = partial(process_fit_file, user_id=USER_ID, compatible_types=compatible_types, verbose=verbose)
+
+    results, skipped, failed = [], [], []
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    # Each run rewrites the file, so a rerun never duplicates entries
+    with open(output_path, "w", buffering=WRITE_BUFFER_BYTES) as out, ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_context("spawn")
+    ) as pool:
+        # map yields in submission order while the pool works ahead
+        for i, outcome in enumerate(pool.map(worker, [str(p) for p in fit_files], sports)):
+            name = Path(outcome["file"]).name
+            if outcome["status"] == "aligned":
+                entry = outcome["entry"]
+                results.append(entry)
                 out.write(json.dumps(entry) + "\n")
-
-        except Exception as e:
-            print(f"❌ Error processing {fit_path.name}: {e}")
-
-    print("\n✅ Alignment complete.")
+                score = entry["score"]
+                print(f"[{i+1}/{total}] ✅ {name} ({sports[i]}): matched {score['matched']}/{score['planned_total']}")
+            elif outcome["status"] == "skipped":
+                skipped.append(outcome)
+                print(f"[{i+1}/{total}] ⏭ {name} ({sports[i]}): {outcome['reason']}")
+            else:
+                failed.append(outcome)
+                print(f"[{i+1}/{total}] ❌ {name} ({sports[i]}): {outcome['reason']}")
+
+    print(f"\n✅ Alignment complete: {len(results)} aligned, {len(skipped)} skipped, {len(failed)} failed.")
+    for outcome in failed:
+        print(f"❌ {outcome['file']}: {outcome['reason']}")
     print(f"📄 Results saved to: {output_path}")
     return results
 
@@ -105,6 +141,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run alignment between .fit and Strava segmentSequence")
     parser.add_argument("--folder", type=str, default="fit_data", help="Path to folder with .fit files")
     parser.add_argument("--output", type=str, default="fit_alignment_results.jsonl", help="Output file for results")
+    parser.add_argument("--compatible-types", action="store_true", help="Let planned block types match related detected types (e.g. long_effort -> steady)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the per-file matcher and pipeline logs")
     args = parser.parse_args()
 
-    run_fit_alignment(args.folder, args.output)
+    run_fit_alignment(args.folder, args.output, compatible_types=args.compatible_types,
+                      workers=args.workers, verbose=args.verbose)
@@ -0,0 +1,73 @@
+import argparse
+import bson
+import pandas as pd
+from pymongo import UpdateOne
+from mongo_utils import get_collection, ACTIVITIES
+from dotenv import load_dotenv
+
+from utils.stream_codec import encode_streams, CODEC_KEY
+
+load_dotenv()
+collection = get_collection(ACTIVITIES)
+
+
+def legacy_stream_to_columns(stream):
+    """Legacy streams are {channel: [..]} or, in very old documents, a list of records."""
+    if isinstance(stream, list):
+        return pd.DataFrame(stream).to_dict(orient="list")
+    return stream
+
+
+def migrate_stream_codec(user_id=None, batch_size=200, limit=None, dry_run=False):
+    query = {
+        "stream_data_full": {"$type": ["object", "array"]},
+        f"stream_data_full.{CODEC_KEY}": {"$exists": False}
+    }
+    if user_id:
+        query["userId"] = user_id
+
+    total = collection.count_documents(query, **({"limit": limit} if limit else {}))
+    print(f"🔁 Migrating {total} activities to the columnar stream codec...")
+
+    cursor = collection.find(query, {"stream_data_full": 1}, batch_size=batch_size).limit(limit or 0)
+    ops = []
+    migrated = failed = 0
+    bytes_before = bytes_after = 0
+
+    def flush():
+        nonlocal ops
+        if ops and not dry_run:
+            collection.bulk_write(ops, ordered=False)
+        ops = []
+
+    for doc in cursor:
+        try:
+            legacy = legacy_stream_to_columns(doc["stream_data_full"])
+            encoded = encode_streams(legacy)
+            bytes_before += len(bson.encode({"s": doc["stream_data_full"]}))
+            bytes_after += len(bson.encode({"s": encoded}))
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"stream_data_full": encoded}}))
+            migrated += 1
+        except Exception as e:
+            failed += 1
+            print(f"❌ Failed to encode {doc['_id']}: {e}")
+
+        if len(ops) >= batch_size:
+            flush()
+            print(f"💾 [{migrated}/{total}] written")
+
+    flush()
+    ratio = bytes_before / bytes_after if bytes_after else 0
+    print(f"✅ Finished: {migrated} migrated, {failed} failed{' (dry run)' if dry_run else ''}.")
+    print(f"📦 Stream size {bytes_before / 1e6:.1f} MB → {bytes_after / 1e6:.1f} MB (×{ratio:.1f} smaller)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert legacy stream_data_full lists to the columnar binary codec")
+    parser.add_argument("--user", type=str, help="User ID to filter activities")
+    parser.add_argument("--batch-size", type=int, default=200, help="Documents per bulk_write")
+    parser.add_argument("--limit", type=int, help="Limit number of activities")
+    parser.add_argument("--dry-run", action="store_true", help="Encode and report sizes without writing")
+    args = parser.parse_args()
+
+    migrate_stream_codec(user_id=args.user, batch_size=args.batch_size, limit=args.limit, dry_run=args.dry_run)
@@ -1,22 +1,22 @@
 import requests
-from pymongo import MongoClient
-from bson import ObjectId
+from mongo_utils import get_collection, ACTIVITIES
 from dotenv import load_dotenv
-import time
+from collections import defaultdict
+import argparse
 import os
-from utils.enrichment_helpers import (parse_streams, detect_segments, prepare_activity_for_storage)
 
 
 # ✅ Load environment variables
 load_dotenv()
-MONGO_URL = os.getenv("MONGO_URL")
-DB_NAME = os.getenv("DB_NAME", "test")
 ML_API_URL = os.getenv("ML_API_URL", "https://easyathlete-ml-production.up.railway.app")  # ✅ Fixed default
+BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", 50))  # keep at or below the server's ENRICH_BATCH_MAX
+
+parser = argparse.ArgumentParser(description="Re-enrich activities through the ML API")
+parser.add_argument("--force", action="store_true", help="Re-enrich even when streams and pipeline are unchanged")
+args = parser.parse_args()
 
 # ✅ Connect to MongoDB
-client = MongoClient(MONGO_URL)
-db = client[DB_NAME]
-collection = db["stravaactivities"]
+collection = get_collection(ACTIVITIES)
 
 # #✅ Query: activities that needs enrichment
 # query = {
@@ -32,19 +32,31 @@ query = {
 }
 
 
-activities = list(collection.find(query))
-total = len(activities)
-
-print(f"🔄 Found {total} activities to re-enrich.\n")
-
-for idx, activity in enumerate(activities, 1):
-    try:
-        res = requests.post(f"{ML_API_URL}/ml/enrich-activity", json={
-            "activity_id": str(activity["_id"]),
-            "user_id": activity["userId"]
-        })
-        print(f"✅ [{idx}/{total}] {activity['stravaId']} enriched →", res.json())
-    except Exception as e:
-        print(f"❌ [{idx}/{total}] Failed to enrich {activity['stravaId']} →", str(e))
-
-    time.sleep(0.2)  # protect your server
\ No newline at end of file
+# Only ids are needed here; the server loads the documents itself
+ids_by_user = defaultdict(list)
+for activity in collection.find(query, {"_id": 1, "userId": 1}):
+    ids_by_user[activity["userId"]].append(str(activity["_id"]))
+total = sum(len(ids) for ids in ids_by_user.values())
+
+print(f"🔄 Found {total} activities to re-enrich for {len(ids_by_user)} users.\n")
+
+done = 0
+for user_id, activity_ids in ids_by_user.items():
+    for start in range(0, len(activity_ids), BATCH_SIZE):
+        batch = activity_ids[start:start + BATCH_SIZE]
+        try:
+            res = requests.post(f"{ML_API_URL}/ml/enrich-batch", json={
+                "activity_ids": batch,
+                "user_id": user_id,
+                "force": args.force
+            })
+            res.raise_for_status()
+            body = res.json()
+            done += len(batch)
+            print(f"✅ [{done}/{total}] user {user_id} →", body["counts"])
+            for result in body["results"]:
+                if result["status"] not in ("enriched", "skipped", "unchanged"):
+                    print(f"   ❌ {result['activity_id']}: {result['status']} {result.get('reason', '')}")
+        except Exception as e:
+            done += len(batch)
+            print(f"❌ [{done}/{total}] Failed to enrich batch for user {user_id} →", str(e))
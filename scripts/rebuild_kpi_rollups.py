@@ -0,0 +1,73 @@
+import argparse
+from datetime import datetime, UTC
+from pymongo import UpdateOne
+from mongo_utils import get_collection, ACTIVITIES, KPI_ROLLUPS, KPI_ROLLUP_STATUS
+from dotenv import load_dotenv
+
+from utils.kpi_rollup import build_rollup_update
+from utils.segment_kpis import KPI_PROJECTION
+
+load_dotenv()
+collection = get_collection(ACTIVITIES)
+rollups_collection = get_collection(KPI_ROLLUPS)
+status_collection = get_collection(KPI_ROLLUP_STATUS)
+
+
+def ensure_indexes():
+    rollups_collection.create_index([("userId", 1), ("sport", 1), ("week", 1)], unique=True)
+
+
+def rebuild_kpi_rollups(user_id=None, batch_size=500):
+    """
+    Recomputes the weekly KPI rollups from the stored segments of every enriched
+    activity, then marks each rebuilt user's rollups complete. /ml/analyze-trends
+    only trusts rollups for marked users.
+    """
+    ensure_indexes()
+    query = {"segments": {"$exists": True, "$ne": []}}
+    if user_id:
+        query["userId"] = user_id
+
+    # Unmark first, so an interrupted rebuild leaves these users on the raw path
+    status_collection.delete_many({"_id": user_id} if user_id else {})
+    removed = rollups_collection.delete_many({"userId": user_id} if user_id else {}).deleted_count
+    print(f"🧹 Removed {removed} existing rollup documents")
+
+    total = collection.count_documents(query)
+    print(f"🔁 Rolling up {total} activities...")
+
+    cursor = collection.find(query, {**KPI_PROJECTION, "userId": 1}, batch_size=batch_size)
+    ops = []
+    done = 0
+    users = {user_id} if user_id else set()
+    for activity in cursor:
+        users.add(activity.get("userId"))
+        rollup_update = build_rollup_update(activity)
+        if rollup_update:
+            ops.append(UpdateOne(*rollup_update, upsert=True))
+        done += 1
+        if len(ops) >= batch_size:
+            rollups_collection.bulk_write(ops, ordered=False)
+            ops = []
+            print(f"💾 [{done}/{total}] rolled up")
+
+    if ops:
+        rollups_collection.bulk_write(ops, ordered=False)
+
+    completed_at = datetime.now(UTC)
+    status_ops = [
+        UpdateOne({"_id": user}, {"$set": {"complete": True, "completedAt": completed_at}}, upsert=True)
+        for user in users if user is not None
+    ]
+    if status_ops:
+        status_collection.bulk_write(status_ops, ordered=False)
+    print(f"✅ Finished: {done} activities in {rollups_collection.count_documents({'userId': user_id} if user_id else {})} weekly rollups, {len(status_ops)} users marked complete.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the weekly KPI rollups used by /ml/analyze-trends")
+    parser.add_argument("--user", type=str, help="Only rebuild this user's rollups")
+    parser.add_argument("--batch-size", type=int, default=500, help="Activities per bulk_write")
+    args = parser.parse_args()
+
+    rebuild_kpi_rollups(user_id=args.user, batch_size=args.batch_size)
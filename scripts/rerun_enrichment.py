@@ -1,67 +1,69 @@
-import os
-from pymongo import MongoClient
+from mongo_utils import get_collection, ACTIVITIES, USER_CURVES, KPI_ROLLUPS
 from dotenv import load_dotenv
 from datetime import datetime
 from bson import ObjectId
 
-from utils.enrichment_helpers import (
-    parse_streams,
-    detect_segments,
-    prepare_activity_for_storage,
-    extract_aggregated_features,
-    convert_numpy_types,
-)
+from utils.enrichment_helpers import build_user_curve_update
+from utils.enrichment_pipeline import enrich_activity_document
+from utils.kpi_rollup import build_rollup_cleanup, build_rollup_update
+from utils import result_cache
 
 load_dotenv()
-MONGO_URL = os.getenv("MONGO_URL")
-DB_NAME = os.getenv("DB_NAME", "test")
-client = MongoClient(MONGO_URL)
-collection = client[DB_NAME]["stravaactivities"]
+collection = get_collection(ACTIVITIES)
+user_curves_collection = get_collection(USER_CURVES)
+rollups_collection = get_collection(KPI_ROLLUPS)
 
-def enrich_activity_by_id(activity_id):
+def enrich_activity_by_id(activity_id, force=False):
+    """
+    Re-enriches one activity. Unless `force`, activities whose streams and
+    pipeline fingerprint are unchanged since the last run are left alone.
+    """
     doc = collection.find_one({"_id": ObjectId(activity_id)})
     if not doc:
         print(f"❌ Activity {activity_id} not found.")
         return None
 
-    df = parse_streams(doc)
-    if df.empty:
-        print(f"❌ Skipping {activity_id}: empty stream data.")
+    outcome = enrich_activity_document(doc, skip_unchanged=not force)
+    if outcome["status"] == "unchanged":
+        return doc
+    if outcome["status"] != "enriched":
+        print(f"❌ Skipping {activity_id}: {outcome['reason']}.")
         return None
 
-    doc = prepare_activity_for_storage(doc, df)
-    segments_result = detect_segments(df, doc)
-    aggregated = extract_aggregated_features(doc)
+    doc = outcome["activity"]
+    collection.update_one({"_id": doc["_id"]}, outcome["update"])
 
-    doc.update({
-        "aggregatedFeatures": convert_numpy_types(aggregated),
-        "segments": convert_numpy_types(segments_result["segments"]),
-        "segmentSummary": convert_numpy_types(segments_result["summary"]),
-        "segmentSequence": convert_numpy_types(segments_result["segments"]),
-        "enriched": True,
-        "enrichmentVersion": 1.4,
-        "updatedAt": datetime.utcnow()
-    })
-
-    collection.update_one({"_id": doc["_id"]}, {"$set": doc})
+    curve_update = build_user_curve_update(outcome["meanMaxCurves"])
+    if curve_update:
+        curve_update["$set"]["updatedAt"] = datetime.utcnow()
+        user_curves_collection.update_one({"userId": doc.get("userId"), "sport": doc.get("type")}, curve_update, upsert=True)
+    rollup_cleanup = build_rollup_cleanup(doc)
+    if rollup_cleanup:
+        rollups_collection.update_many(*rollup_cleanup)
+    rollup_update = build_rollup_update(doc)
+    if rollup_update:
+        rollups_collection.update_one(*rollup_update, upsert=True)
+    # Only a Mongo-backed cache is shared with the API; an in-process one would be bumped here alone
+    if result_cache.RESULT_CACHE_BACKEND == "mongo":
+        result_cache.bump_user_version(doc.get("userId"))
     print(f"✅ Re-enriched {doc.get('stravaId')} ({doc['_id']})")
     return doc
 
-def rerun_enrichment(user_id=None, limit=None):
+def rerun_enrichment(user_id=None, limit=None, force=False):
     query = {"stream_data_full": {"$exists": True}}
     if user_id:
         query["userId"] = user_id
 
-    cursor = collection.find(query).limit(limit or 0)
-    total = cursor.count()
+    total = collection.count_documents(query, limit=limit or 0)
+    cursor = collection.find(query, {"_id": 1}).limit(limit or 0)
 
     print(f"🔁 Re-enriching {total} activities...")
     success = 0
     for doc in cursor:
-        if enrich_activity_by_id(doc["_id"]):
+        if enrich_activity_by_id(doc["_id"], force=force):
             success += 1
 
-    print(f"✅ Finished: {success}/{total} successfully re-enriched.")
+    print(f"✅ Finished: {success}/{total} up to date.")
 
 if __name__ == "__main__":
     from argparse import ArgumentParser
@@ -69,9 +71,10 @@ if __name__ == "__main__":
     parser.add_argument("--activity", type=str, help="Single activity ID to reprocess")
     parser.add_argument("--user", type=str, help="User ID to filter activities")
     parser.add_argument("--limit", type=int, help="Limit number of activities")
+    parser.add_argument("--force", action="store_true", help="Re-enrich even when the fingerprint is unchanged")
     args = parser.parse_args()
 
     if args.activity:
-        enrich_activity_by_id(args.activity)
+        enrich_activity_by_id(args.activity, force=args.force)
     else:
-        rerun_enrichment(user_id=args.user, limit=args.limit)
+        rerun_enrichment(user_id=args.user, limit=args.limit, force=args.force)
@@ -0,0 +1,29 @@
+import argparse
+import os
+from dotenv import load_dotenv
+
+from utils import corpus_cache
+
+load_dotenv()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot activity streams into the local corpus cache used by offline tooling")
+    parser.add_argument("--user", type=str, default=os.getenv("FIT_MATCH_USER_ID"), help="Only this user's activities (default: FIT_MATCH_USER_ID)")
+    parser.add_argument("--type", type=str, help="Only this sport, e.g. Run")
+    parser.add_argument("--stravaId", type=int, nargs="+", help="Only these activities")
+    parser.add_argument("--cache-dir", type=str, default=corpus_cache.CORPUS_CACHE_DIR, help="Cache directory")
+    parser.add_argument("--batch-size", type=int, default=corpus_cache.SYNC_BATCH_SIZE, help="Full documents fetched per query")
+    parser.add_argument("--prune", action="store_true", help="Drop cached activities that no longer match the query")
+    args = parser.parse_args()
+
+    query = {}
+    if args.user:
+        query["userId"] = args.user
+    if args.type:
+        query["type"] = args.type
+    if args.stravaId:
+        query["stravaId"] = {"$in": args.stravaId}
+
+    counts = corpus_cache.sync(query, cache_dir=args.cache_dir, batch_size=args.batch_size, prune=args.prune)
+    print(f"✅ Corpus cache up to date: {counts['matched']} matched, {counts['downloaded']} downloaded, {counts['removed']} removed.")
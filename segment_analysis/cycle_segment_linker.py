@@ -3,23 +3,20 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 import json
-import os
 from datetime import datetime
-from pymongo import MongoClient
+from mongo_utils import get_collection, ACTIVITIES
 from dotenv import load_dotenv
 from athlete_zones.zone_utils import resolve_athlete_zones
 from utils.enrichment_helpers import parse_streams
+from utils import corpus_cache
 import pandas as pd
 import numpy as np
 
 # Load environment variables
 load_dotenv()
-MONGO_URL = os.getenv("MONGO_URL")
-DB_NAME = os.getenv("DB_NAME", "test")
 
-# Setup MongoDB connection
-client = MongoClient(MONGO_URL)
-collection = client[DB_NAME]["stravaactivities"]
+# Shared MongoDB connection
+collection = get_collection(ACTIVITIES)
 
 # Load training templates with planned zones
 def load_planned_templates(path="training_templates_zones/bike_training_templates_zones.json"):
@@ -121,9 +118,10 @@ def run_segment_linking(strava_id):
     print(f"✅ Found planned template for {strava_id}")
     sequence = expand_planned_segments(planned["planned_segments"])
 
-    activity = collection.find_one({"stravaId": int(strava_id)})
+    # Local corpus cache first, MongoDB only on a miss
+    activity = corpus_cache.get_activity(strava_id)
     if not activity:
-        print(f"❌ No activity found in MongoDB for stravaId={strava_id}")
+        print(f"❌ No activity found in the corpus cache or MongoDB for stravaId={strava_id}")
         return
 
     if "stream_data_full" not in activity:
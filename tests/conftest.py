@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import gzip
+import json
+
+import pytest
+
+CORPUS_DIR = Path(__file__).resolve().parent.parent / "benchmarks" / "corpus"
+
+
+def load_fixture(name):
+    with gzip.open(CORPUS_DIR / f"{name}.json.gz", "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="session")
+def corpus():
+    """{fixture name: activity document} for every benchmarks/corpus document."""
+    return {
+        path.name.removesuffix(".json.gz"): load_fixture(path.name.removesuffix(".json.gz"))
+        for path in sorted(CORPUS_DIR.glob("*.json.gz"))
+    }
+
+
+@pytest.fixture(scope="session")
+def enriched_corpus(corpus):
+    """{fixture name: document after the full enrichment pipeline}."""
+    import contextlib
+    import copy
+    import io
+
+    from utils.enrichment_pipeline import enrich_activity_document
+
+    enriched = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, doc in corpus.items():
+            outcome = enrich_activity_document(copy.deepcopy(doc))
+            enriched[name] = outcome["activity"] if outcome["status"] == "enriched" else doc
+    return enriched
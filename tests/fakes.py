@@ -0,0 +1,228 @@
+"""
+In-memory stand-ins for the pymongo collection calls the app and scripts make,
+so routes and tools can be tested without a Mongo server. Only the query and
+update operators the code base actually uses are supported.
+"""
+import copy
+import re
+
+from bson import ObjectId
+
+
+def _get(doc, path):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+_MISSING = object()
+
+
+def _match_value(value, condition):
+    if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+        for op, arg in condition.items():
+            if op == "$exists":
+                if (value is not _MISSING) != bool(arg):
+                    return False
+            elif value is _MISSING:
+                if op == "$ne" or op == "$nin":
+                    continue
+                return False
+            elif op == "$in" and value not in arg:
+                return False
+            elif op == "$nin" and value in arg:
+                return False
+            elif op == "$ne" and value == arg:
+                return False
+            elif op == "$gt" and not value > arg:
+                return False
+            elif op == "$gte" and not value >= arg:
+                return False
+            elif op == "$lt" and not value < arg:
+                return False
+            elif op == "$lte" and not value <= arg:
+                return False
+            elif op == "$regex" and not re.search(arg, value):
+                return False
+        return True
+    return value is not _MISSING and value == condition
+
+
+def matches(doc, query):
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif not _match_value(_get(doc, key), condition):
+            return False
+    return True
+
+
+def _project_path(source, target, parts):
+    """Copies one dotted path from source into target; paths through arrays apply to every element."""
+    head, rest = parts[0], parts[1:]
+    if not isinstance(source, dict) or head not in source:
+        return
+    value = source[head]
+    if not rest:
+        target[head] = copy.deepcopy(value)
+    elif isinstance(value, list):
+        items = target.setdefault(head, [{} for _ in value])
+        for item, sub in zip(items, value):
+            _project_path(sub, item, rest)
+    else:
+        _project_path(value, target.setdefault(head, {}), rest)
+
+
+def project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if not include:
+        out = copy.deepcopy(doc)
+        for key, v in projection.items():
+            if not v:
+                out.pop(key, None)
+        return out
+    out = {}
+    if projection.get("_id", 1) and "_id" in doc:
+        out["_id"] = doc["_id"]
+    for path in sorted(include):
+        _project_path(doc, out, path.split("."))
+    return out
+
+
+class FakeCursor(list):
+    def sort(self, key, direction=1):
+        if isinstance(key, list):
+            key, direction = key[0]
+        return FakeCursor(sorted(self, key=lambda d: _get(d, key), reverse=direction < 0))
+
+    def limit(self, n):
+        return FakeCursor(self[:n]) if n else self
+
+
+class FakeResult:
+    def __init__(self, matched=0, modified=0, upserted_id=None, deleted=0):
+        self.matched_count = matched
+        self.modified_count = modified
+        self.upserted_id = upserted_id
+        self.deleted_count = deleted
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = [copy.deepcopy(d) for d in docs]
+        self.calls = []
+
+    def find(self, query=None, projection=None, **kwargs):
+        self.calls.append(("find", query, projection, kwargs))
+        return FakeCursor(project(d, projection) for d in self.docs if matches(d, query))
+
+    def find_one(self, query=None, projection=None, **kwargs):
+        self.calls.append(("find_one", query, projection, kwargs))
+        for doc in self.docs:
+            if matches(doc, query):
+                return project(doc, projection)
+        return None
+
+    def count_documents(self, query=None, **kwargs):
+        return sum(1 for d in self.docs if matches(d, query))
+
+    def insert_one(self, doc):
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", ObjectId())
+        self.docs.append(doc)
+        return FakeResult(upserted_id=doc["_id"])
+
+    def _apply(self, doc, update):
+        before = copy.deepcopy(doc)
+        for path, value in update.get("$set", {}).items():
+            target = doc
+            parts = path.split(".")
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = copy.deepcopy(value)
+        for path in update.get("$unset", {}):
+            target = doc
+            parts = path.split(".")
+            for part in parts[:-1]:
+                target = target.get(part, {})
+            target.pop(parts[-1], None)
+        for path, value in update.get("$inc", {}).items():
+            doc[path] = doc.get(path, 0) + value
+        for path, value in update.get("$max", {}).items():
+            doc[path] = max(doc.get(path, value), value)
+        for path, value in update.get("$min", {}).items():
+            doc[path] = min(doc.get(path, value), value)
+        return doc != before
+
+    def update_one(self, query, update, upsert=False, **kwargs):
+        self.calls.append(("update_one", query, update, kwargs))
+        for doc in self.docs:
+            if matches(doc, query):
+                return FakeResult(1, int(self._apply(doc, update)))
+        if upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            doc.setdefault("_id", ObjectId())
+            self._apply(doc, {**update, "$set": {**update.get("$setOnInsert", {}), **update.get("$set", {})}})
+            self.docs.append(doc)
+            return FakeResult(0, 0, doc["_id"])
+        return FakeResult()
+
+    def update_many(self, query, update, **kwargs):
+        modified = sum(int(self._apply(doc, update)) for doc in self.docs if matches(doc, query))
+        return FakeResult(modified, modified)
+
+    def replace_one(self, query, replacement, upsert=False, **kwargs):
+        for i, doc in enumerate(self.docs):
+            if matches(doc, query):
+                self.docs[i] = {"_id": doc["_id"], **copy.deepcopy(replacement)}
+                return FakeResult(1, 1)
+        if upsert:
+            self.insert_one(replacement)
+        return FakeResult()
+
+    def delete_many(self, query):
+        kept = [d for d in self.docs if not matches(d, query)]
+        deleted, self.docs = len(self.docs) - len(kept), kept
+        return FakeResult(deleted=deleted)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        self.calls.append(("bulk_write", len(requests), kwargs))
+        for request in requests:
+            doc = request._doc
+            if type(request).__name__ == "UpdateMany":
+                self.update_many(request._filter, doc)
+                continue
+            upsert = getattr(request, "_upsert", False) or False
+            self.update_one(request._filter, doc, upsert=upsert)
+        return FakeResult(len(requests), len(requests))
+
+    def create_index(self, *args, **kwargs):
+        return "fake_index"
+
+
+class FakeDatabase(dict):
+    """{collection name: FakeCollection}, created on first access like a Mongo database."""
+
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+
+
+def install(monkeypatch, db, *modules):
+    """Points get_collection (mongo_utils and every module that imported it) at `db`."""
+    import mongo_utils
+    getter = lambda name=mongo_utils.ACTIVITIES: db[name]
+    monkeypatch.setattr(mongo_utils, "get_collection", getter)
+    monkeypatch.setattr(mongo_utils, "get_async_collection", lambda name=None: None)
+    for module in modules:
+        monkeypatch.setattr(module, "get_collection", getter)
+    return db
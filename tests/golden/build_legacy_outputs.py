@@ -0,0 +1,87 @@
+"""
+Records what the pre-rewrite segment detectors and sequencer produce on the
+benchmark corpus; tests/test_segment_detection.py and
+tests/test_segment_sequencer.py compare the current code against it.
+
+Run it against a checkout of the code before the detector rewrite:
+
+    git worktree add /tmp/legacy-tree 1e23fb7
+    python tests/golden/build_legacy_outputs.py --legacy-tree /tmp/legacy-tree
+
+Streams are parsed with the current parse_streams(features="all"), a superset of
+the legacy columns (the legacy parser could not handle streams without watts),
+so only the detectors and the sequencer come from the legacy tree.
+"""
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+import argparse
+import contextlib
+import copy
+import importlib
+import io
+import json
+
+from benchmarks.run_suite import load_corpus
+from utils.enrichment_helpers import parse_streams
+
+OUTPUT = Path(__file__).resolve().parent / "legacy_segments.json"
+DETECTORS = [
+    "detect_warmup",
+    "detect_intervals",
+    "detect_acceleration_blocks",
+    "detect_recovery_blocks",
+    "detect_steady_state_blocks",
+    "detect_cooldown",
+]
+
+
+def boundaries(segments):
+    return [[s["type"], s["start_index"], s["end_index"], s["duration_sec"]] for s in segments]
+
+
+def load_legacy_modules(legacy_tree):
+    """Re-imports the utils package from `legacy_tree` in place of the current one."""
+    for name in [m for m in sys.modules if m == "utils" or m.startswith("utils.")]:
+        del sys.modules[name]
+    sys.path.insert(0, str(Path(legacy_tree).resolve()))
+    return (
+        importlib.import_module("utils.segment_rules"),
+        importlib.import_module("utils.enrichment_helpers"),
+        importlib.import_module("utils.segment_sequencer"),
+    )
+
+
+def build_legacy_outputs(legacy_tree):
+    with contextlib.redirect_stdout(io.StringIO()):
+        parsed = [(doc, parse_streams(doc, features="all")) for doc in load_corpus()]
+    rules, helpers, sequencer = load_legacy_modules(legacy_tree)
+
+    outputs = {}
+    for doc, df in parsed:
+        with contextlib.redirect_stdout(io.StringIO()):
+            detectors = {}
+            if doc["type"] != "Swim":
+                for name in DETECTORS:
+                    detectors[name] = boundaries(helpers.apply_rule(getattr(rules, name), df.copy(), doc["type"]))
+            result = helpers.detect_segments(df.copy(), doc)
+            sequence = sequencer.infer_segment_sequence(copy.deepcopy(result["segments"]), df)
+        outputs[doc["_id"]] = {
+            "detectors": detectors,
+            "segments": boundaries(result["segments"]),
+            "summary": result["summary"],
+            "sequence": boundaries(sequence),
+        }
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record legacy detector and sequencer outputs on the benchmark corpus")
+    parser.add_argument("--legacy-tree", type=Path, required=True, help="Checkout of the code before the rewrite")
+    parser.add_argument("--output", type=Path, default=OUTPUT, help="Where to write the outputs")
+    args = parser.parse_args()
+
+    outputs = build_legacy_outputs(args.legacy_tree)
+    args.output.write_text(json.dumps(outputs, separators=(",", ":")) + "\n")
+    print(f"💾 Legacy outputs for {len(outputs)} fixtures written to {args.output}")
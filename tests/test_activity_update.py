@@ -0,0 +1,54 @@
+import copy
+import json
+
+import pytest
+from bson import ObjectId
+
+from utils.enrichment_helpers import LEGACY_STREAM_FIELDS
+from utils.enrichment_pipeline import build_activity_update, enrich_activity_document
+from tests.fakes import FakeCollection
+
+
+def comparable(doc):
+    return json.dumps(doc, sort_keys=True, default=str)
+
+
+def legacy_fields(doc):
+    """The per-channel *Stream arrays older imports stored next to stream_data_full."""
+    stream = doc["stream_data_full"]
+    return {"timeStream": stream["time_sec"], "heartRateStream": stream.get("heart_rate", [])}
+
+
+@pytest.mark.parametrize("name", ["bench-run-1h", "bench-virtualride-short", "bench-swim-short"])
+def test_delta_update_stores_the_same_document_as_a_full_replace(corpus, name):
+    doc = {**copy.deepcopy(corpus[name]), "_id": ObjectId()}
+    doc.update(legacy_fields(doc))
+    outcome = enrich_activity_document(copy.deepcopy(doc))
+    assert outcome["status"] == "enriched"
+
+    replaced, patched = FakeCollection([doc]), FakeCollection([doc])
+    replaced.replace_one({"_id": doc["_id"]}, {k: v for k, v in outcome["activity"].items() if k != "_id"})
+    patched.update_one({"_id": doc["_id"]}, outcome["update"])
+    assert comparable(patched.docs[0]) == comparable(replaced.docs[0])
+    assert set(outcome["update"]["$unset"]) == {"timeStream", "heartRateStream"}
+
+
+def test_current_format_stream_is_not_rewritten(corpus):
+    first = enrich_activity_document(copy.deepcopy(corpus["bench-run-1h"]))
+    assert "stream_data_full" in first["update"]["$set"]
+
+    again = enrich_activity_document(copy.deepcopy(first["activity"]))
+    assert "stream_data_full" not in again["update"]["$set"]
+    assert "$unset" not in again["update"]
+    assert "_id" not in again["update"]["$set"]
+
+
+def test_build_activity_update_cases():
+    blob = b"\x00\x01"
+    before = {"_id": 1, "a": 1, "same": [1, 2], "blob": blob, "wattsStream": [1], "speedStream": [2], "other": 3}
+    after = {"_id": 1, "a": 2, "same": [1, 2], "blob": blob, "new": {"x": 1}, "speedStream": [2], "other": 3}
+    assert build_activity_update(before, after) == {
+        "$set": {"a": 2, "new": {"x": 1}},
+        "$unset": {"wattsStream": ""},
+    }
+    assert build_activity_update(before, before) == {"$set": {}}
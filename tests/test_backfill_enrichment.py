@@ -0,0 +1,129 @@
+import copy
+import json
+import queue
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from mongo_utils import ACTIVITIES
+from scripts import backfill_enrichment as backfill
+from utils.enrichment_pipeline import enrich_activity_document
+from tests.fakes import FakeCollection, FakeDatabase, install
+
+FIXTURES = ["bench-run-short", "bench-virtualride-short", "bench-swim-short", "bench-run-1h", "bench-swim-1h"]
+SHARD = {"index": 0, "min": None, "max": None}
+
+
+class FlakyWrites(FakeCollection):
+    """Rejects the first bulk_write of every activity id in `reject`."""
+
+    def __init__(self, docs, reject=()):
+        super().__init__(docs)
+        self.reject = set(reject)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        errors = [
+            {"index": i, "errmsg": "simulated write failure"}
+            for i, request in enumerate(requests) if str(request._filter["_id"]) in self.reject
+        ]
+        self.reject -= {str(requests[e["index"]]._filter["_id"]) for e in errors}
+        ok = [r for i, r in enumerate(requests) if i not in {e["index"] for e in errors}]
+        super().bulk_write(ok, ordered=ordered, **kwargs)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+def activities(corpus):
+    docs = []
+    for name in FIXTURES:
+        doc = copy.deepcopy(corpus[name])
+        doc.update({"_id": ObjectId(), "userId": "u1", "stravaId": name})
+        docs.append(doc)
+    return docs
+
+
+def comparable(docs):
+    return sorted(json.dumps({k: v for k, v in d.items() if k != "updatedAt"}, sort_keys=True, default=str) for d in docs)
+
+
+def run_shard(tmp_path, force=False):
+    return backfill.process_shard(SHARD, backfill.build_query(), tmp_path, 2, force, False, queue.Queue())
+
+
+def test_backfill_matches_per_activity_enrichment(monkeypatch, tmp_path, corpus):
+    db = install(monkeypatch, FakeDatabase(), backfill)
+    db[ACTIVITIES].docs = activities(corpus)
+    direct = comparable(
+        enrich_activity_document(copy.deepcopy(d))["activity"] for d in db[ACTIVITIES].docs
+    )
+    state = run_shard(tmp_path)
+    assert state["done"] and state["enriched"] == len(FIXTURES) and state["failed_ids"] == []
+    assert comparable(db[ACTIVITIES].docs) == direct
+
+    # Second run: the shard is finished and nothing is re-read
+    calls = len(db[ACTIVITIES].calls)
+    assert run_shard(tmp_path)["enriched"] == len(FIXTURES)
+    assert len(db[ACTIVITIES].calls) == calls
+
+
+def test_enrichment_errors_are_retried_on_resume(monkeypatch, tmp_path, corpus):
+    db = install(monkeypatch, FakeDatabase(), backfill)
+    db[ACTIVITIES].docs = activities(corpus)
+    broken = str(db[ACTIVITIES].docs[1]["_id"])
+
+    def flaky(doc, **kwargs):
+        if str(doc["_id"]) == broken:
+            raise ValueError("simulated enrichment failure")
+        return enrich_activity_document(doc, **kwargs)
+
+    monkeypatch.setattr(backfill, "enrich_activity_document", flaky)
+    state = run_shard(tmp_path)
+    assert state["done"] and state["failed_ids"] == [broken] and state["failed"] == 1
+    # The checkpoint moved past the failure, but the failure is on record
+    assert state["last_id"] == str(db[ACTIVITIES].docs[-1]["_id"])
+
+    monkeypatch.setattr(backfill, "enrich_activity_document", enrich_activity_document)
+    state = run_shard(tmp_path)
+    assert state["failed_ids"] == [] and state["failed"] == 0
+    assert state["enriched"] == len(FIXTURES)
+    assert db[ACTIVITIES].find_one({"_id": ObjectId(broken)})["enriched"] is True
+
+
+def test_write_errors_are_retried_on_resume(monkeypatch, tmp_path, corpus):
+    docs = activities(corpus)
+    rejected = str(docs[3]["_id"])
+    db = FakeDatabase()
+    db[ACTIVITIES] = FlakyWrites(docs, reject=[rejected])
+    install(monkeypatch, db, backfill)
+
+    state = run_shard(tmp_path)
+    assert state["failed_ids"] == [rejected] and state["enriched"] == len(FIXTURES) - 1
+    assert "enriched" not in db[ACTIVITIES].find_one({"_id": ObjectId(rejected)})
+
+    state = run_shard(tmp_path)
+    assert state["failed_ids"] == [] and state["enriched"] == len(FIXTURES)
+    assert db[ACTIVITIES].find_one({"_id": ObjectId(rejected)})["enriched"] is True
+
+
+def test_failed_ids_survive_a_crash_before_the_retry_is_written(monkeypatch, tmp_path, corpus):
+    db = install(monkeypatch, FakeDatabase(), backfill)
+    db[ACTIVITIES].docs = activities(corpus)[:1]
+    missing = str(ObjectId())
+    path = backfill.checkpoint_path(tmp_path, 0)
+    state = {"last_id": str(db[ACTIVITIES].docs[0]["_id"]), "done": True, "enriched": 1, "unchanged": 0,
+             "skipped": 0, "failed": 2, "failed_ids": [str(db[ACTIVITIES].docs[0]["_id"]), missing]}
+    backfill.write_json(path, state)
+
+    def crash(collections, ops, *args):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(backfill, "flush", crash)
+    with pytest.raises(KeyboardInterrupt):
+        run_shard(tmp_path)
+    assert backfill.read_json(path)["failed_ids"] == state["failed_ids"]
+
+    monkeypatch.undo()
+    install(monkeypatch, db, backfill)
+    # The retry succeeds and the id that no longer matches the query is dropped
+    assert run_shard(tmp_path)["failed_ids"] == []
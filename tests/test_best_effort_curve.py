@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from benchmarks.bench_best_efforts import legacy_detect_best_efforts
+from routes.prediction import stream_best_effort_curve
+from utils.best_efforts import (
+    BEST_EFFORT_CURVE_DISTANCES,
+    compute_best_effort_curve,
+    best_effort_curve_from_arrays,
+    detect_best_efforts,
+    merge_best_effort_curve,
+    best_efforts_from_curve,
+)
+
+RUNS = ["bench-run-short", "bench-run-1h", "bench-run-6h"]
+
+
+def run_frame(doc):
+    stream = doc["stream_data_full"]
+    return pd.DataFrame({"time_sec": stream["time_sec"], "distance": stream["distance"]})
+
+
+@pytest.mark.parametrize("name", RUNS)
+def test_curve_matches_best_efforts_on_corpus(corpus, name):
+    df = run_frame(corpus[name])
+    curve = compute_best_effort_curve(df)
+    efforts = detect_best_efforts(df, BEST_EFFORT_CURVE_DISTANCES)
+
+    assert curve["distance_m"] == [float(d) for d in BEST_EFFORT_CURVE_DISTANCES.values()]
+    for label, time_sec in zip(BEST_EFFORT_CURVE_DISTANCES, curve["time_sec"]):
+        assert time_sec == (efforts[label]["time_sec"] if label in efforts else None)
+
+
+def test_curve_matches_legacy_loop_for_a_single_activity(corpus):
+    # With one activity the legacy concatenated frame is just that activity's stream
+    df = run_frame(corpus["bench-run-short"])
+    targets = {"400m": 400, "1k": 1000}
+    best = merge_best_effort_curve({}, compute_best_effort_curve(df, targets))
+    assert best_efforts_from_curve(best, targets) == legacy_detect_best_efforts(df, targets=targets)
+
+
+def test_stream_formats_give_the_same_curve(corpus):
+    stream = corpus["bench-run-1h"]["stream_data_full"]
+    as_samples = [dict(zip(stream, values)) for values in zip(*stream.values())]
+    assert stream_best_effort_curve(stream) == stream_best_effort_curve(as_samples) == compute_best_effort_curve(run_frame(corpus["bench-run-1h"]))
+
+
+def test_unsorted_time_is_sorted_before_searching():
+    distance = [0, 100, 200, 300, 400, 500, 600, 700]
+    time_sec = [0, 10, 20, 30, 40, 50, 60, 70]
+    shuffled = [3, 0, 7, 5, 1, 6, 2, 4]
+    expected = best_effort_curve_from_arrays(distance, time_sec, {"500m": 500})
+    assert best_effort_curve_from_arrays(
+        [distance[i] for i in shuffled], [time_sec[i] for i in shuffled], {"500m": 500}
+    ) == expected == {"distance_m": [500.0], "time_sec": [50.0]}
+
+
+def test_missing_and_short_streams():
+    assert compute_best_effort_curve(pd.DataFrame()) is None
+    assert compute_best_effort_curve(pd.DataFrame({"time_sec": [1, 2]})) is None
+    assert best_effort_curve_from_arrays([], [], {"1k": 1000}) is None
+    assert best_effort_curve_from_arrays([0, 10], [0, 1], {"1k": 1000})["time_sec"] == [None]
+    assert stream_best_effort_curve(None) is None
+    assert stream_best_effort_curve({"time_sec": [0, 1]}) is None
+
+
+def test_merge_keeps_fastest_time_per_distance():
+    best = merge_best_effort_curve({}, {"distance_m": [400, 1000], "time_sec": [90.0, None]})
+    best = merge_best_effort_curve(best, {"distance_m": [400, 1000], "time_sec": [95.0, 250.0]})
+    best = merge_best_effort_curve(best, None)
+    assert best == {400.0: 90.0, 1000.0: 250.0}
+    assert best_efforts_from_curve(best, {"1k": 1000, "5k": 5000}) == {"1k": {"type": "measured", "time_sec": 250.0}}
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.bench_best_efforts import legacy_detect_best_efforts, dipping_run_stream, same_efforts
+from utils.best_efforts import best_effort_times, detect_best_efforts
+
+# Short enough for the full legacy loop to reach them on the corpus streams
+SHORT_TARGETS = {"100m": 100, "200m": 200, "400m": 400}
+
+
+def stream_frame(doc):
+    stream = doc["stream_data_full"]
+    return pd.DataFrame({"time_sec": stream["time_sec"], "distance": stream["distance"]})
+
+
+def test_matches_legacy_on_corpus_run(corpus):
+    df = stream_frame(corpus["bench-run-short"])
+    legacy = legacy_detect_best_efforts(df, targets=SHORT_TARGETS)
+    assert legacy
+    assert same_efforts(legacy, detect_best_efforts(df, SHORT_TARGETS))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_matches_legacy_when_distance_dips(seed):
+    df = dipping_run_stream(150, seed, dip_every=10)
+    assert (np.diff(df["distance"]) < 0).any()
+    legacy = legacy_detect_best_efforts(df, targets=SHORT_TARGETS)
+    assert same_efforts(legacy, detect_best_efforts(df, SHORT_TARGETS))
+
+
+def test_target_reached_inside_window_then_lost():
+    # The 100 m jump at sample 2 is corrected away before the 5-sample window ends
+    distance = [0, 10, 110, 20, 30, 40, 50, 60, 150, 160]
+    time_sec = list(range(10))
+    df = pd.DataFrame({"time_sec": time_sec, "distance": distance})
+    legacy = legacy_detect_best_efforts(df, targets={"100m": 100})
+    assert legacy["100m"]["time_sec"] == 5
+    assert same_efforts(legacy, detect_best_efforts(df, {"100m": 100}))
+
+
+def test_short_and_empty_streams():
+    assert np.isnan(best_effort_times([], [], [100])).all()
+    assert np.isnan(best_effort_times([0, 500, 1000, 1500, 2000], range(5), [100])).all()
+    assert detect_best_efforts(pd.DataFrame()) == {}
+    assert detect_best_efforts(pd.DataFrame({"time_sec": [0, 1]})) == {}
+
+
+def test_missing_samples_are_dropped():
+    distance = np.array([0, 100, np.nan, 200, 300, 400, 500, 600, 700])
+    time_sec = np.arange(len(distance), dtype=float)
+    # Without the NaN row, 500 m from the 200 m sample (t=3) ends at the 700 m one (t=8)
+    assert best_effort_times(distance, time_sec, [500])[0] == 5
@@ -0,0 +1,124 @@
+import copy
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from utils import corpus_cache
+from utils.enrichment_helpers import parse_streams
+from utils.stream_codec import encode_streams
+from tests.fakes import FakeCollection
+
+
+def cached_corpus(corpus):
+    """Corpus documents with the ids and timestamps real activities carry; every other one codec-encoded."""
+    docs = []
+    for i, (name, doc) in enumerate(sorted(corpus.items())):
+        doc = copy.deepcopy(doc)
+        doc.update({
+            "_id": ObjectId(),
+            "stravaId": float(1000 + i) if i % 3 == 0 else 1000 + i,
+            "fixture": name,
+            "startDate": datetime(2024, 1, 1 + i, 8),
+            "updatedAt": datetime(2024, 2, 1),
+        })
+        if i % 2:
+            doc["stream_data_full"] = encode_streams(doc["stream_data_full"])
+        docs.append(doc)
+    return docs
+
+
+@pytest.fixture
+def activities(monkeypatch, corpus, tmp_path):
+    collection = FakeCollection(cached_corpus(corpus))
+    monkeypatch.setattr(corpus_cache, "get_collection", lambda name=None: collection)
+    monkeypatch.setattr(corpus_cache, "_manifests", {})
+    return collection
+
+
+def full_reads(collection):
+    return sum(
+        1 for call in collection.calls
+        if call[0] in ("find", "find_one") and "stream_data_full" in (call[2] or {})
+    )
+
+
+def test_cached_activities_parse_like_the_mongo_documents(activities, tmp_path):
+    assert corpus_cache.sync({"userId": "bench-user"}, cache_dir=tmp_path) == {
+        "matched": len(activities.docs), "downloaded": len(activities.docs), "removed": 0,
+    }
+    corpus_cache._manifests.clear()  # next process reads the manifest from disk
+
+    for doc in activities.docs:
+        cached = corpus_cache.get_activity(doc["stravaId"], cache_dir=tmp_path, fallback=False)
+        assert cached is not None, doc["fixture"]
+        assert cached["_id"] == doc["_id"] and cached["startDate"] == doc["startDate"]
+        expected = parse_streams(copy.deepcopy(doc))
+        got = parse_streams(cached)
+        assert got.equals(expected), doc["fixture"]
+
+
+def test_resync_downloads_only_new_or_updated(activities, tmp_path):
+    corpus_cache.sync(cache_dir=tmp_path)
+    reads = full_reads(activities)
+    corpus_cache._manifests.clear()
+
+    assert corpus_cache.sync(cache_dir=tmp_path)["downloaded"] == 0
+    assert full_reads(activities) == reads
+
+    activities.docs[0]["updatedAt"] = datetime(2024, 3, 1)
+    activities.docs[0]["stream_data_full"] = {"time_sec": [0.0, 1.0], "speed": [2.0, None]}
+    assert corpus_cache.sync(cache_dir=tmp_path)["downloaded"] == 1
+    cached = corpus_cache.get_activity(activities.docs[0]["stravaId"], cache_dir=tmp_path, fallback=False)
+    assert cached["stream_data_full"]["time_sec"].tolist() == [0.0, 1.0]
+
+
+def test_prune_drops_activities_that_no_longer_match(activities, tmp_path):
+    corpus_cache.sync(cache_dir=tmp_path)
+    gone = activities.docs.pop()
+    result = corpus_cache.sync(cache_dir=tmp_path, prune=True)
+    assert result["removed"] == 1
+    assert corpus_cache.get_activity(gone["stravaId"], cache_dir=tmp_path, fallback=False) is None
+    assert not (tmp_path / f"{int(gone['stravaId'])}.npz").exists()
+
+
+def test_get_activity_falls_back_to_mongo_and_caches(activities, tmp_path):
+    doc = activities.docs[1]
+    assert corpus_cache.get_activity(doc["stravaId"], cache_dir=tmp_path, fallback=False) is None
+    first = corpus_cache.get_activity(str(doc["stravaId"]), cache_dir=tmp_path)
+    assert parse_streams(first).equals(parse_streams(copy.deepcopy(doc)))
+
+    reads = full_reads(activities)
+    corpus_cache.get_activity(doc["stravaId"], cache_dir=tmp_path)
+    assert full_reads(activities) == reads
+    assert corpus_cache.get_activity(999999, cache_dir=tmp_path) is None
+
+
+def test_find_and_iter_filter_on_metadata(activities, tmp_path):
+    corpus_cache.sync(cache_dir=tmp_path)
+    runs = corpus_cache.find_activities("bench-user", "Run", cache_dir=tmp_path)
+    assert [a["name"] for a in runs] == [d["name"] for d in activities.docs if d["type"] == "Run"]
+
+    window = corpus_cache.find_activities(start=datetime(2024, 1, 2), end=datetime(2024, 1, 4), cache_dir=tmp_path)
+    assert [a["startDate"].day for a in window] == [2, 3]
+    assert corpus_cache.find_activities(user_id="nobody", cache_dir=tmp_path) == []
+    assert len(list(corpus_cache.iter_activities("bench-user", cache_dir=tmp_path))) == len(activities.docs)
+
+
+def test_stream_formats_and_null_bitmaps(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus_cache, "_manifests", {})
+    samples = [{"time_sec": 0, "heart_rate": None}, {"time_sec": 1, "heart_rate": 140}]
+    plain = {"time_sec": [0, 1, 2], "heart_rate": [None, 140, None]}
+    assert corpus_cache.stream_arrays(None) == {}
+    assert corpus_cache.stream_arrays(samples)["heart_rate"].tolist()[1] == 140.0
+
+    for stream in (plain, encode_streams(plain)):
+        arrays = corpus_cache.stream_arrays(stream)
+        assert arrays["time_sec"].tolist() == [0.0, 1.0, 2.0]
+        heart_rate = arrays["heart_rate"].tolist()
+        assert heart_rate[1] == 140.0 and heart_rate[0] != heart_rate[0] and heart_rate[2] != heart_rate[2]
+
+    key = corpus_cache.store_activity({"_id": ObjectId(), "stravaId": 7.0, "stream_data_full": {}}, tmp_path)
+    assert key == "7"
+    assert corpus_cache.load_manifest(tmp_path)["activities"]["7"]["rows"] == 0
+    assert corpus_cache.get_activity(7, cache_dir=tmp_path, fallback=False)["stream_data_full"] == {}
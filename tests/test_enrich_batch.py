@@ -0,0 +1,120 @@
+import asyncio
+import copy
+import json
+
+import pytest
+from bson import ObjectId
+
+from routes import enrichment
+from routes.enrichment import BatchEnrichmentRequest, EnrichmentRequest, enrich_activity, enrich_batch
+from utils.enrichment_pipeline import enrich_activity_document, FINGERPRINT_FIELD
+from tests.fakes import FakeDatabase, install
+
+FIXTURES = ["bench-run-short", "bench-run-1h", "bench-virtualride-short", "bench-swim-short"]
+
+
+async def run_inline(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(enrichment, "run_cpu", run_inline)
+    monkeypatch.setattr(enrichment.result_cache, "RESULT_CACHE_BACKEND", "memory")
+    return install(monkeypatch, FakeDatabase())
+
+
+def user_activities(corpus, user_id="u1"):
+    docs = []
+    for name in FIXTURES:
+        doc = copy.deepcopy(corpus[name])
+        doc.update({"_id": ObjectId(), "userId": user_id, "stravaId": name})
+        docs.append(doc)
+    return docs
+
+
+def stored(doc, keep_id=True):
+    """Comparable form of a stored document: NaN-safe and without the write timestamp."""
+    doc = {k: v for k, v in doc.items() if k != "updatedAt" and (keep_id or k != "_id")}
+    return json.dumps(doc, sort_keys=True, default=str)
+
+
+def test_batch_stores_what_single_enrichment_stores(db, corpus, monkeypatch):
+    docs = user_activities(corpus)
+    db["stravaactivities"].docs = copy.deepcopy(docs)
+    ids = [str(d["_id"]) for d in docs]
+    for activity_id in ids:
+        assert asyncio.run(enrich_activity(EnrichmentRequest(activity_id=activity_id, user_id="u1")))["success"]
+    single = {str(d["_id"]): stored(d) for d in db["stravaactivities"].docs}
+    single_curves = sorted(stored(d, keep_id=False) for d in db["userbestcurves"].docs)
+    single_rollups = sorted(stored(d, keep_id=False) for d in db["kpiweeklyrollups"].docs)
+
+    batch_db = install(monkeypatch, FakeDatabase())
+    batch_db["stravaactivities"].docs = copy.deepcopy(docs)
+    result = asyncio.run(enrich_batch(BatchEnrichmentRequest(activity_ids=ids, user_id="u1")))
+    assert result["counts"] == {"enriched": len(ids)}
+    assert {str(d["_id"]): stored(d) for d in batch_db["stravaactivities"].docs} == single
+    assert sorted(stored(d, keep_id=False) for d in batch_db["userbestcurves"].docs) == single_curves
+    assert sorted(stored(d, keep_id=False) for d in batch_db["kpiweeklyrollups"].docs) == single_rollups
+    # One round trip per collection instead of one per activity
+    assert [c[0] for c in batch_db["stravaactivities"].calls].count("bulk_write") == 1
+
+
+def test_batch_reports_each_activity(db, corpus):
+    docs = user_activities(corpus)[:2]
+    weights = {"_id": ObjectId(), "userId": "u1", "type": "WeightTraining", "stravaId": "w"}
+    other_user = {**copy.deepcopy(docs[0]), "_id": ObjectId(), "userId": "u2"}
+    db["stravaactivities"].docs = copy.deepcopy(docs) + [weights, other_user]
+    ids = [str(docs[0]["_id"]), "not-an-id", str(weights["_id"]), str(other_user["_id"]), str(docs[1]["_id"]), str(docs[0]["_id"])]
+
+    result = asyncio.run(enrich_batch(BatchEnrichmentRequest(activity_ids=ids, user_id="u1")))
+    statuses = [(r["activity_id"], r["status"]) for r in result["results"]]
+    assert statuses == [
+        (ids[0], "enriched"), ("not-an-id", "error"), (ids[2], "skipped"), (ids[3], "not_found"), (ids[4], "enriched"),
+    ]
+    assert result["counts"] == {"enriched": 2, "error": 1, "skipped": 1, "not_found": 1}
+
+    # Fingerprints match now, so a second batch does nothing unless forced
+    again = asyncio.run(enrich_batch(BatchEnrichmentRequest(activity_ids=ids[:1], user_id="u1")))
+    assert again["results"][0]["status"] == "unchanged"
+    forced = asyncio.run(enrich_batch(BatchEnrichmentRequest(activity_ids=ids[:1], user_id="u1", force=True)))
+    assert forced["results"][0]["status"] == "enriched"
+
+
+def test_batch_limits(db):
+    with pytest.raises(enrichment.HTTPException) as empty:
+        asyncio.run(enrich_batch(BatchEnrichmentRequest(activity_ids=[], user_id="u1")))
+    assert empty.value.status_code == 400
+    ids = [str(ObjectId()) for _ in range(enrichment.ENRICH_BATCH_MAX + 1)]
+    with pytest.raises(enrichment.HTTPException) as too_many:
+        asyncio.run(enrich_batch(BatchEnrichmentRequest(activity_ids=ids, user_id="u1")))
+    assert too_many.value.status_code == 400
+
+
+def test_worker_failures_stay_per_activity(db, corpus, monkeypatch):
+    docs = user_activities(corpus)[:2]
+    db["stravaactivities"].docs = copy.deepcopy(docs)
+
+    async def flaky(fn, activity, **kwargs):
+        if activity["stravaId"] == FIXTURES[0]:
+            raise asyncio.TimeoutError()
+        return fn(activity, **kwargs)
+
+    monkeypatch.setattr(enrichment, "run_cpu", flaky)
+    ids = [str(d["_id"]) for d in docs]
+    result = asyncio.run(enrich_batch(BatchEnrichmentRequest(activity_ids=ids, user_id="u1")))
+    assert [(r["status"], r.get("reason")) for r in result["results"]] == [
+        ("error", "Enrichment timed out"), ("enriched", None),
+    ]
+
+
+def test_document_statuses(corpus):
+    short = {"type": "Run", "stream_data_full": {"time_sec": list(range(10)), "distance": list(range(10))}}
+    assert enrich_activity_document(short)["status"] == "skipped"
+    assert enrich_activity_document({"type": "WeightTraining"})["reason"] == "WeightTraining activity"
+
+    outcome = enrich_activity_document(copy.deepcopy(corpus["bench-run-short"]))
+    assert outcome["status"] == "enriched"
+    enriched = outcome["activity"]
+    assert enriched[FINGERPRINT_FIELD] and set(outcome["update"]["$set"]) <= set(enriched)
+    assert enrich_activity_document(enriched, skip_unchanged=True)["status"] == "unchanged"
@@ -0,0 +1,89 @@
+import copy
+import importlib
+import json
+
+import pytest
+from bson import ObjectId
+
+from mongo_utils import ACTIVITIES, USER_CURVES, KPI_ROLLUPS
+from utils import enrichment_pipeline as pipeline
+from utils.enrichment_pipeline import enrich_activity_document, enrichment_fingerprint, is_up_to_date, FINGERPRINT_FIELD
+from utils.stream_codec import encode_streams
+from tests.fakes import FakeDatabase, install
+
+
+def comparable(doc):
+    return json.dumps({k: v for k, v in doc.items() if k != "updatedAt"}, sort_keys=True, default=str)
+
+
+@pytest.fixture
+def enriched(corpus):
+    return enrich_activity_document(copy.deepcopy(corpus["bench-run-1h"]))["activity"]
+
+
+def test_skipping_is_safe_because_reenrichment_is_a_no_op(enriched):
+    assert is_up_to_date(enriched)
+    assert enrich_activity_document(copy.deepcopy(enriched), skip_unchanged=True)["status"] == "unchanged"
+
+    # What a forced rerun stores is exactly what is already there
+    again = enrich_activity_document(copy.deepcopy(enriched))
+    assert comparable(again["activity"]) == comparable(enriched)
+
+
+def test_stream_changes_invalidate(enriched):
+    changed = copy.deepcopy(enriched)
+    stream = encode_streams({"time_sec": list(range(60)), "distance": [i * 3.0 for i in range(60)]})
+    changed["stream_data_full"] = stream
+    assert not is_up_to_date(changed)
+    assert enrich_activity_document(changed, skip_unchanged=True)["status"] == "enriched"
+
+    assert not is_up_to_date({k: v for k, v in enriched.items() if k != FINGERPRINT_FIELD})
+
+
+def test_pipeline_changes_invalidate(enriched, monkeypatch):
+    before = enrichment_fingerprint(enriched)
+    monkeypatch.setattr(pipeline, "DETECTOR_VERSION", pipeline.DETECTOR_VERSION + 1)
+    assert enrichment_fingerprint(enriched)["pipeline"] != before["pipeline"]
+    assert enrichment_fingerprint(enriched)["streams"] == before["streams"]
+    monkeypatch.undo()
+
+    ride = pipeline.pipeline_version("Ride")
+    rules = copy.deepcopy(pipeline.rules_by_sport)
+    rules.setdefault("Run", {})["interval"] = {"min_duration_sec": 1}
+    monkeypatch.setattr(pipeline, "rules_by_sport", rules)
+    assert not is_up_to_date(enriched)
+    # Other sports keep their fingerprint
+    assert pipeline.pipeline_version("Ride") == ride
+    monkeypatch.undo()
+
+    monkeypatch.setattr(pipeline, "SEQUENCER_MODE", "optimal")
+    assert not is_up_to_date(enriched)
+
+
+def test_stream_fingerprint_formats():
+    streams = {"time_sec": [0, 1, 2], "heart_rate": [120, None, 121]}
+    assert pipeline.stream_fingerprint(streams) == pipeline.stream_fingerprint(dict(reversed(streams.items())))
+    assert pipeline.stream_fingerprint(encode_streams(streams)) == pipeline.stream_fingerprint(encode_streams(streams))
+    assert pipeline.stream_fingerprint([{"time_sec": 0}]) != pipeline.stream_fingerprint([{"time_sec": 1}])
+    assert pipeline.stream_fingerprint(None) == pipeline.stream_fingerprint(None)
+
+
+def test_rerun_script_skips_unchanged(monkeypatch, corpus):
+    db = install(monkeypatch, FakeDatabase())
+    rerun = importlib.import_module("scripts.rerun_enrichment")
+    for attr, name in (("collection", ACTIVITIES), ("user_curves_collection", USER_CURVES), ("rollups_collection", KPI_ROLLUPS)):
+        monkeypatch.setattr(rerun, attr, db[name])
+    db[ACTIVITIES].docs = [{**copy.deepcopy(corpus[name]), "_id": ObjectId(), "userId": "u1"}
+                           for name in ("bench-run-short", "bench-run-1h")]
+
+    rerun.rerun_enrichment(user_id="u1")
+    first = [comparable(d) for d in db[ACTIVITIES].docs]
+    writes = len([c for c in db[ACTIVITIES].calls if c[0] == "update_one"])
+    assert writes == 2
+
+    rerun.rerun_enrichment(user_id="u1")
+    assert len([c for c in db[ACTIVITIES].calls if c[0] == "update_one"]) == writes
+    assert [comparable(d) for d in db[ACTIVITIES].docs] == first
+
+    rerun.rerun_enrichment(user_id="u1", force=True)
+    assert len([c for c in db[ACTIVITIES].calls if c[0] == "update_one"]) == writes + 2
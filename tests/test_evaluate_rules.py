@@ -0,0 +1,110 @@
+import contextlib
+import copy
+import io
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from scripts import evaluate_rules as ev
+from utils.enrichment_pipeline import enrich_activity_document
+from utils.fit_engine.segment_aligner import align_planned_to_detected, compatible_type_cost
+from utils.segment_detection_rules import rules_by_sport
+
+LEGACY = json.loads((Path(__file__).resolve().parent / "golden" / "legacy_segments.json").read_text())
+
+FIT_FILE = Path(__file__).resolve().parent.parent / "fit_data" / "Run" / "2024-11-28-17-14-50.fit"
+PLAN = [
+    {"type": "warmup", "duration_sec": 600},
+    {"type": "steady", "duration_sec": 1200},
+    {"type": "interval", "duration_sec": 120},
+    {"type": "recovery", "duration_sec": 90},
+    {"type": "cooldown", "duration_sec": 300},
+]
+
+
+def followed_plan(name):
+    """A plan matching what was detected in the fixture, plus the generic PLAN blocks."""
+    return [{"type": t, "duration_sec": d} for t, _, _, d in LEGACY[name]["sequence"]] + PLAN
+
+
+def entry_for(doc, planned=PLAN):
+    return {"sport": doc["type"], "streams": doc["stream_data_full"], "planned_blocks": planned}
+
+
+def quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+@pytest.mark.parametrize("name", ["bench-run-1h", "bench-run-6h", "bench-virtualride-1h", "bench-run-short", "bench-swim-short"])
+def test_evaluate_entry_matches_enrichment_then_alignment(corpus, name):
+    """The fit_align_runner path: enrich the activity, then align the plan with its segmentSequence."""
+    doc = corpus[name]
+    enriched = quiet(enrich_activity_document, copy.deepcopy(doc))
+    sequence = enriched["activity"]["segmentSequence"] if enriched["status"] == "enriched" else []
+    planned = followed_plan(name)
+    expected = align_planned_to_detected(planned, sequence)
+
+    result = quiet(ev.evaluate_entry, entry_for(doc, planned))
+    assert result["alignment"] == expected
+    assert quiet(ev.evaluate_entry, entry_for(doc, planned), rules=rules_by_sport) == result
+
+
+def test_candidate_rules_change_the_result(corpus, tmp_path):
+    doc = corpus["bench-run-6h"]
+    planned = followed_plan("bench-run-6h")[:-len(PLAN)]
+    baseline = quiet(ev.evaluate_entry, entry_for(doc, planned))
+    assert ev.summarize(baseline["alignment"])["matched"] > 0
+
+    candidate = copy.deepcopy(rules_by_sport)
+    # A much longer warmup and no acceleration blocks
+    candidate["Run"]["warmup"]["fraction"] = 0.5
+    candidate["Run"]["acceleration"]["delta_threshold_std"] = 100
+    json_path = tmp_path / "rules.json"
+    json_path.write_text(json.dumps({"rules_by_sport": candidate}))
+    py_path = tmp_path / "rules.py"
+    py_path.write_text(f"rules_by_sport = {candidate!r}\n")
+    assert ev.load_rules(json_path) == ev.load_rules(py_path) == candidate
+    assert ev.load_rules(None) is None
+
+    strict = quiet(ev.evaluate_entry, entry_for(doc, planned), rules=ev.load_rules(json_path))
+    assert ev.summarize(strict["alignment"])["matched"] < ev.summarize(baseline["alignment"])["matched"]
+
+
+def test_build_report_aggregates_by_sport_and_type(corpus):
+    results = []
+    for name in ("bench-run-1h", "bench-virtualride-1h"):
+        entry = entry_for(corpus[name])
+        results.append((name, entry["sport"], quiet(ev.evaluate_entry, entry, type_cost=compatible_type_cost), None))
+    results.append(("broken.fit", "Run", None, "ValueError('bad file')"))
+
+    report = ev.build_report(results)
+    rows = [row for _, _, aligned, error in results if not error for row in aligned["alignment"]]
+    assert report["files"] == 2
+    assert report["overall"]["planned"] == len(rows) == 2 * len(PLAN)
+    assert report["overall"]["matched"] == sum(r["matched"] for r in rows)
+    assert sum(s["planned"] for s in report["by_sport"].values()) == len(rows)
+    assert set(report["by_planned_type"]) == {b["type"] for b in PLAN}
+    assert report["failures"] == [{"file": "broken.fit", "error": "ValueError('bad file')"}]
+    assert ev.build_report([])["overall"] == {"planned": 0, "matched": 0, "match_rate": 0, "avg_iou": 0, "avg_cost": 0}
+
+
+def test_corpus_cache_decodes_only_new_files(tmp_path):
+    folder, cache = tmp_path / "fit_data", tmp_path / "cache" / "corpus.pkl"
+    (folder / "Run").mkdir(parents=True)
+    shutil.copy(FIT_FILE, folder / "Run" / FIT_FILE.name)
+
+    corpus = quiet(ev.load_corpus, folder, cache, workers=1)
+    entry = corpus[f"Run/{FIT_FILE.name}"]
+    assert entry["sport"] == "Run" and entry["planned_blocks"] and len(entry["streams"]["time_sec"]) > 100
+    direct = ev.parse_fit_entry(FIT_FILE)
+    assert entry["planned_blocks"] == direct["planned_blocks"]
+
+    # Unchanged files come from the cache without a decode pool
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        again = ev.load_corpus(folder, cache, workers=1)
+    assert "Decoding" not in out.getvalue()
+    assert again.keys() == corpus.keys()
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import executors
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """Thread pools in place of the spawned workers; restored afterwards."""
+    monkeypatch.setattr(executors, "_process_pool", ThreadPoolExecutor(max_workers=2))
+    monkeypatch.setattr(executors, "_thread_pool", ThreadPoolExecutor(max_workers=2))
+    monkeypatch.setattr(executors, "_cpu_slots", None)
+    monkeypatch.setattr(executors, "_cpu_waiting", 0)
+    yield
+    executors._process_pool.shutdown()
+    executors._thread_pool.shutdown()
+
+
+def test_run_db_starts_only_the_thread_pool(monkeypatch):
+    monkeypatch.setattr(executors, "_process_pool", None)
+    monkeypatch.setattr(executors, "_thread_pool", None)
+    monkeypatch.setattr(executors, "start_executors", lambda *a, **k: pytest.fail("process pool started"))
+
+    assert asyncio.run(executors.run_db(sum, [1, 2, 3])) == 6
+    assert executors._process_pool is None
+    executors._thread_pool.shutdown()
+
+
+def test_run_cpu_starts_pool_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(executors, "_process_pool", None)
+    monkeypatch.setattr(executors, "_cpu_slots", None)
+
+    def slow_start():
+        time.sleep(0.3)  # stands in for spawning and warming the workers
+        executors._process_pool = ThreadPoolExecutor(max_workers=1)
+
+    monkeypatch.setattr(executors, "start_executors", slow_start)
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.ensure_future(ticker())
+        result = await executors.run_cpu(max, 4, 7)
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(main())
+    assert result == 7
+    assert ticks > 5
+    executors._process_pool.shutdown()
+
+
+def test_run_cpu_sheds_load_when_waiting_is_full(pools, monkeypatch):
+    monkeypatch.setattr(executors, "ENRICH_QUEUE_DEPTH", 1)
+    monkeypatch.setattr(executors, "ENRICH_MAX_WAITING", 1)
+
+    async def main():
+        return await asyncio.gather(
+            *(executors.run_cpu(time.sleep, 0.1) for _ in range(4)),
+            return_exceptions=True
+        )
+
+    outcomes = asyncio.run(main())
+    # One running, one waiting, the rest rejected
+    assert outcomes[:2] == [None, None]
+    assert all(isinstance(o, executors.CpuPoolBusy) for o in outcomes[2:])
+    assert executors._cpu_waiting == 0
+
+
+def test_run_cpu_releases_slot_on_timeout(pools, monkeypatch):
+    monkeypatch.setattr(executors, "ENRICH_QUEUE_DEPTH", 1)
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await executors.run_cpu(time.sleep, 0.3, timeout=0.05)
+        return await executors.run_cpu(max, 1, 2, timeout=1)
+
+    assert asyncio.run(main()) == 2
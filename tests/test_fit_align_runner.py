@@ -0,0 +1,165 @@
+import json
+import re
+import subprocess
+import sys
+import types
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from fitparse import FitFile
+
+from scripts import fit_align_runner
+from utils.fit_engine.fit_parser import read_fit_file, map_detailed_intensity_to_type
+
+ROOT = Path(__file__).resolve().parent.parent
+# Recorded activities with and without a workout, planned-only workouts (no session message) and one per sport
+FIT_FILES = [ROOT / "fit_data" / name for name in (
+    "Run/2024-02-29-08-23-56.fit",
+    "Run/2023-12-26-15-59-27.fit",
+    "Run/2025-06-03-rcruise-intervals1.fit",
+    "Run/2025-03-11-rcruise-intervals12.fit",
+    "Swim/2023-12-21-07-43-01.fit",
+    "VirtualRide/FIT files/2025-06-04-cspeed-play8.fit",
+    "VirtualRide/FIT files/2024-08-16-10-31-47.fit",
+)]
+
+
+def legacy_parse_fit_schedule(fitfile):
+    """The schedule parser before read_fit_file, reading each step through get_value()."""
+    steps = list(fitfile.get_messages("workout_step"))
+    blocks = []
+    warmup_count = 0
+    i = 0
+    while i < len(steps):
+        msg = steps[i]
+        intensity = msg.get_value("intensity")
+        duration_type = msg.get_value("duration_type")
+        duration_value = msg.get_value("duration_value")
+        if duration_type != "time" or duration_value is None:
+            i += 1
+            continue
+        duration_sec = int(duration_value)
+        block_type = map_detailed_intensity_to_type(intensity, duration_sec)
+        if block_type == "warmup":
+            warmup_count += 1
+            if warmup_count > 1:
+                block_type = "cooldown"
+        repeat_count = msg.get_value("repeat_count")
+        if repeat_count and repeat_count > 1:
+            recovery_step = steps[i + 1] if i + 1 < len(steps) else None
+            recovery_duration = None
+            if recovery_step:
+                if recovery_step.get_value("duration_type") == "time" and recovery_step.get_value("intensity") == "rest":
+                    recovery_duration = int(recovery_step.get_value("duration_value"))
+            blocks.append({"type": block_type, "duration_sec": duration_sec, "repeat": repeat_count, "recovery_sec": recovery_duration})
+            i += 2
+        else:
+            blocks.append({"type": block_type, "duration_sec": duration_sec})
+            i += 1
+    return blocks
+
+
+def legacy_start_time_and_type(fitfile):
+    for msg in fitfile.get_messages("session"):
+        ts, sport = msg.get_value("start_time"), msg.get_value("sport")
+        if isinstance(ts, datetime):
+            return ts, sport
+    for msg in fitfile.get_messages("workout"):
+        name, sport = msg.get_value("wkt_name"), msg.get_value("sport")
+        if isinstance(name, str):
+            match = re.search(r"\d{4}-\d{2}-\d{2}", name)
+            if match:
+                return datetime.strptime(match.group(0), "%Y-%m-%d").replace(hour=12), sport
+    return None, None
+
+
+@pytest.mark.parametrize("fit_path", FIT_FILES, ids=lambda p: p.name)
+def test_single_pass_matches_the_per_message_passes(fit_path):
+    fit = read_fit_file(fit_path)
+    fitfile = FitFile(str(fit_path))
+    assert fit["planned_blocks"] == legacy_parse_fit_schedule(fitfile)
+    assert (fit["start_time"], fit["sport"]) == legacy_start_time_and_type(FitFile(str(fit_path)))
+
+
+def test_importing_the_runner_does_not_connect_to_mongo():
+    code = "import sys, scripts.fit_align_runner; print('scripts.rerun_enrichment' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
+
+
+class InlinePool(ThreadPoolExecutor):
+    def __init__(self, max_workers=None, mp_context=None):
+        super().__init__(max_workers=1)
+
+
+def runner_folder(tmp_path):
+    for path in FIT_FILES[:2] + FIT_FILES[4:5]:
+        target = tmp_path / "fit" / path.parent.name / path.name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(path.read_bytes())
+    return tmp_path / "fit"
+
+
+def fake_align(fit_path, sport_type, user_id, compatible_types=False):
+    name = Path(fit_path).name
+    if name == FIT_FILES[1].name:
+        return {"file": fit_path, "status": "skipped", "reason": "No activity match found"}
+    if sport_type == "Swim":
+        raise RuntimeError("boom")
+    fit = read_fit_file(fit_path)
+    return {"file": fit_path, "status": "aligned", "entry": {
+        "file": name, "sport_type": sport_type, "planned_blocks": fit["planned_blocks"],
+        "score": {"matched": 0, "planned_total": len(fit["planned_blocks"])},
+    }}
+
+
+def test_rerun_rewrites_the_output(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(fit_align_runner, "USER_ID", "u1")
+    monkeypatch.setattr(fit_align_runner, "ProcessPoolExecutor", InlinePool)
+    monkeypatch.setattr(fit_align_runner, "align_fit_file", fake_align)
+    folder, output = runner_folder(tmp_path), tmp_path / "out" / "results.jsonl"
+
+    first = fit_align_runner.run_fit_alignment(str(folder), str(output))
+    lines = output.read_text().splitlines()
+    assert [json.loads(line) for line in lines] == first
+    assert [entry["file"] for entry in first] == [FIT_FILES[0].name]
+    assert "1 aligned, 1 skipped, 1 failed" in capsys.readouterr().out
+
+    fit_align_runner.run_fit_alignment(str(folder), str(output))
+    assert output.read_text().splitlines() == lines
+
+
+def test_empty_folder_and_missing_user(monkeypatch, tmp_path):
+    assert fit_align_runner.run_fit_alignment(str(tmp_path), str(tmp_path / "out.jsonl")) is None
+    assert not (tmp_path / "out.jsonl").exists()
+
+    monkeypatch.setattr(fit_align_runner, "USER_ID", None)
+    with pytest.raises(ValueError):
+        fit_align_runner.run_fit_alignment(str(runner_folder(tmp_path)), str(tmp_path / "out.jsonl"))
+
+
+def test_align_fit_file_outcomes(monkeypatch, enriched_corpus):
+    fit_path = str(FIT_FILES[0])
+    activity = enriched_corpus["bench-run-1h"]
+    enrichment = types.ModuleType("scripts.rerun_enrichment")
+    enrichment.enrich_activity_by_id = lambda activity_id, force=False: activity
+    monkeypatch.setitem(sys.modules, "scripts.rerun_enrichment", enrichment)
+
+    monkeypatch.setattr(fit_align_runner, "match_fit_to_activity", lambda *args, **kwargs: None)
+    assert fit_align_runner.align_fit_file(fit_path, "Run", "u1")["reason"] == "No activity match found"
+
+    monkeypatch.setattr(fit_align_runner, "match_fit_to_activity", lambda *args, **kwargs: activity)
+    outcome = fit_align_runner.align_fit_file(fit_path, "Run", "u1")
+    assert outcome["status"] == "aligned"
+    entry = outcome["entry"]
+    assert entry["planned_blocks"] == read_fit_file(fit_path)["planned_blocks"]
+    assert entry["matched_segments"] == activity["segmentSequence"]
+    assert entry["score"] == fit_align_runner.score_segment_accuracy(entry["alignment"])
+
+    enrichment.enrich_activity_by_id = lambda activity_id, force=False: {**activity, "segments": []}
+    assert fit_align_runner.process_fit_file(fit_path, "Run", "u1", False, False)["status"] == "skipped"
+    enrichment.enrich_activity_by_id = lambda activity_id, force=False: 1 / 0
+    failed = fit_align_runner.process_fit_file(fit_path, "Run", "u1", False, False)
+    assert failed["status"] == "failed" and "ZeroDivisionError" in failed["reason"]
@@ -0,0 +1,191 @@
+import asyncio
+import copy
+import importlib
+import math
+import pickle
+from datetime import timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo import UpdateMany, UpdateOne
+
+from benchmarks.run_suite import kpi_history
+from mongo_utils import ACTIVITIES, KPI_ROLLUPS, KPI_ROLLUP_STATUS
+from routes import segment_analysis
+from routes.segment_analysis import TrendAnalysisRequest, compute_trends_response
+from utils.kpi_rollup import build_rollup_cleanup, build_rollup_update, trends_from_rollups, week_key
+from utils.segment_kpis import compute_kpi_trends_with_sessions
+from tests.fakes import FakeDatabase, install
+
+# 2024-01-01 is a Monday and %U weeks start on Sunday, so these cover partial,
+# whole, single-week and Sunday-aligned ranges
+REQUESTS = [
+    {},
+    {"activity_type": "Run"},
+    {"start_date": "2024-01-10", "end_date": "2024-02-06T12:00:00"},
+    {"start_date": "2024-01-07", "end_date": "2024-01-27T23:59:59"},
+    {"start_date": "2024-01-15", "end_date": "2024-01-19"},
+    {"start_date": "2024-01-22"},
+    {"end_date": "2024-01-20", "activity_type": "VirtualRide"},
+]
+
+
+def history(enriched_corpus, weeks=6):
+    return [
+        {**activity, "_id": ObjectId(), "userId": "u1", "stravaId": activity["_id"]}
+        for activity in kpi_history(list(enriched_corpus.values()), weeks)
+    ]
+
+
+def assert_close(result, expected):
+    if isinstance(expected, dict):
+        assert result.keys() == expected.keys()
+        for key in expected:
+            assert_close(result[key], expected[key])
+    elif isinstance(expected, list):
+        assert len(result) == len(expected)
+        for a, b in zip(result, expected):
+            assert_close(a, b)
+    elif isinstance(expected, float):
+        assert result == pytest.approx(expected, rel=1e-9, abs=1e-12) or (math.isnan(result) and math.isnan(expected))
+    else:
+        assert result == expected
+
+
+@pytest.fixture
+def db(monkeypatch, enriched_corpus):
+    db = install(monkeypatch, FakeDatabase())
+    db[ACTIVITIES].docs = history(enriched_corpus)
+    return db
+
+
+@pytest.fixture
+def cpu_calls(monkeypatch):
+    calls = []
+
+    async def run_inline(fn, *args, **kwargs):
+        pickle.dumps((fn, args, kwargs))
+        calls.append(fn)
+        return fn(*args, **kwargs)
+
+    monkeypatch.setattr(segment_analysis, "run_cpu", run_inline)
+    return calls
+
+
+def rebuild(monkeypatch, db, user_id=None):
+    script = importlib.import_module("scripts.rebuild_kpi_rollups")
+    for attr, name in (("collection", ACTIVITIES), ("rollups_collection", KPI_ROLLUPS), ("status_collection", KPI_ROLLUP_STATUS)):
+        monkeypatch.setattr(script, attr, db[name])
+    script.rebuild_kpi_rollups(user_id=user_id, batch_size=7)
+
+
+def trends(monkeypatch, params, use_rollups):
+    monkeypatch.setattr(segment_analysis, "USE_KPI_ROLLUPS", use_rollups)
+    return asyncio.run(compute_trends_response(TrendAnalysisRequest(user_id="u1", **params)))
+
+
+@pytest.mark.parametrize("params", REQUESTS)
+def test_rollup_trends_match_raw_trends(monkeypatch, db, cpu_calls, params):
+    rebuild(monkeypatch, db)
+    raw = trends(monkeypatch, params, use_rollups=False)
+    assert raw["data"]
+
+    cpu_calls.clear()
+    assert_close(trends(monkeypatch, params, use_rollups=True), raw)
+    # Rollups and boundary activities are read on the DB pool; only the sums go to the worker
+    assert cpu_calls == [trends_from_rollups]
+
+
+def test_incremental_rollups_without_a_rebuild_are_not_trusted(monkeypatch, db, cpu_calls):
+    # Enrichment wrote rollup entries for two weeks only; every other week is missing
+    for activity in db[ACTIVITIES].docs[:18]:
+        filter_, update = build_rollup_update(activity)
+        db[KPI_ROLLUPS].update_one(filter_, update, upsert=True)
+    assert db[KPI_ROLLUPS].docs and not db[KPI_ROLLUP_STATUS].docs
+
+    raw = trends(monkeypatch, {}, use_rollups=False)
+    cpu_calls.clear()
+    assert trends(monkeypatch, {}, use_rollups=True) == raw
+    assert cpu_calls == [compute_kpi_trends_with_sessions]
+
+
+def test_rebuild_marks_users_and_enrichment_keeps_rollups_current(monkeypatch, db, enriched_corpus, cpu_calls):
+    other = {**copy.deepcopy(db[ACTIVITIES].docs[0]), "_id": ObjectId(), "userId": "u2"}
+    db[ACTIVITIES].docs.append(other)
+    rebuild(monkeypatch, db)
+    assert {doc["_id"] for doc in db[KPI_ROLLUP_STATUS].docs} == {"u1", "u2"}
+
+    # An interrupted single-user rebuild leaves that user unmarked
+    script = importlib.import_module("scripts.rebuild_kpi_rollups")
+    monkeypatch.setattr(script, "build_rollup_update", lambda activity: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        script.rebuild_kpi_rollups(user_id="u1")
+    assert [doc["_id"] for doc in db[KPI_ROLLUP_STATUS].docs] == ["u2"]
+    monkeypatch.setattr(script, "build_rollup_update", build_rollup_update)
+    rebuild(monkeypatch, db, user_id="u1")
+
+    # Re-enriching one activity with different segments updates only its entry
+    activity = db[ACTIVITIES].docs[3]
+    activity["segments"] = activity["segments"][:1]
+    filter_, update = build_rollup_update(activity)
+    db[KPI_ROLLUPS].update_one(filter_, update, upsert=True)
+    params = REQUESTS[2]
+    assert_close(trends(monkeypatch, params, use_rollups=True), trends(monkeypatch, params, use_rollups=False))
+
+
+def write_rollup(db, activity):
+    """The rollup writes enrichment makes for one activity, as one unordered bulk_write."""
+    requests = [UpdateMany(*build_rollup_cleanup(activity)), UpdateOne(*build_rollup_update(activity), upsert=True)]
+    db[KPI_ROLLUPS].bulk_write(requests, ordered=False)
+
+
+def entry_count(db, activity):
+    key = str(activity["_id"])
+    return sum(key in (doc.get("activities") or {}) for doc in db[KPI_ROLLUPS].docs)
+
+
+def sessions_by_week(response):
+    """Which activities each week's trends count. Values are left out: the history repeats identical
+    weeks, so min-max normalization turns last-bit differences between the two paths into 0.5 vs 1.0."""
+    return {(row["metric"], row["week"]): [s["activity_id"] for s in row["sessions"]] for row in response["data"]}
+
+
+def test_moved_activities_leave_their_old_rollup(monkeypatch, db, cpu_calls):
+    rebuild(monkeypatch, db)
+    moved, retyped = db[ACTIVITIES].docs[2], db[ACTIVITIES].docs[5]
+    old_week = week_key(moved["startDate"])
+    moved["startDate"] += timedelta(days=15, hours=1)  # two weeks on, and no same-time tie with another session
+    retyped["type"] = "VirtualRide" if retyped["type"] != "VirtualRide" else "Run"
+    # Activities are stored in date order, which raw trends keep for a week's sessions
+    db[ACTIVITIES].docs.sort(key=lambda doc: doc["startDate"])
+    for activity in (moved, retyped):
+        write_rollup(db, activity)
+        assert entry_count(db, activity) == 1
+
+    # Re-writing an unchanged activity keeps its single entry
+    write_rollup(db, moved)
+    assert entry_count(db, moved) == 1
+    for params in REQUESTS:
+        rollup_sessions = sessions_by_week(trends(monkeypatch, params, use_rollups=True))
+        assert rollup_sessions == sessions_by_week(trends(monkeypatch, params, use_rollups=False))
+    # Every week holds one copy of each corpus activity; the moved one now counts once, in its new week
+    all_sessions = sessions_by_week(trends(monkeypatch, {}, use_rollups=True))
+    counts = {week: ids.count(moved["stravaId"]) for (metric, week), ids in all_sessions.items()}
+    assert counts[old_week] == 0 and counts[week_key(moved["startDate"])] == 2
+
+
+def test_deleted_activities_need_a_rebuild(monkeypatch, db, cpu_calls):
+    rebuild(monkeypatch, db)
+    deleted = db[ACTIVITIES].docs.pop(4)
+    assert entry_count(db, deleted) == 1
+    rebuild(monkeypatch, db)
+    assert entry_count(db, deleted) == 0
+    rollup_sessions = sessions_by_week(trends(monkeypatch, {}, use_rollups=True))
+    assert rollup_sessions == sessions_by_week(trends(monkeypatch, {}, use_rollups=False))
+    assert build_rollup_cleanup({"startDate": "2024-01-01"}) is None
+
+
+def test_empty_rollups(monkeypatch, db, cpu_calls):
+    rebuild(monkeypatch, db)
+    assert trends(monkeypatch, {"start_date": "2030-01-01"}, use_rollups=True) == {"version": "v1", "data": []}
+    assert trends_from_rollups([]) == (0, [])
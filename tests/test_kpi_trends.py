@@ -0,0 +1,60 @@
+import contextlib
+import copy
+import io
+from datetime import datetime
+
+import pytest
+
+from benchmarks.bench_kpi_trends import legacy_compute_kpi_trends_with_sessions, synthetic_history
+from benchmarks.run_suite import kpi_history
+from utils.segment_kpis import compute_kpi_trends_with_sessions
+
+CASES = [
+    {},
+    {"activity_type": "Run"},
+    {"start_date": "2024-01-10", "end_date": "2024-02-06T12:00:00"},
+    {"activity_type": "VirtualRide", "end_date": "2024-01-20"},
+]
+
+
+def both(activities, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        legacy = legacy_compute_kpi_trends_with_sessions(copy.deepcopy(activities), **kwargs)
+    return compute_kpi_trends_with_sessions(copy.deepcopy(activities), **kwargs), legacy
+
+
+@pytest.mark.parametrize("kwargs", CASES)
+def test_corpus_history_matches_legacy(enriched_corpus, kwargs):
+    activities = kpi_history(list(enriched_corpus.values()), 6)
+    result, legacy = both(activities, **kwargs)
+    assert result
+    # repr keeps NaN == NaN and float bits exact, as benchmarks/bench_kpi_trends.py checks
+    assert repr(result) == repr(legacy)
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"activity_type": "Run", "start_date": "2019-06-01", "end_date": "2020-06-01"}])
+def test_synthetic_history_matches_legacy(kwargs):
+    result, legacy = both(synthetic_history(400), **kwargs)
+    assert repr(result) == repr(legacy)
+
+
+def test_sparse_weeks_match_legacy():
+    start = datetime(2024, 3, 4, 7)
+    activities = [
+        # One segment: no pace spread, no completion variance
+        {"_id": 1, "type": "Run", "name": "a", "startDate": start, "segments": [{"avg_speed": 3.0, "duration_sec": 60}]},
+        # Every KPI field missing or zero
+        {"_id": 2, "type": "Run", "name": "b", "startDate": start.isoformat(), "segments": [{"duration_sec": 0, "avg_distance": 0}]},
+        {"_id": 3, "type": "Run", "name": "c", "startDate": datetime(2024, 3, 20), "segments": []},
+        {"_id": 4, "type": "Ride", "name": "d", "startDate": datetime(2024, 3, 21), "segments": [
+            {"avg_watts": 250.0, "duration_sec": 120, "avg_heart_rate": 150, "avg_distance": 900, "zone_match_score": 0.0},
+            {"avg_watts": None, "duration_sec": 900, "avg_speed": -1.0, "hr_drift_ratio": 1.05},
+        ]},
+    ]
+    result, legacy = both(activities)
+    assert repr(result) == repr(legacy)
+
+
+def test_empty_input():
+    assert both([]) == ([], [])
+    assert both(iter([]), activity_type="Run") == ([], [])
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.enrichment_helpers import (
+    MEAN_MAX_DURATIONS,
+    parse_streams,
+    resample_to_seconds,
+    mean_max_curve,
+    extract_mean_max_curves,
+    merge_mean_max_curves,
+    build_user_curve_update,
+)
+
+
+def rolling_reference(values, durations):
+    """Best window mean per duration, the slow way."""
+    series = pd.Series(values, dtype=float)
+    return [
+        None if d > len(series) else round(float(series.rolling(d).mean().max()), 3)
+        for d in durations
+    ]
+
+
+@pytest.mark.parametrize("name,channel", [
+    ("bench-virtualride-short", "watts"),
+    ("bench-virtualride-1h", "watts"),
+    ("bench-run-1h", "speed"),
+])
+def test_prefix_sum_curve_matches_rolling_means(corpus, capsys, name, channel):
+    doc = corpus[name]
+    df = parse_streams(doc)
+    curves = extract_mean_max_curves(df, doc)
+    values = resample_to_seconds(df["time_sec"], df[channel])
+
+    assert curves["durations_sec"] == MEAN_MAX_DURATIONS
+    assert curves[channel] == pytest.approx(rolling_reference(values, MEAN_MAX_DURATIONS), abs=1e-3)
+
+
+def test_resample_fills_short_gaps_and_zeroes_pauses():
+    time_sec = [0, 1, 3, 20, 21]
+    watts = [100, 200, 300, 400, np.nan]
+    assert resample_to_seconds(time_sec, watts, max_gap=10).tolist() == (
+        [100, 200, 200] + [300] * 11 + [0] * 6 + [400, 0]
+    )
+    assert resample_to_seconds([], []).size == 0
+
+
+def test_durations_longer_than_the_stream_are_none():
+    assert mean_max_curve([1.0, 3.0, 2.0], durations=[1, 2, 3, 4]) == [3.0, 2.5, 2.0, None]
+    assert mean_max_curve([], durations=[1]) == [None]
+
+
+def test_no_curve_without_a_supported_channel():
+    df = pd.DataFrame({"time_sec": [0, 1, 2], "heart_rate": [120, 121, 122]})
+    assert extract_mean_max_curves(df, {"type": "Swim"}) is None
+    assert extract_mean_max_curves(df, {"type": "Ride"}) is None
+
+
+def test_merge_and_user_update():
+    a = {"durations_sec": [1, 5], "watts": [400.0, None]}
+    b = {"durations_sec": [1, 5], "watts": [350.0, 300.0]}
+    assert merge_mean_max_curves(None, a) == a
+    assert merge_mean_max_curves(merge_mean_max_curves(None, a), b) == {"durations_sec": [1, 5], "watts": [400.0, 300.0]}
+    assert merge_mean_max_curves(b, None) == b
+
+    assert build_user_curve_update(a) == {"$max": {"watts.1": 400.0}, "$set": {"durations_sec": [1, 5]}}
+    assert build_user_curve_update({"durations_sec": [1], "watts": [None]}) is None
+    assert build_user_curve_update(None) is None
@@ -0,0 +1,79 @@
+import asyncio
+import importlib
+from types import SimpleNamespace
+
+import pytest
+
+import mongo_utils as mongo
+from tests.fakes import FakeDatabase, install
+
+
+@pytest.fixture
+def fresh_client(monkeypatch):
+    """A module state with no client yet; whatever connect() creates is closed afterwards."""
+    monkeypatch.setattr(mongo, "_client", None)
+    monkeypatch.setattr(mongo, "_async_client", None)
+    monkeypatch.setattr(mongo, "MONGO_ASYNC_DRIVER", "threads")
+    yield
+    if mongo._client is not None:
+        mongo._client.close()
+
+
+@pytest.mark.parametrize("url", [None, "", "http://localhost:27017"])
+def test_connect_rejects_invalid_url(monkeypatch, fresh_client, url):
+    monkeypatch.setattr(mongo, "MONGO_URL", url)
+    with pytest.raises(RuntimeError, match="MONGO_URL"):
+        mongo.connect()
+
+
+def test_one_client_per_process(monkeypatch, fresh_client):
+    # MongoClient connects lazily, so no server is needed to check the wiring
+    monkeypatch.setattr(mongo, "MONGO_URL", "mongodb://localhost:1")
+    client = mongo.connect()
+    assert mongo.connect() is client
+    assert mongo.get_client() is client
+    assert mongo.get_db_connection().client is client
+    assert mongo.get_collection("x").database.client is client
+    assert client.options.pool_options.max_pool_size == mongo.MONGO_CLIENT_OPTIONS["maxPoolSize"]
+    assert mongo.get_async_collection("x") is None
+    assert mongo.connection_stats()["driver"] == "pymongo"
+
+    mongo.close()
+    assert mongo._client is None
+
+
+def test_modules_do_not_open_their_own_clients(monkeypatch):
+    created = []
+    monkeypatch.setattr("pymongo.MongoClient.__init__", lambda self, *a, **k: created.append(a))
+    for name in ("routes.enrichment", "routes.prediction", "routes.segment_analysis"):
+        importlib.reload(importlib.import_module(name))
+    assert created == []
+
+
+def test_pool_stats_counters():
+    stats = mongo.PoolStats()
+    event = SimpleNamespace()
+    for _ in range(3):
+        stats.connection_created(event)
+        stats.connection_checked_out(event)
+    stats.connection_checked_in(event)
+    stats.connection_closed(event)
+    stats.connection_check_out_failed(event)
+    stats.pool_cleared(event)
+    snapshot = stats.snapshot()
+    assert snapshot["open"] == 2 and snapshot["in_use"] == 2
+    assert snapshot["checkout_failed"] == 1 and snapshot["pools_cleared"] == 1
+
+
+def test_async_helpers_match_direct_calls(monkeypatch, corpus):
+    db = install(monkeypatch, FakeDatabase())
+    db[mongo.ACTIVITIES].docs = [{**doc, "userId": "u1"} for doc in corpus.values()]
+    collection = db[mongo.ACTIVITIES]
+    query, projection = {"type": "Run"}, {"name": 1}
+
+    assert asyncio.run(mongo.find_all(mongo.ACTIVITIES, query, projection)) == list(collection.find(query, projection))
+    assert asyncio.run(mongo.find_one(mongo.ACTIVITIES, query)) == collection.find_one(query)
+
+    result = asyncio.run(mongo.update_one(mongo.ACTIVITIES, {"_id": "bench-run-1h"}, {"$set": {"enriched": True}}))
+    assert result.modified_count == 1
+    assert collection.find_one({"enriched": True})["_id"] == "bench-run-1h"
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.bench_parse_streams import legacy_parse_stream_frame, synthetic_ride
+from utils.enrichment_helpers import DERIVED_FEATURES, parse_streams
+from utils.stream_codec import decode_streams, encode_streams
+
+RIDES = ["bench-virtualride-short", "bench-virtualride-1h", "bench-virtualride-6h"]
+# pandas rolling sums drift by ~1e-12 over long rides; the rewrite is exact up to that noise
+
+
+@pytest.mark.parametrize("name", RIDES)
+def test_all_features_match_legacy_parser(corpus, name):
+    streams = corpus[name]["stream_data_full"]
+    legacy = legacy_parse_stream_frame(streams)
+    parsed = parse_streams(corpus[name], features="all")
+    pd.testing.assert_frame_equal(parsed, legacy, check_exact=False, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("name", RIDES)
+def test_default_features_are_a_subset_of_legacy(corpus, name):
+    legacy = legacy_parse_stream_frame(corpus[name]["stream_data_full"])
+    parsed = parse_streams(corpus[name])
+    derived = [c for c in parsed.columns if c.startswith(("delta_", "rolling_"))]
+    expected = (
+        [f"delta_{c}" for c in DERIVED_FEATURES["delta"]]
+        + [f"rolling_{c}_mean" for c in DERIVED_FEATURES["rolling_mean"]]
+        + [f"rolling_{c}_trend" for c in DERIVED_FEATURES["rolling_trend"]]
+    )
+    assert sorted(derived) == sorted(c for c in expected if c in legacy.columns)
+    pd.testing.assert_frame_equal(parsed, legacy[parsed.columns], check_exact=False, rtol=1e-9, atol=1e-9)
+
+
+def test_gaps_in_watts_are_dropped_like_legacy():
+    streams = synthetic_ride(0.25)
+    streams["watts"][10:20] = [None] * 10
+    legacy = legacy_parse_stream_frame(streams)
+    parsed = parse_streams({"stream_data_full": streams}, features="all")
+    assert len(parsed) == len(streams["time_sec"]) - 10
+    pd.testing.assert_frame_equal(parsed, legacy, check_exact=False, rtol=1e-9, atol=1e-9)
+
+
+def test_streams_without_watts_keep_every_row(corpus):
+    doc = corpus["bench-run-1h"]
+    parsed = parse_streams(doc)
+    assert len(parsed) == len(doc["stream_data_full"]["time_sec"])
+    assert "rolling_speed_mean" in parsed and "rolling_watts_trend" not in parsed
+
+
+def test_encoded_streams_parse_like_their_decoded_lists(corpus):
+    encoded = encode_streams(corpus["bench-virtualride-1h"]["stream_data_full"])
+    decoded = {k: v.tolist() for k, v in decode_streams(encoded).items()}
+    pd.testing.assert_frame_equal(
+        parse_streams({"stream_data_full": encoded}),
+        parse_streams({"stream_data_full": decoded}),
+    )
+
+
+def test_short_and_missing_streams_fall_back_to_raw_channels():
+    short = {"time_sec": list(range(10)), "watts": [100] * 10}
+    assert parse_streams({"stream_data_full": short}).empty
+    raw = parse_streams({"stream_data_full": short, "timeStream": list(range(40)), "wattsStream": [150] * 45})
+    assert list(raw.columns) == ["watts", "time_sec"] and len(raw) == 40
+    assert parse_streams({}).empty
+    assert parse_streams({"stream_data_full": None}).empty
@@ -0,0 +1,64 @@
+import copy
+
+import pandas as pd
+from bson import ObjectId
+
+from routes import prediction
+from routes.prediction import predict_user_sync, estimate_remaining_efforts, STREAM_PROJECTION, CURVE_PROJECTION
+from utils.best_efforts import compute_best_effort_curve, detect_best_efforts
+from utils.stream_codec import encode_streams
+from tests.fakes import FakeDatabase, install
+
+
+def user_activity(doc, user_id="u1", **fields):
+    activity = copy.deepcopy(doc)
+    activity.update({"_id": ObjectId(), "userId": user_id, **fields})
+    return activity
+
+
+def test_prediction_reads_only_curves_and_time_distance(monkeypatch, corpus):
+    db = install(monkeypatch, FakeDatabase(), prediction)
+    run_1h, run_6h = corpus["bench-run-1h"], corpus["bench-run-6h"]
+    df_6h = pd.DataFrame({k: run_6h["stream_data_full"][k] for k in ("time_sec", "distance")})
+    db["stravaactivities"].docs = [
+        user_activity(run_1h),
+        user_activity(run_6h, bestEffortCurve=compute_best_effort_curve(df_6h)),
+        user_activity(run_1h, user_id="someone-else"),
+    ]
+
+    result = predict_user_sync("u1")
+
+    finds = [call for call in db["stravaactivities"].calls if call[0] == "find"]
+    assert [call[2] for call in finds] == [CURVE_PROJECTION, STREAM_PROJECTION]
+    assert all(call[3]["batch_size"] == prediction.PREDICT_BATCH_SIZE for call in finds)
+
+    # Same answer as reading both full streams and keeping the faster effort
+    efforts = {}
+    for doc in (run_1h, run_6h):
+        df = pd.DataFrame({k: doc["stream_data_full"][k] for k in ("time_sec", "distance")})
+        for name, effort in detect_best_efforts(df).items():
+            if name not in efforts or effort["time_sec"] < efforts[name]["time_sec"]:
+                efforts[name] = effort
+    expected = estimate_remaining_efforts(efforts)
+    assert {k: (v["type"], v["time_sec"]) for k, v in result["predictions"].items()} == {
+        k: (v["type"], v["time_sec"]) for k, v in expected.items()
+    }
+
+
+def test_encoded_and_plain_streams_predict_the_same(monkeypatch, corpus):
+    db = install(monkeypatch, FakeDatabase(), prediction)
+    run = corpus["bench-run-1h"]
+    db["stravaactivities"].docs = [user_activity(run)]
+    plain = predict_user_sync("u1")
+
+    encoded = user_activity(run)
+    encoded["stream_data_full"] = encode_streams(run["stream_data_full"])
+    db["stravaactivities"].docs = [encoded]
+    assert predict_user_sync("u1") == plain
+
+
+def test_no_usable_activities(monkeypatch, corpus):
+    db = install(monkeypatch, FakeDatabase(), prediction)
+    db["stravaactivities"].docs = [user_activity(corpus["bench-swim-short"])]
+    assert predict_user_sync("u1") == {"error": "No valid stream data found for prediction."}
+    assert predict_user_sync("nobody") == {"error": "No valid stream data found for prediction."}
@@ -0,0 +1,161 @@
+import asyncio
+import copy
+import importlib
+from datetime import datetime, timedelta, UTC
+
+import pytest
+from bson import ObjectId
+
+from benchmarks.run_suite import kpi_history
+from mongo_utils import ACTIVITIES, RESULT_CACHE, DATA_VERSIONS, USER_CURVES, KPI_ROLLUPS
+from routes import segment_analysis
+from routes.segment_analysis import TrendAnalysisRequest, analyze_trends, compute_trends_response
+from utils import result_cache
+from tests.fakes import FakeDatabase, install
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    """A clean in-memory cache per test; whatever a test changes is restored afterwards."""
+    monkeypatch.setattr(result_cache, "_entries", result_cache.OrderedDict())
+    monkeypatch.setattr(result_cache, "_versions", {})
+    monkeypatch.setattr(result_cache, "stats", dict.fromkeys(result_cache.stats, 0))
+    monkeypatch.setattr(result_cache, "_indexes_ready", False)
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_BACKEND", "memory")
+    return result_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def counting(value="v"):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"value": value, "n": len(calls)}
+
+    return compute, calls
+
+
+def get(compute, user_id="u1", params=None, endpoint="e"):
+    return asyncio.run(result_cache.get_or_compute(endpoint, user_id, params or {"a": 1}, compute))
+
+
+def test_cached_trends_equal_uncached(monkeypatch, enriched_corpus):
+    db = install(monkeypatch, FakeDatabase())
+    db[ACTIVITIES].docs = [
+        {**a, "_id": ObjectId(), "userId": "u1", "stravaId": a["_id"]} for a in kpi_history(list(enriched_corpus.values()), 3)
+    ]
+    monkeypatch.setattr(segment_analysis, "USE_KPI_ROLLUPS", False)
+
+    async def run_inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    monkeypatch.setattr(segment_analysis, "run_cpu", run_inline)
+    request = TrendAnalysisRequest(user_id="u1", activity_type="Run")
+    uncached = asyncio.run(compute_trends_response(request))
+    assert asyncio.run(analyze_trends(request)) == uncached
+    finds = len(db[ACTIVITIES].calls)
+    assert asyncio.run(analyze_trends(request)) == uncached
+    assert len(db[ACTIVITIES].calls) == finds
+
+
+def test_hits_and_invalidation(clock):
+    compute, calls = counting()
+    assert get(compute) == get(compute) == {"value": "v", "n": 1}
+    assert get(compute, params={"a": 2})["n"] == 2
+    assert get(compute, user_id="u2")["n"] == 3
+
+    asyncio.run(result_cache.invalidate_user("u1"))
+    assert get(compute)["n"] == 4
+    assert get(compute, user_id="u2")["n"] == 3
+    stats = result_cache.cache_stats()
+    assert (stats["hits"], stats["misses"]) == (2, 4)
+
+
+def test_ttl(monkeypatch, clock):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_TTL_SEC", 10)
+    compute, calls = counting()
+    get(compute)
+    clock[0] += 9.9
+    assert get(compute)["n"] == 1
+    clock[0] += 0.2
+    assert get(compute)["n"] == 2
+    assert result_cache.stats["expired"] == 1
+
+
+def test_lru_eviction(monkeypatch, clock):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_MAX_ENTRIES", 2)
+    compute, calls = counting()
+    get(compute, params={"k": 1})
+    get(compute, params={"k": 2})
+    get(compute, params={"k": 1})      # refreshes k=1
+    get(compute, params={"k": 3})      # evicts k=2, the least recently used
+    assert len(calls) == 3
+    assert get(compute, params={"k": 1})["n"] == 1
+    assert get(compute, params={"k": 2})["n"] == 4
+    assert result_cache.stats["evictions"] == 2
+
+
+def test_errors_are_not_cached_and_off_never_caches(monkeypatch):
+    async def boom():
+        raise ValueError("no")
+
+    with pytest.raises(ValueError):
+        get(boom)
+    assert not result_cache._entries
+
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_BACKEND", "off")
+    compute, calls = counting()
+    get(compute), get(compute)
+    assert len(calls) == 2
+
+
+def test_mongo_backend_is_shared_between_workers(monkeypatch, clock):
+    db = install(monkeypatch, FakeDatabase())
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_BACKEND", "mongo")
+    compute, calls = counting()
+    assert get(compute)["n"] == 1
+
+    # Another worker: empty local LRU, same Mongo
+    result_cache._entries.clear()
+    assert get(compute)["n"] == 1
+    assert result_cache.stats["shared_hits"] == 1
+
+    # A script bumps the version through Mongo; every worker misses afterwards
+    result_cache.bump_user_version("u1")
+    assert get(compute)["n"] == 2
+
+    # Expired shared entries are ignored even before Mongo's TTL monitor deletes them
+    for doc in db[RESULT_CACHE].docs:
+        doc["expiresAt"] = datetime.now(UTC) - timedelta(seconds=1)
+    result_cache._entries.clear()
+    assert get(compute)["n"] == 3
+
+
+@pytest.mark.parametrize("backend", ["memory", "mongo"])
+def test_scripts_bump_versions_only_through_mongo(monkeypatch, corpus, backend):
+    db = install(monkeypatch, FakeDatabase())
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_BACKEND", backend)
+    rerun = importlib.import_module("scripts.rerun_enrichment")
+    for attr, name in (("collection", ACTIVITIES), ("user_curves_collection", USER_CURVES), ("rollups_collection", KPI_ROLLUPS)):
+        monkeypatch.setattr(rerun, attr, db[name])
+    activity = {**copy.deepcopy(corpus["bench-run-short"]), "_id": ObjectId(), "userId": "u1"}
+    db[ACTIVITIES].docs = [activity]
+
+    assert rerun.enrich_activity_by_id(str(activity["_id"]), force=True)
+    # An in-process bump from a script would never reach the API, so none is made
+    assert result_cache._versions == {}
+    assert [doc["version"] for doc in db[DATA_VERSIONS].docs] == ([1] if backend == "mongo" else [])
+
+
+def test_cache_key_depends_on_params_not_their_order():
+    key = result_cache.cache_key("e", "u", {"a": 1, "b": None}, 0)
+    assert key == result_cache.cache_key("e", "u", {"b": None, "a": 1}, 0)
+    assert key != result_cache.cache_key("e", "u", {"a": 1, "b": None}, 1)
+    assert key != result_cache.cache_key("e", "u", {"a": 2, "b": None}, 0)
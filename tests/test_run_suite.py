@@ -0,0 +1,67 @@
+import copy
+import json
+import shutil
+
+import pytest
+
+from benchmarks import run_suite as suite
+
+SMALL = ["bench-run-short", "bench-virtualride-short"]
+
+
+@pytest.fixture(scope="module")
+def small_run(tmp_path_factory):
+    corpus_dir = tmp_path_factory.mktemp("corpus")
+    for name in SMALL:
+        shutil.copy(suite.CORPUS_DIR / f"{name}.json.gz", corpus_dir)
+    docs = suite.load_corpus(corpus_dir)
+    return docs, suite.run_suite(docs, repeat=1, kpi_weeks=2)
+
+
+def test_results_cover_every_stage_and_match_the_baseline_layout(small_run):
+    docs, results = small_run
+    expected = {f"{stage}/{name}" for name in SMALL for stage in suite.STAGES[:3]} | {"compute_kpi_trends/2_weeks"}
+    assert set(results) == expected
+
+    baseline = json.loads(suite.DEFAULT_BASELINE.read_text())["results"]
+    for key, r in results.items():
+        if key in baseline:
+            assert r.keys() == baseline[key].keys()
+            assert r["rows"] == baseline[key]["rows"]
+        assert r["wall_sec"] > 0 and r["peak_mb"] >= 0
+
+
+def test_kpi_history_repeats_each_week():
+    enriched = [{"_id": "a", "segments": []}, {"_id": "b", "segments": []}]
+    history = suite.kpi_history(enriched, 3)
+    assert [a["_id"] for a in history] == ["a", "b"] * 3
+    assert (history[2]["startDate"] - history[0]["startDate"]).days == 7
+
+
+def test_compare_flags_regressions(small_run, capsys):
+    _, results = small_run
+    baseline = {"results": copy.deepcopy(results)}
+    assert suite.compare(results, baseline, 0.25) == []
+
+    slow = copy.deepcopy(results)
+    key = "parse_streams/bench-run-short"
+    slow[key]["wall_sec"] = max(results[key]["wall_sec"], suite.MIN_COMPARABLE_SEC) * 2
+    slow[key]["peak_mb"] = results[key]["peak_mb"]
+    heavy_key = "detect_segments/bench-run-short"
+    slow[heavy_key]["peak_mb"] = results[heavy_key]["peak_mb"] * 2 + 1
+    assert suite.compare(slow, baseline, 0.25) == [key, heavy_key]
+
+    # Sub-millisecond stages only count for memory, never for timer noise
+    noisy = copy.deepcopy(baseline)
+    noisy["results"][key]["wall_sec"] = suite.MIN_COMPARABLE_SEC / 100
+    fast = copy.deepcopy(results)
+    fast[key]["wall_sec"] = suite.MIN_COMPARABLE_SEC / 10
+    assert key not in suite.compare(fast, noisy, 0.25)
+
+    assert suite.compare(results, {"results": {}}, 0.25) == []
+    assert "no baseline entry" in capsys.readouterr().out
+
+
+def test_empty_corpus_dir_is_an_error(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        suite.load_corpus(tmp_path)
@@ -0,0 +1,114 @@
+import json
+import math
+import random
+from pathlib import Path
+
+import pytest
+
+from benchmarks.bench_segment_aligner import legacy_align_planned_to_detected, legacy_iou_range
+from utils.fit_engine.segment_aligner import (
+    align_blocks, align_planned_to_detected, compatible_type_cost, duration_tolerance_cost, exact_type_cost,
+    iou_range, score_segment_accuracy, PLANNED_GAP_COST,
+)
+
+LEGACY = json.loads((Path(__file__).resolve().parent / "golden" / "legacy_segments.json").read_text())
+TYPES = ["warmup", "steady", "interval", "recovery", "cooldown", "acceleration"]
+
+
+def detected_sequence(name):
+    return [{"type": t, "start_index": s, "end_index": e, "duration_sec": d} for t, s, e, d in LEGACY[name]["sequence"]]
+
+
+def planned_from(detected, rng):
+    """A plan the athlete roughly followed: durations off by up to 30%, one block skipped, one extra."""
+    planned = [{"type": d["type"], "duration_sec": max(1, round(d["duration_sec"] * rng.uniform(0.7, 1.3)))} for d in detected]
+    if len(planned) > 2:
+        planned.pop(rng.randrange(len(planned)))
+    planned.insert(rng.randrange(len(planned) + 1), {"type": rng.choice(TYPES), "duration_sec": rng.randrange(30, 600)})
+    return planned
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_iou_range_matches_set_based_legacy(seed):
+    rng = random.Random(seed)
+    a = sorted(rng.sample(range(-5, 60), 2)) if seed % 3 else [rng.randrange(40)] * 2
+    b = [rng.randrange(40), rng.randrange(-3, 60)]
+    assert iou_range(a, b) == pytest.approx(legacy_iou_range(a, b))
+
+
+@pytest.mark.parametrize("name", sorted(n for n in LEGACY if LEGACY[n]["sequence"]))
+def test_dp_matches_at_least_as_many_blocks_as_legacy_greedy(name):
+    detected = detected_sequence(name)
+    # The plan that was followed exactly: every block the greedy pass matched is
+    # matched identically, and the DP also finds the ones whose IoU window drifted to 0
+    exact = [{"type": d["type"], "duration_sec": d["duration_sec"]} for d in detected]
+    dp = align_planned_to_detected(exact, detected)
+    greedy = legacy_align_planned_to_detected(exact, detected)
+    assert [row for row, old in zip(dp, greedy) if old["matched"]] == [old for old in greedy if old["matched"]]
+    assert [row["detected_start_index"] for row in dp] == [d["start_index"] for d in detected]
+
+    rng = random.Random(name)
+    for _ in range(20):
+        planned = planned_from(detected, rng)
+        dp = score_segment_accuracy(align_planned_to_detected(planned, detected))
+        greedy = score_segment_accuracy(legacy_align_planned_to_detected(planned, detected))
+        assert dp["matched"] >= greedy["matched"]
+
+
+def brute_force_cost(planned, detected, type_cost):
+    """Cheapest monotone matching by exhaustive recursion."""
+    def best(i, j):
+        if i == len(planned):
+            return 0.0
+        options = [PLANNED_GAP_COST + best(i + 1, j)]
+        for k in range(j, len(detected)):
+            cost = type_cost(planned[i], detected[k])
+            if cost != math.inf:
+                cost += duration_tolerance_cost(planned[i], detected[k])
+            if cost != math.inf:
+                options.append(cost + best(i + 1, k + 1))
+        return min(options)
+    return best(0, 0)
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_dp_cost_is_optimal(seed):
+    rng = random.Random(seed)
+    types = TYPES[:3]
+    detected, start = [], 0
+    for _ in range(rng.randrange(0, 7)):
+        duration = rng.randrange(10, 100)
+        detected.append({"type": rng.choice(types), "start_index": start, "end_index": start + duration, "duration_sec": duration})
+        start += duration + rng.randrange(0, 20)
+    planned = [{"type": rng.choice(types + ["tempo_run"]), "duration_sec": rng.randrange(10, 100)} for _ in range(rng.randrange(0, 6))]
+
+    for type_cost in (exact_type_cost, compatible_type_cost):
+        result = align_blocks(planned, detected, type_cost=type_cost)
+        assert result["cost"] == pytest.approx(brute_force_cost(planned, detected, type_cost))
+        # The reported matches are monotone and add up to the reported cost
+        starts = [r["detected_start_index"] for r in result["alignment"] if r["matched"]]
+        assert starts == sorted(set(starts))
+        unmatched = sum(not r["matched"] for r in result["alignment"])
+        assert unmatched * PLANNED_GAP_COST <= result["cost"] + 1e-9
+
+
+def test_ties_prefer_a_match():
+    block = {"type": "steady", "duration_sec": 100}
+    detected = [
+        {"type": "steady", "start_index": 0, "end_index": 100, "duration_sec": 100},
+        {"type": "steady", "start_index": 150, "end_index": 250, "duration_sec": 100},
+    ]
+    # Either detected block is equally good; one of them is matched, never neither
+    alignment = align_planned_to_detected([block], detected)
+    assert alignment[0]["matched"]
+    # Two identical planned blocks take one detected block each, in order
+    alignment = align_planned_to_detected([block, block], detected)
+    assert [r["detected_start_index"] for r in alignment] == [0, 150]
+
+
+def test_empty_inputs():
+    assert align_blocks([], []) == {"alignment": [], "cost": 0.0}
+    assert align_planned_to_detected([], [{"type": "steady", "start_index": 0, "end_index": 5, "duration_sec": 5}]) == []
+    alignment = align_planned_to_detected([{"type": "steady", "duration_sec": 5}], [])
+    assert alignment == legacy_align_planned_to_detected([{"type": "steady", "duration_sec": 5}], [])
+    assert score_segment_accuracy([]) == {"planned_total": 0, "matched": 0, "unmatched": 0, "match_rate": 0, "avg_iou": 0}
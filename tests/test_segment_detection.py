@@ -0,0 +1,56 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.enrichment_helpers import detect_segments, parse_streams
+from utils.stream_frame import StreamFrame, as_stream_frame, rolling_nanmean
+
+# Outputs of the pre-rewrite detectors, see tests/golden/build_legacy_outputs.py
+LEGACY = json.loads((Path(__file__).resolve().parent / "golden" / "legacy_segments.json").read_text())
+
+
+def boundaries(segments):
+    return [[s["type"], s["start_index"], s["end_index"], s["duration_sec"]] for s in segments]
+
+
+@pytest.mark.parametrize("name", sorted(LEGACY))
+def test_segments_and_summary_match_legacy_detectors(corpus, name):
+    doc = corpus[name]
+    result = detect_segments(parse_streams(doc), doc)
+    assert boundaries(result["segments"]) == LEGACY[name]["segments"]
+    assert result["summary"] == LEGACY[name]["summary"]
+
+
+def test_shared_frame_computes_each_column_once(corpus):
+    df = parse_streams(corpus["bench-virtualride-1h"])
+    sf = StreamFrame(df)
+    assert as_stream_frame(sf) is sf
+    assert sf.values("rolling_speed_mean") is sf.values("rolling_speed_mean")
+    assert sf.mean("watts") == pytest.approx(df["watts"].mean())
+    assert sf.memo("threshold", lambda: 1.0) == sf.memo("threshold", lambda: 2.0) == 1.0
+    assert sf.series("missing") is None and sf.values("missing") is None
+
+
+@pytest.mark.parametrize("window", [1, 3, 30])
+def test_rolling_nanmean_matches_pandas(window):
+    rng = np.random.default_rng(window)
+    values = rng.normal(200, 40, 500)
+    values[rng.choice(500, 60, replace=False)] = np.nan
+    values[:window + 2] = np.nan
+    np.testing.assert_allclose(
+        rolling_nanmean(values, window),
+        pd.Series(values).rolling(window, min_periods=1).mean().to_numpy(),
+        rtol=1e-12,
+    )
+    assert np.isnan(rolling_nanmean([np.nan, np.nan])).all()
+    assert rolling_nanmean([]).size == 0
+
+
+def test_short_and_empty_streams_have_no_segments():
+    short = pd.DataFrame({"time_sec": np.arange(10.0), "speed": np.ones(10), "heart_rate": np.full(10, 120.0)})
+    assert detect_segments(short, {"type": "Run"})["segments"] == []
+    empty = detect_segments(pd.DataFrame({"time_sec": []}), {"type": "Run"})
+    assert empty == {"segments": [], "summary": {"count": 0, "avg_duration_sec": 0}}
@@ -0,0 +1,98 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import segment_rules
+from utils.enrichment_helpers import parse_streams
+from utils.run_length import latched_mask, mask_runs, run_durations
+from utils.stream_frame import StreamFrame
+
+LEGACY = json.loads((Path(__file__).resolve().parent / "golden" / "legacy_segments.json").read_text())
+DETECTOR_CASES = [(name, detector) for name in sorted(LEGACY) for detector in LEGACY[name]["detectors"]]
+
+
+def boundaries(segments):
+    return [[s["type"], s["start_index"], s["end_index"], s["duration_sec"]] for s in segments]
+
+
+@pytest.mark.parametrize("name,detector", DETECTOR_CASES)
+def test_each_detector_matches_legacy_loop(corpus, name, detector):
+    doc = corpus[name]
+    sf = StreamFrame(parse_streams(doc))
+    result = getattr(segment_rules, detector)(sf, activity_type=doc["type"])
+    assert boundaries(result) == LEGACY[name]["detectors"][detector]
+
+
+def loop_runs(mask, closed_only=True):
+    """Run boundaries the way the legacy detectors walked them."""
+    runs, start = [], None
+    for i, value in enumerate(mask):
+        if value and start is None:
+            start = i
+        elif not value and start is not None:
+            runs.append((start, i))
+            start = None
+    if start is not None and not closed_only:
+        runs.append((start, len(mask)))
+    return runs
+
+
+def loop_latch(on, off):
+    state, out = False, []
+    for a, b in zip(on, off):
+        if a:
+            state = True
+        elif b:
+            state = False
+        out.append(state)
+    return out
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_run_length_helpers_match_loops(seed):
+    rng = np.random.default_rng(seed)
+    mask = rng.random(300) < 0.4
+    for closed_only in (True, False):
+        starts, ends = mask_runs(mask, closed_only)
+        assert list(zip(starts.tolist(), ends.tolist())) == loop_runs(mask, closed_only)
+
+    values = rng.normal(0, 1, 300)
+    values[rng.choice(300, 40, replace=False)] = np.nan
+    with np.errstate(invalid="ignore"):
+        on, off = values > 0.5, values <= 0.5
+    assert latched_mask(on, off).tolist() == loop_latch(on, off)
+
+
+def test_run_length_edge_cases():
+    assert [a.tolist() for a in mask_runs([])] == [[], []]
+    assert [a.tolist() for a in mask_runs([True, True])] == [[], []]
+    assert [a.tolist() for a in mask_runs([True, True], closed_only=False)] == [[0], [2]]
+    assert latched_mask([], []).tolist() == []
+    assert run_durations([0, 5, 12], np.array([0, 1]), np.array([1, 2])).tolist() == [5.0, 7.0]
+
+
+def test_detectors_handle_short_and_flat_streams():
+    short = pd.DataFrame({"time_sec": np.arange(20.0), "speed": np.full(20, 3.0)})
+    assert segment_rules.detect_warmup(short) == []
+    assert segment_rules.detect_cooldown(short) == []
+    assert segment_rules.detect_swimming_blocks(short) == []
+
+    flat = parse_streams({"stream_data_full": {
+        "time_sec": list(range(120)), "speed": [3.0] * 120, "heart_rate": [140.0] * 120,
+    }})
+    sf = StreamFrame(flat)
+    # No spread means no interval threshold crossing and no acceleration spike
+    assert segment_rules.detect_intervals(sf) == []
+    assert segment_rules.detect_acceleration_blocks(sf) == []
+    assert segment_rules.detect_recovery_blocks(sf) == []
+
+
+def test_rules_override_defaults(corpus):
+    doc = corpus["bench-run-1h"]
+    sf = StreamFrame(parse_streams(doc))
+    strict = {"Run": {"interval": {"min_duration_sec": 10_000}}}
+    assert segment_rules.detect_intervals(sf, "Run", rules=strict) == []
+    assert segment_rules.sport_rule(strict, "Ride", "interval") == {}
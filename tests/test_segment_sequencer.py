@@ -0,0 +1,123 @@
+import copy
+import itertools
+import json
+import random
+from pathlib import Path
+
+import pytest
+
+from utils.enrichment_helpers import parse_streams, detect_segments
+from utils.segment_sequencer import EXPECTED_FLOW, SEGMENT_PRIORITY, infer_segment_sequence
+
+LEGACY = json.loads((Path(__file__).resolve().parent / "golden" / "legacy_segments.json").read_text())
+TYPES = list(SEGMENT_PRIORITY)
+
+
+def boundaries(segments):
+    return [[s["type"], s["start_index"], s["end_index"], s["duration_sec"]] for s in segments]
+
+
+def legacy_infer_segment_sequence(segments):
+    """The set-based sequencer from before the max_end rewrite."""
+    sorted_segments = sorted(segments, key=lambda s: (s["start_index"], -SEGMENT_PRIORITY.get(s["type"], 0)))
+    sequence, occupied, last_type = [], set(), None
+    for seg in sorted_segments:
+        seg = seg.copy()
+        seg_range = set(range(seg["start_index"], seg["end_index"] + 1))
+        if not seg_range.isdisjoint(occupied):
+            continue
+        if last_type is not None and seg["type"] not in EXPECTED_FLOW.get(last_type, []):
+            continue
+        seg["primary"] = True
+        if last_type:
+            seg["after"] = last_type
+        last_type = seg["type"]
+        occupied.update(seg_range)
+        sequence.append(seg)
+    return sequence
+
+
+def random_segments(rng, n, span=120, max_len=30):
+    segments = []
+    for _ in range(n):
+        start = rng.randrange(span)
+        end = start + rng.randrange(max_len)
+        segments.append({"type": rng.choice(TYPES), "start_index": start, "end_index": end, "duration_sec": end - start})
+    return segments
+
+
+@pytest.mark.parametrize("name", sorted(LEGACY))
+def test_greedy_matches_recorded_legacy_sequence(corpus, name):
+    recorded = [
+        {"type": t, "start_index": s, "end_index": e, "duration_sec": d} for t, s, e, d in LEGACY[name]["segments"]
+    ]
+    assert boundaries(infer_segment_sequence(recorded, None)) == LEGACY[name]["sequence"]
+
+    # And end to end, from the current detectors
+    doc = corpus[name]
+    segments = detect_segments(parse_streams(doc, features="all"), doc)["segments"]
+    assert boundaries(infer_segment_sequence(segments, None)) == LEGACY[name]["sequence"]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_greedy_matches_legacy_on_random_segments(seed):
+    rng = random.Random(seed)
+    # Narrow spans force shared starts, equal priorities and touching ends
+    segments = random_segments(rng, rng.randrange(1, 40), span=rng.choice([10, 120]))
+    assert infer_segment_sequence(copy.deepcopy(segments), None) == legacy_infer_segment_sequence(segments)
+
+
+def valid_chain(chain):
+    for a, b in zip(chain, chain[1:]):
+        if a["end_index"] >= b["start_index"] or b["type"] not in EXPECTED_FLOW.get(a["type"], []):
+            return False
+    return True
+
+
+def chain_score(chain):
+    return sum(SEGMENT_PRIORITY[s["type"]] for s in chain), len(chain)
+
+
+def brute_force_best(segments):
+    best = (0, 0)
+    ordered = sorted(segments, key=lambda s: s["start_index"])
+    for r in range(1, len(ordered) + 1):
+        for chain in itertools.combinations(ordered, r):
+            if valid_chain(chain):
+                best = max(best, chain_score(chain))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_optimal_matches_brute_force(seed):
+    rng = random.Random(seed)
+    segments = random_segments(rng, rng.randrange(1, 11), span=rng.choice([15, 60]), max_len=12)
+    sequence = infer_segment_sequence(copy.deepcopy(segments), None, mode="optimal")
+    assert valid_chain(sequence)
+    assert chain_score(sequence) == brute_force_best(segments)
+    assert chain_score(sequence) >= chain_score(infer_segment_sequence(segments, None))
+    assert all(s["primary"] for s in sequence)
+    assert [s.get("after") for s in sequence] == [None] + [s["type"] for s in sequence[:-1]]
+
+
+def test_ties():
+    seg = lambda t, s, e: {"type": t, "start_index": s, "end_index": e, "duration_sec": e - s}
+    # Same start: the higher priority type wins in both modes
+    tied = [seg("warmup", 0, 10), seg("steady", 0, 10)]
+    assert [s["type"] for s in infer_segment_sequence(tied, None)] == ["steady"]
+    assert [s["type"] for s in infer_segment_sequence(tied, None, mode="optimal")] == ["steady"]
+    # Touching ranges overlap: an end index equal to the next start is shared
+    touching = [seg("warmup", 0, 10), seg("steady", 10, 20)]
+    assert len(infer_segment_sequence(touching, None)) == 1
+    assert len(infer_segment_sequence(touching, None, mode="optimal")) == 1
+    # Equal totals: the longer chain wins
+    split = [seg("interval", 0, 30), seg("warmup", 0, 9), seg("steady", 10, 19)]
+    assert [s["type"] for s in infer_segment_sequence(split, None, mode="optimal")] == ["warmup", "steady"]
+    assert [s["type"] for s in infer_segment_sequence(split, None)] == ["interval"]
+
+
+def test_empty_and_unknown_mode():
+    assert infer_segment_sequence([], None) == []
+    assert infer_segment_sequence([], None, mode="optimal") == []
+    with pytest.raises(ValueError):
+        infer_segment_sequence([], None, mode="fastest")
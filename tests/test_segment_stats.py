@@ -0,0 +1,143 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.enrichment_helpers import parse_streams
+from utils.segment_stats import EFFORT_KEYS, SegmentStats
+
+LEGACY = json.loads((Path(__file__).resolve().parent / "golden" / "legacy_segments.json").read_text())
+
+
+def legacy_segment_stats(df, seg):
+    """The per-segment slicing detect_segments did before SegmentStats, without its try/except."""
+    out = {}
+    seg_df = df.iloc[seg["start_index"]:seg["end_index"] + 1]
+
+    def fill(effort, block, slope_pick):
+        for key in EFFORT_KEYS:
+            if key not in block:
+                continue
+            numeric = pd.to_numeric(block[key], errors="coerce")
+            if numeric.dropna().empty:
+                continue
+            effort[f"avg_{key}"] = float(numeric.mean())
+            seg_numeric = pd.to_numeric(seg_df[key], errors="coerce")
+            if not seg_numeric.dropna().empty:
+                effort[f"delta_{key}"] = float(effort[f"avg_{key}"] - seg_numeric.mean())
+            slope_col = f"rolling_{key}_trend"
+            if slope_col in block:
+                slope_vals = pd.to_numeric(block[slope_col], errors="coerce").dropna()
+                if not slope_vals.empty:
+                    effort[f"{key}_slope"] = float(slope_vals.iloc[slope_pick])
+
+    if seg["start_index"] > 0:
+        prior = df.iloc[:seg["start_index"]]
+        effort = {
+            "duration_sec": float(prior["time_sec"].iloc[-1]),
+            "distance_m": float(prior["distance"].iloc[-1]) if "distance" in prior else 0,
+            "altitude_m": float(prior["altitude"].iloc[-1]) if "altitude" in prior else 0,
+        }
+        fill(effort, prior, -1)
+        t_now, t_prev = df["time_sec"].iloc[seg["start_index"]], df["time_sec"].iloc[seg["start_index"] - 1]
+        effort["time_gap_sec"] = float(t_now - t_prev) if t_now and t_prev else 0
+        out["effort_before"] = effort
+
+    if seg["end_index"] < len(df) - 2:
+        after_start = seg["end_index"] + 1
+        t0 = df["time_sec"].iloc[after_start]
+        after = df[(df["time_sec"] > t0) & (df["time_sec"] <= t0 + 60)]
+
+        def span(col):
+            return float(after[col].iloc[-1] - after[col].iloc[0]) if col in after and not after.empty else 0
+
+        effort = {"duration_sec": span("time_sec"), "distance_m": span("distance"), "altitude_m": span("altitude")}
+        fill(effort, after, 0)
+        t_now, t_next = df["time_sec"].iloc[seg["end_index"]], df["time_sec"].iloc[after_start]
+        effort["time_gap_sec"] = float(t_next - t_now) if t_next and t_now else 0
+        out["effort_after"] = effort
+
+    for col in df.columns:
+        if col.startswith("delta_") or col.startswith("rolling_"):
+            continue
+        numeric = pd.to_numeric(seg_df[col], errors="coerce")
+        if not numeric.dropna().empty:
+            out[f"avg_{col}"] = float(numeric.mean())
+    return out
+
+
+def new_segment_stats(stats, seg):
+    out = {}
+    if seg["start_index"] > 0:
+        out["effort_before"] = stats.effort_before(seg)
+    if seg["end_index"] < stats.n - 2:
+        out["effort_after"] = stats.effort_after(seg)
+    out.update(stats.segment_averages(seg))
+    return out
+
+
+def assert_same(result, expected):
+    assert result.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, dict):
+            assert_same(result[key], value)
+        else:
+            assert result[key] == pytest.approx(value, rel=1e-9, abs=1e-9, nan_ok=True), key
+
+
+def fixture_segments(name):
+    return [{"start_index": s, "end_index": e} for _, s, e, _ in LEGACY[name]["segments"]]
+
+
+@pytest.mark.parametrize("name", sorted(LEGACY))
+def test_segment_stats_match_legacy_slices(corpus, name):
+    df = parse_streams(corpus[name], features="all")
+    stats = SegmentStats(df)
+    segments = fixture_segments(name) or [{"start_index": 10, "end_index": min(40, len(df) - 1)}]
+    for seg in segments:
+        assert_same(new_segment_stats(stats, seg), legacy_segment_stats(df, seg))
+
+
+def gappy_frame(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "time_sec": np.cumsum(rng.integers(1, 4, n)).astype(float),
+        "distance": np.cumsum(rng.random(n) * 4),
+        "heart_rate": rng.normal(150, 10, n),
+        "speed": rng.normal(3, 0.5, n),
+    })
+    df.loc[rng.choice(n, 80, replace=False), "heart_rate"] = np.nan
+    df.loc[:30, "speed"] = np.nan
+    df["rolling_heart_rate_trend"] = df["heart_rate"].diff().rolling(10, min_periods=1).mean()
+    return df
+
+
+@pytest.mark.parametrize("seg", [(1, 20), (35, 80), (200, 397), (0, 5), (395, 399)])
+def test_windows_with_missing_samples(seg):
+    df = gappy_frame()
+    seg = {"start_index": seg[0], "end_index": seg[1]}
+    assert_same(new_segment_stats(SegmentStats(df), seg), legacy_segment_stats(df, seg))
+
+
+def test_unsorted_time_falls_back_to_mask():
+    df = gappy_frame(seed=1)
+    # A recording reset: time jumps back halfway through
+    df.loc[200:, "time_sec"] -= df["time_sec"].iloc[200] - 5
+    stats = SegmentStats(df)
+    assert not stats.time_sorted
+    assert isinstance(stats.after_rows(150), np.ndarray)
+    for seg in ({"start_index": 100, "end_index": 150}, {"start_index": 210, "end_index": 260}):
+        assert_same(new_segment_stats(stats, seg), legacy_segment_stats(df, seg))
+
+
+def test_empty_windows():
+    stats = SegmentStats(pd.DataFrame({"time_sec": [], "heart_rate": []}))
+    assert stats.mean("heart_rate", 0, 10) is None
+    assert stats.last_valid("heart_rate", 0) is None
+    assert stats.first_valid("heart_rate", 0, 0) is None
+
+    stats = SegmentStats(pd.DataFrame({"time_sec": [0.0, 1.0, 2.0], "heart_rate": [np.nan] * 3}))
+    assert stats.mean("heart_rate", 0, 3) is None
+    assert stats.segment_averages({"start_index": 0, "end_index": 2}) == {"avg_time_sec": 1.0}
@@ -0,0 +1,93 @@
+import bson
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.stream_codec import (
+    CHANNEL_SPECS,
+    CODEC_KEY,
+    EncodedStreams,
+    decode_channel,
+    decode_streams,
+    encode_channel,
+    encode_streams,
+    is_current_format,
+    is_encoded_streams,
+)
+
+
+def quantized(values, name):
+    """What a channel is expected to read back as: rounded to its storage resolution."""
+    values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+    dtype, scale, _ = CHANNEL_SPECS.get(name, ("float32", 1, False))
+    if dtype == "float32":
+        return values.astype(np.float32).astype(float)
+    return np.round(values * scale) / scale
+
+
+def test_round_trip_on_corpus(corpus):
+    for name, doc in corpus.items():
+        streams = doc["stream_data_full"]
+        encoded = encode_streams(streams)
+        assert is_current_format(encoded)
+        assert encoded[CODEC_KEY]["length"] == max(len(v) for v in streams.values())
+
+        # Stored as BSON binary and read back, as Mongo would
+        stored = bson.decode(bson.encode({"s": encoded}))["s"]
+        decoded = decode_streams(stored)
+        assert set(decoded) == set(streams), name
+        for channel, values in streams.items():
+            np.testing.assert_allclose(decoded[channel], quantized(values, channel), rtol=0, atol=1e-9, err_msg=f"{name}.{channel}")
+
+
+def test_null_bitmap_keeps_gaps_in_every_channel_type():
+    values = [None, 1.5, None, None, 4.25, float("nan"), 7.0, None]
+    for name in ["time_sec", "heart_rate", "speed", "unknown_channel"]:
+        decoded = decode_channel(encode_channel(values, name))
+        expected = quantized(values, name)
+        assert np.array_equal(np.isnan(decoded), np.isnan(expected)), name
+        np.testing.assert_allclose(decoded[~np.isnan(decoded)], expected[~np.isnan(expected)], atol=1e-9)
+
+
+def test_delta_channels_survive_leading_nulls_and_non_numeric_values():
+    decoded = decode_channel(encode_channel([None, None, "12.5", "oops", 20.0], "distance"))
+    assert np.isnan(decoded[[0, 1, 3]]).all()
+    assert decoded[2] == 12.5 and decoded[4] == 20.0
+
+
+def test_empty_and_dataframe_input():
+    encoded = encode_streams({})
+    assert encoded == {CODEC_KEY: {"name": "columnar-zlib", "version": 1, "length": 0}}
+    assert len(decode_streams(encoded)) == 0
+
+    assert decode_channel(encode_channel([], "watts")).size == 0
+
+    df = pd.DataFrame({"time_sec": [0, 1, 2], "watts": [100, 110, None]})
+    from_frame = decode_streams(encode_streams(df))
+    assert from_frame["watts"][:2].tolist() == [100.0, 110.0] and np.isnan(from_frame["watts"][2])
+
+
+def test_lazy_view_decodes_on_first_access_only():
+    encoded = encode_streams({"time_sec": [0, 1], "watts": [100, 200]})
+    view = EncodedStreams(encoded)
+    assert view.length == 2 and len(view) == 2 and list(view) == ["time_sec", "watts"]
+    assert view._decoded == {}
+    assert view["watts"] is view["watts"]
+    assert set(view._decoded) == {"watts"}
+    with pytest.raises(KeyError):
+        view[CODEC_KEY]
+
+
+def test_format_checks_and_legacy_passthrough():
+    legacy = {"time_sec": [0, 1]}
+    assert decode_streams(legacy) is legacy
+    assert not is_encoded_streams(legacy) and not is_current_format(legacy)
+    stale = {CODEC_KEY: {"name": "columnar-zlib", "version": 0}}
+    assert is_encoded_streams(stale) and not is_current_format(stale)
+
+
+def test_newer_codec_versions_are_rejected():
+    blob = bytearray(encode_channel([1.0, 2.0], "watts"))
+    blob[0] = 99
+    with pytest.raises(ValueError):
+        decode_channel(bytes(blob))
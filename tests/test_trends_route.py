@@ -0,0 +1,79 @@
+import asyncio
+import copy
+import pickle
+
+import pytest
+from bson import ObjectId
+
+from benchmarks.run_suite import kpi_history
+from mongo_utils import ACTIVITIES
+from routes import segment_analysis
+from routes.segment_analysis import TrendAnalysisRequest, build_trends_query, clean_nan_values, compute_trends_response
+from utils.segment_kpis import compute_kpi_trends_with_sessions, KPI_PROJECTION
+from tests.fakes import FakeDatabase, install, matches
+
+REQUESTS = [
+    {},
+    {"activity_type": "Run"},
+    {"start_date": "2024-01-10", "end_date": "2024-02-06T12:00:00"},
+    {"activity_type": "VirtualRide", "start_date": "2024-01-17"},
+    {"end_date": "2024-01-20"},
+]
+
+
+def history(enriched_corpus, weeks=6):
+    activities = []
+    for activity in kpi_history(list(enriched_corpus.values()), weeks):
+        activities.append({**activity, "_id": ObjectId(), "userId": "u1", "stravaId": activity["_id"]})
+    return activities
+
+
+@pytest.fixture
+def db(monkeypatch, enriched_corpus):
+    db = install(monkeypatch, FakeDatabase())
+    db[ACTIVITIES].docs = history(enriched_corpus) + [
+        {**copy.deepcopy(history(enriched_corpus, 1)[0]), "_id": ObjectId(), "userId": "someone-else"}
+    ]
+    monkeypatch.setattr(segment_analysis, "USE_KPI_ROLLUPS", False)
+    return db
+
+
+@pytest.fixture
+def cpu_calls(monkeypatch):
+    """run_cpu that checks its arguments would cross a process boundary, then runs inline."""
+    calls = []
+
+    async def run_inline(fn, *args, **kwargs):
+        pickle.dumps((fn, args, kwargs))
+        calls.append(fn)
+        return fn(*args, **kwargs)
+
+    monkeypatch.setattr(segment_analysis, "run_cpu", run_inline)
+    return calls
+
+
+@pytest.mark.parametrize("params", REQUESTS)
+def test_trends_match_computing_over_every_stored_activity(db, cpu_calls, params):
+    request = TrendAnalysisRequest(user_id="u1", **params)
+    response = asyncio.run(compute_trends_response(request))
+
+    query = build_trends_query(request)
+    stored = [doc for doc in db[ACTIVITIES].docs if matches(doc, query)]
+    expected = compute_kpi_trends_with_sessions(copy.deepcopy(stored), **params)
+    assert response == {"version": "v1", "data": clean_nan_values(expected)}
+    assert expected
+
+    # Mongo is read here, on the DB pool; the worker only aggregates
+    assert cpu_calls == [compute_kpi_trends_with_sessions]
+    finds = [call for call in db[ACTIVITIES].calls if call[0] == "find"]
+    assert finds[-1][2] == KPI_PROJECTION
+    assert finds[-1][3] == {"batch_size": segment_analysis.TRENDS_BATCH_SIZE, "max_time_ms": segment_analysis.TRENDS_MAX_TIME_MS}
+
+
+def test_empty_range_and_unknown_user(db, cpu_calls):
+    empty = asyncio.run(compute_trends_response(TrendAnalysisRequest(user_id="u1", start_date="2030-01-01")))
+    assert empty == {"version": "v1", "data": []}
+
+    with pytest.raises(segment_analysis.HTTPException) as missing:
+        asyncio.run(compute_trends_response(TrendAnalysisRequest(user_id="nobody")))
+    assert missing.value.status_code == 404
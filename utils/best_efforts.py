@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+BEST_EFFORT_TARGETS = {
+    "5k": 5000,
+    "10k": 10000,
+    "half_marathon": 21097,
+    "marathon": 42195
+}
+
+# An effort must span at least this many samples (matches the legacy i + 5 window)
+MIN_EFFORT_SAMPLES = 5
+
+
+def best_effort_times(distance, time_sec, target_distances, min_samples: int = MIN_EFFORT_SAMPLES) -> np.ndarray:
+    """
+    Returns the fastest elapsed time covering each target distance, NaN where the
+    stream never covers it.
+
+    Same answer as the legacy nested loop: for every start sample i, the end is the
+    first sample j >= i + min_samples with distance[j] - distance[i] >= target.
+    Samples where either channel is missing are dropped first.
+
+    The first sample reaching distance[i] + target is found with one searchsorted
+    over the running maximum of the distance, which is exact even when the
+    cumulative distance dips (GPS corrections). Only starts whose target was
+    already reached inside the minimum window and then lost again by a dip need a
+    per-start scan.
+    """
+    distance = np.asarray(distance, dtype=float)
+    time_sec = np.asarray(time_sec, dtype=float)
+    targets = np.asarray(list(target_distances), dtype=float)
+    best = np.full(targets.shape, np.nan)
+
+    valid = ~(np.isnan(distance) | np.isnan(time_sec))
+    distance = distance[valid]
+    time_sec = time_sec[valid]
+    n = len(distance)
+    if n <= min_samples:
+        return best
+
+    running_max = np.maximum.accumulate(distance)
+    starts = np.arange(n)
+    earliest = starts + min_samples
+    in_window = earliest < n
+
+    for k, target in enumerate(targets):
+        goal = distance + target
+        first = np.searchsorted(running_max, goal, side="left")
+        ends = np.maximum(first, earliest)
+
+        rescan = in_window & (first < earliest)
+        rescan[rescan] = distance[earliest[rescan]] < goal[rescan]
+        for i in np.flatnonzero(rescan):
+            after = np.flatnonzero(distance[earliest[i]:] >= goal[i])
+            ends[i] = earliest[i] + after[0] if len(after) else n
+
+        reached = ends < n
+        if reached.any():
+            best[k] = (time_sec[ends[reached]] - time_sec[starts[reached]]).min()
+
+    return best
+
+
+def detect_best_efforts(df: pd.DataFrame, targets: Optional[Dict[str, float]] = None) -> Dict:
+    """
+    Measured best efforts for a stream with `distance` and `time_sec` columns,
+    shaped as {name: {"type": "measured", "time_sec": ...}}.
+    """
+    targets = targets or BEST_EFFORT_TARGETS
+    if df.empty or "distance" not in df or "time_sec" not in df:
+        return {}
+
+    times = best_effort_times(
+        pd.to_numeric(df["distance"], errors="coerce").to_numpy(dtype=float),
+        pd.to_numeric(df["time_sec"], errors="coerce").to_numpy(dtype=float),
+        targets.values()
+    )
+
+    best_efforts = {}
+    for name, best_time in zip(targets, times):
+        if not np.isnan(best_time) and best_time:
+            best_efforts[name] = {"type": "measured", "time_sec": float(best_time)}
+    return best_efforts
+
+
+# Fixed distances stored per activity at enrichment time
+BEST_EFFORT_CURVE_DISTANCES = {
+    "400m": 400,
+    "1k": 1000,
+    **BEST_EFFORT_TARGETS
+}
+
+
+def compute_best_effort_curve(df: pd.DataFrame, distances: Optional[Dict[str, float]] = None) -> Optional[Dict]:
+    """
+    Compact best-time-per-distance curve for a single activity stream:
+    {"distance_m": [...], "time_sec": [...]}, with None where the distance was not covered.
+    """
+    if df.empty or "distance" not in df or "time_sec" not in df:
+        return None
+
+    return best_effort_curve_from_arrays(
+        pd.to_numeric(df["distance"], errors="coerce").to_numpy(dtype=float),
+        pd.to_numeric(df["time_sec"], errors="coerce").to_numpy(dtype=float),
+        distances
+    )
+
+
+def best_effort_curve_from_arrays(distance, time_sec, distances: Optional[Dict[str, float]] = None) -> Optional[Dict]:
+    """Same as compute_best_effort_curve, straight from raw channel lists without a DataFrame."""
+    distances = distances or BEST_EFFORT_CURVE_DISTANCES
+    distance = np.asarray(distance, dtype=float)
+    time_sec = np.asarray(time_sec, dtype=float)
+    n = min(len(distance), len(time_sec))
+    if n == 0:
+        return None
+
+    distance, time_sec = distance[:n], time_sec[:n]
+    if np.any(np.diff(time_sec) < 0):
+        order = np.argsort(time_sec, kind="stable")
+        distance, time_sec = distance[order], time_sec[order]
+
+    times = best_effort_times(distance, time_sec, distances.values())
+    return {
+        "distance_m": [float(d) for d in distances.values()],
+        "time_sec": [None if np.isnan(t) or t <= 0 else float(t) for t in times]
+    }
+
+
+def merge_best_effort_curve(best: Dict[float, float], curve: Optional[Dict]) -> Dict[float, float]:
+    """Folds one activity curve into a running {distance_m: fastest time_sec} state."""
+    if not isinstance(curve, dict):
+        return best
+    for distance, time_sec in zip(curve.get("distance_m", []), curve.get("time_sec", [])):
+        if time_sec is None:
+            continue
+        distance = float(distance)
+        if distance not in best or time_sec < best[distance]:
+            best[distance] = time_sec
+    return best
+
+
+def best_efforts_from_curve(best: Dict[float, float], targets: Optional[Dict[str, float]] = None) -> Dict:
+    """Converts a folded curve state into the measured best-effort shape."""
+    targets = targets or BEST_EFFORT_TARGETS
+    return {
+        name: {"type": "measured", "time_sec": best[float(distance)]}
+        for name, distance in targets.items()
+        if float(distance) in best
+    }
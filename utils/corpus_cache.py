@@ -0,0 +1,232 @@
+"""
+Local on-disk corpus of activity streams for offline tooling.
+
+    <CORPUS_CACHE_DIR>/
+        manifest.json        {"activities": {"<stravaId>": {"file", "updatedAt", "rows", "meta"}}}
+        <stravaId>.npz       one compressed float array per stream channel
+
+sync() snapshots the activities matching a Mongo query: it reads only
+_id/stravaId/updatedAt for the whole query and downloads full documents just for
+activities that are new or whose updatedAt moved on. Readers (get_activity,
+find_activities, iter_activities) return documents shaped like the Mongo ones,
+with stream_data_full as {channel: np.ndarray}, which parse_streams accepts
+directly. Mongo is only queried when the cache has no answer; activities read
+that way are stored for next time.
+
+The manifest is written with bson.json_util, so ObjectIds and datetimes round-trip.
+"""
+import os
+from collections.abc import Mapping
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from bson import json_util
+from dotenv import load_dotenv
+
+from mongo_utils import get_collection, ACTIVITIES
+from utils.stream_codec import decode_streams
+
+load_dotenv()
+
+CORPUS_CACHE_DIR = os.getenv("CORPUS_CACHE_DIR", ".corpus_cache")
+# Activity fields kept next to the streams; enough for matching, linking and rule tuning
+META_FIELDS = ["_id", "stravaId", "userId", "type", "name", "startDate", "updatedAt", "segments", "segmentSequence"]
+META_PROJECTION = {field: 1 for field in META_FIELDS}
+SYNC_BATCH_SIZE = 50
+# Naive UTC datetimes, like documents read with the default MongoClient
+JSON_OPTIONS = json_util.JSONOptions(tz_aware=False)
+
+_manifests = {}  # cache dir -> manifest loaded by this process
+
+
+def activity_key(activity) -> str:
+    """stravaId as a plain integer string (some documents store it as a float), else the _id."""
+    strava_id = activity.get("stravaId")
+    if strava_id is not None:
+        return str(int(float(strava_id)))
+    return str(activity["_id"])
+
+
+def stream_arrays(stream) -> dict:
+    """stream_data_full in any stored format (codec, dict of lists, list of samples) as {channel: float array}."""
+    stream = decode_streams(stream)
+    if isinstance(stream, list):
+        stream = pd.DataFrame(stream)
+    if not isinstance(stream, (Mapping, pd.DataFrame)):
+        return {}
+    arrays = {}
+    for channel in stream.keys():
+        try:
+            arrays[channel] = np.asarray(stream[channel], dtype=float)
+        except (TypeError, ValueError):
+            arrays[channel] = pd.to_numeric(pd.Series(list(stream[channel])), errors="coerce").to_numpy(dtype=float)
+    return arrays
+
+
+# Manifest
+
+def load_manifest(cache_dir=CORPUS_CACHE_DIR) -> dict:
+    cache_dir = str(cache_dir)
+    if cache_dir not in _manifests:
+        path = Path(cache_dir) / "manifest.json"
+        _manifests[cache_dir] = json_util.loads(path.read_text(), json_options=JSON_OPTIONS) if path.exists() else {"activities": {}}
+    return _manifests[cache_dir]
+
+
+def save_manifest(cache_dir=CORPUS_CACHE_DIR):
+    """Atomic replace, so an interrupted sync never leaves a half-written manifest."""
+    path = Path(cache_dir) / "manifest.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json_util.dumps(load_manifest(cache_dir)))
+    os.replace(tmp, path)
+
+
+# Writing
+
+def store_activity(activity, cache_dir=CORPUS_CACHE_DIR, save=True) -> str:
+    """Writes the activity's streams and metadata into the cache; returns its key."""
+    key = activity_key(activity)
+    arrays = stream_arrays(activity.get("stream_data_full"))
+    file_name = f"{key}.npz"
+    path = Path(cache_dir) / file_name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+
+    manifest = load_manifest(cache_dir)
+    manifest["activities"][key] = {
+        "file": file_name,
+        "updatedAt": activity.get("updatedAt"),
+        "rows": min((len(v) for v in arrays.values()), default=0),
+        "meta": {field: activity[field] for field in META_FIELDS if field in activity},
+    }
+    if save:
+        save_manifest(cache_dir)
+    return key
+
+
+def _is_stale(entry, updated_at) -> bool:
+    if entry is None:
+        return True
+    if updated_at is None:
+        return False
+    cached = entry.get("updatedAt")
+    return cached is None or updated_at > cached
+
+
+def sync(query=None, cache_dir=CORPUS_CACHE_DIR, batch_size=SYNC_BATCH_SIZE, prune=False) -> dict:
+    """
+    Brings the cache up to date with the activities matching `query`, downloading
+    only new or updated ones. With prune=True, cached activities that no longer
+    match the query are dropped. Returns counts.
+    """
+    query = {**(query or {}), "stream_data_full": {"$exists": True}}
+    collection = get_collection(ACTIVITIES)
+    manifest = load_manifest(cache_dir)
+
+    stale_ids, seen = [], set()
+    for doc in collection.find(query, {"_id": 1, "stravaId": 1, "updatedAt": 1}):
+        key = activity_key(doc)
+        seen.add(key)
+        if _is_stale(manifest["activities"].get(key), doc.get("updatedAt")):
+            stale_ids.append(doc["_id"])
+
+    print(f"🔁 {len(seen)} activities match, {len(stale_ids)} new or updated")
+    for start in range(0, len(stale_ids), batch_size):
+        batch = stale_ids[start:start + batch_size]
+        cursor = collection.find({"_id": {"$in": batch}}, {**META_PROJECTION, "stream_data_full": 1})
+        for activity in cursor:
+            store_activity(activity, cache_dir, save=False)
+        save_manifest(cache_dir)
+        print(f"💾 [{min(start + batch_size, len(stale_ids))}/{len(stale_ids)}] cached")
+
+    removed = 0
+    if prune:
+        for key in [k for k in manifest["activities"] if k not in seen]:
+            remove_activity(key, cache_dir, save=False)
+            removed += 1
+        save_manifest(cache_dir)
+
+    return {"matched": len(seen), "downloaded": len(stale_ids), "removed": removed}
+
+
+def remove_activity(key, cache_dir=CORPUS_CACHE_DIR, save=True):
+    entry = load_manifest(cache_dir)["activities"].pop(str(key), None)
+    if entry:
+        (Path(cache_dir) / entry["file"]).unlink(missing_ok=True)
+    if save:
+        save_manifest(cache_dir)
+
+
+# Reading
+
+def _load(entry, cache_dir):
+    with np.load(Path(cache_dir) / entry["file"]) as arrays:
+        streams = {channel: arrays[channel] for channel in arrays.files}
+    return {**entry["meta"], "stream_data_full": streams}
+
+
+def _cached(key, cache_dir):
+    entry = load_manifest(cache_dir)["activities"].get(key)
+    if entry is not None and (Path(cache_dir) / entry["file"]).exists():
+        return _load(entry, cache_dir)
+    return None
+
+
+def get_activity(strava_id, cache_dir=CORPUS_CACHE_DIR, fallback=True):
+    """The cached activity, or (fallback=True) the Mongo document, which is then cached."""
+    key = activity_key({"stravaId": strava_id})
+    activity = _cached(key, cache_dir)
+    if activity is not None or not fallback:
+        return activity
+
+    print(f"🌐 stravaId={key} not cached, reading from MongoDB")
+    activity = get_collection(ACTIVITIES).find_one(
+        {"stravaId": int(key)},
+        {**META_PROJECTION, "stream_data_full": 1}
+    )
+    if activity is None:
+        return None
+    if "stream_data_full" in activity:
+        store_activity(activity, cache_dir)
+        return _cached(key, cache_dir)
+    return activity
+
+
+def _matches(meta, user_id, sport, start, end):
+    if user_id is not None and meta.get("userId") != user_id:
+        return False
+    if sport is not None and meta.get("type") != sport:
+        return False
+    date = meta.get("startDate")
+    if (start is not None or end is not None) and not isinstance(date, datetime):
+        return False
+    if start is not None and date < start:
+        return False
+    if end is not None and date >= end:
+        return False
+    return True
+
+
+def find_activities(user_id=None, sport=None, start=None, end=None, cache_dir=CORPUS_CACHE_DIR, with_streams=False):
+    """Cached activities filtered on metadata (start <= startDate < end), sorted by startDate."""
+    entries = [
+        entry for entry in load_manifest(cache_dir)["activities"].values()
+        if _matches(entry["meta"], user_id, sport, start, end)
+    ]
+    entries.sort(key=lambda e: str(e["meta"].get("startDate")))
+    if with_streams:
+        return [_load(entry, cache_dir) for entry in entries]
+    return [dict(entry["meta"]) for entry in entries]
+
+
+def iter_activities(user_id=None, sport=None, cache_dir=CORPUS_CACHE_DIR):
+    """Cached activities with streams, loaded one at a time."""
+    for meta in find_activities(user_id, sport, cache_dir=cache_dir):
+        activity = _cached(activity_key(meta), cache_dir)
+        if activity is not None:
+            yield activity
@@ -9,10 +9,23 @@ from utils.segment_rules import (
     detect_cooldown,
     detect_swimming_blocks,
 )
-
-def parse_streams(activity):
+from utils.stream_codec import encode_streams, decode_streams, is_encoded_streams, is_current_format
+from utils.stream_frame import StreamFrame, rolling_nanmean
+from utils.segment_stats import SegmentStats
+
+# Derived columns the segment detectors and effort statistics read; everything
+# else the legacy parser produced (rolling distance, altitude trend, ...) was unused
+DERIVED_FEATURES = {
+    "delta": ["speed"],
+    "rolling_mean": ["speed", "heart_rate"],
+    "rolling_trend": ["heart_rate", "speed", "cadence", "watts"],
+}
+
+def parse_streams(activity, features=None):
     print("🔍 parse_streams() was called")
     streams = activity.get("stream_data_full", {})
+    if is_encoded_streams(streams):
+        streams = dict(decode_streams(streams))
 
     if not isinstance(streams, dict):
         print("⚠️ stream_data_full is malformed or missing, rebuilding from raw streams...")
@@ -45,37 +58,65 @@ def parse_streams(activity):
             print("❌ Not enough valid fallback streams to rebuild DataFrame.")
             return pd.DataFrame()
     else:
-        df = pd.DataFrame(streams)
-        if df.empty or df.shape[0] < 30:
+        n_rows = min((len(v) for v in streams.values()), default=0)
+        if n_rows < 30:
             print("⚠️ stream_data_full was present but empty or insufficient — falling back to raw streams.")
             return parse_streams_from_raw(activity)
-        print(f"✅ stream_data_full used directly: {len(df)} rows, columns: {list(df.columns)}")
-
-    for col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    before = len(df)
-    df = df.dropna(subset=["time_sec", "watts"])
-    print(f"ℹ️ Dropped {before - len(df)} rows due to missing time/watts")
-
-    window = 30
-    delta_cols = {}
-    rolling_means = {}
-    rolling_deltas = {}
-
-    for col in df.columns:
-        if col == "time_sec":
-            continue
+        df = streams
+        print(f"✅ stream_data_full used directly: {n_rows} rows, columns: {list(streams.keys())}")
 
-        delta = df[col].diff()
-        delta_cols[f"delta_{col}"] = delta
-        rolling_means[f"rolling_{col}_mean"] = df[col].rolling(window, min_periods=1).mean()
-        rolling_deltas[f"rolling_{col}_trend"] = delta.rolling(window, min_periods=1).mean()
+    return build_stream_features(df, features)
 
-    df = pd.concat([df, pd.DataFrame(delta_cols), pd.DataFrame(rolling_means), pd.DataFrame(rolling_deltas)], axis=1)
-    df = df.apply(pd.to_numeric, errors="coerce")
-
-    return df
+def _to_float_matrix(streams):
+    """
+    All raw channels (a DataFrame or {channel: list}) as one float64 array, without
+    building an intermediate object frame; falls back per column only if something is non-numeric.
+    """
+    columns = list(streams.keys())
+    try:
+        return np.array([np.asarray(streams[col], dtype=float) for col in columns]).T
+    except (TypeError, ValueError):
+        return np.column_stack([pd.to_numeric(pd.Series(streams[col]), errors="coerce").to_numpy(dtype=float) for col in columns])
+
+def build_stream_features(df, features=None):
+    """
+    Converts raw channels (a DataFrame or {channel: list}) to floats in one step, drops rows without time/watts and
+    appends only the declared derived columns (delta_<col>, rolling_<col>_mean,
+    rolling_<col>_trend). Pass features="all" for every channel, as the legacy parser did.
+    """
+    columns = list(df.keys())
+    matrix = _to_float_matrix(df)
+
+    required = [columns.index(col) for col in ("time_sec", "watts") if col in columns]
+    keep = ~np.isnan(matrix[:, required]).any(axis=1)
+    print(f"ℹ️ Dropped {int((~keep).sum())} rows due to missing time/watts")
+    matrix = matrix[keep]
+    raw = {col: matrix[:, i] for i, col in enumerate(columns)}
+
+    if features == "all":
+        channels = [col for col in columns if col != "time_sec"]
+        features = {"delta": channels, "rolling_mean": channels, "rolling_trend": channels}
+    features = features or DERIVED_FEATURES
+
+    deltas = {}
+    def delta(col):
+        if col not in deltas:
+            deltas[col] = np.diff(raw[col], prepend=np.nan)
+        return deltas[col]
+
+    derived = {}
+    for col in columns:
+        if col in features.get("delta", []):
+            derived[f"delta_{col}"] = delta(col)
+    for col in columns:
+        if col in features.get("rolling_mean", []):
+            derived[f"rolling_{col}_mean"] = rolling_nanmean(raw[col])
+    for col in columns:
+        if col in features.get("rolling_trend", []):
+            derived[f"rolling_{col}_trend"] = rolling_nanmean(delta(col))
+
+    index = df.index[keep] if isinstance(df, pd.DataFrame) else np.flatnonzero(keep)
+    return pd.DataFrame({**raw, **derived}, index=index)
 
 def parse_streams_from_raw(activity):
     fallback_keys = [
@@ -127,19 +168,22 @@ def apply_rule(fn, df, activity_type, *args, **kwargs):
         print(f"❌ Error applying rule {fn.__name__} for sport {activity_type}: {e}")
         return []
 
-def detect_segments(df, activity):
+def detect_segments(df, activity, rules=None):
+    """Runs every detector for the activity's sport; `rules` overrides rules_by_sport (e.g. a candidate rule set)."""
     activity_type = activity.get("type", "default")
 
     if activity_type == "Swim":
         return {"segments": detect_swimming_blocks(df), "summary": {"swim_mode": True}}
 
+    # One shared frame: every rule reuses the same coerced columns, means and masks
+    sf = StreamFrame(df)
     segments = []
-    segments += apply_rule(detect_warmup, df, activity_type)
-    segments += apply_rule(detect_intervals, df, activity_type)
-    segments += apply_rule(detect_acceleration_blocks, df, activity_type)
-    segments += apply_rule(detect_recovery_blocks, df, activity_type)
-    segments += apply_rule(detect_steady_state_blocks, df, activity_type)
-    segments += apply_rule(detect_cooldown, df, activity_type)
+    segments += apply_rule(detect_warmup, sf, activity_type, rules=rules)
+    segments += apply_rule(detect_intervals, sf, activity_type, rules=rules)
+    segments += apply_rule(detect_acceleration_blocks, sf, activity_type, rules=rules)
+    segments += apply_rule(detect_recovery_blocks, sf, activity_type, rules=rules)
+    segments += apply_rule(detect_steady_state_blocks, sf, activity_type, rules=rules)
+    segments += apply_rule(detect_cooldown, sf, activity_type, rules=rules)
 
     segments = merge_close_segments(segments, min_gap_sec=10)
     segments = [s for s in segments if s.get("duration_sec", 0) >= 30]
@@ -151,103 +195,21 @@ def detect_segments(df, activity):
         "avg_duration_sec": int(np.mean([s["duration_sec"] for s in segments])) if segments else 0
     }
 
+    # Prefix sums per channel: every effort/segment window below is O(1)
+    stats = SegmentStats(df)
     for seg in segments:
         try:
-            # Effort BEFORE
             if "start_index" in seg and seg["start_index"] > 0:
-                prior_block = df.iloc[:seg["start_index"]]
-                effort_before = {
-                    "duration_sec": float(prior_block["time_sec"].iloc[-1]) if not prior_block.empty else 0,
-                    "distance_m": float(prior_block["distance"].iloc[-1]) if "distance" in prior_block and not prior_block.empty else 0,
-                    "altitude_m": float(prior_block["altitude"].iloc[-1]) if "altitude" in prior_block and not prior_block.empty else 0,
-                }
-
-                for key in ["heart_rate", "speed", "cadence", "watts"]:
-                    if key in prior_block:
-                        try:
-                            numeric = pd.to_numeric(prior_block[key], errors="coerce")
-                            if not numeric.dropna().empty:
-                                effort_before[f"avg_{key}"] = float(numeric.mean())
-
-                                seg_df = df.iloc[seg["start_index"]:seg["end_index"] + 1]
-                                if key in seg_df:
-                                    seg_numeric = pd.to_numeric(seg_df[key], errors="coerce")
-                                    if not seg_numeric.dropna().empty:
-                                        seg_avg = float(seg_numeric.mean())
-                                        effort_before[f"delta_{key}"] = float(effort_before[f"avg_{key}"] - seg_avg)
-
-                                slope_col = f"rolling_{key}_trend"
-                                if slope_col in prior_block:
-                                    slope_vals = pd.to_numeric(prior_block[slope_col], errors="coerce").dropna()
-                                    if not slope_vals.empty:
-                                        effort_before[f"{key}_slope"] = float(slope_vals.iloc[-1])
-                        except Exception as sub_e:
-                            print(f"⚠️ Failed metric calc for effort_before[{key}]: {repr(sub_e)}")
-
-                if "time_sec" in df.columns and seg["start_index"] > 0:
-                    t_now = df["time_sec"].iloc[seg["start_index"]]
-                    t_prev = df["time_sec"].iloc[seg["start_index"] - 1]
-                    effort_before["time_gap_sec"] = float(t_now - t_prev) if t_now and t_prev else 0
-
-                seg["effort_before"] = effort_before
-
-            # Effort AFTER
+                seg["effort_before"] = stats.effort_before(seg)
+
             if "end_index" in seg and seg["end_index"] < len(df) - 2:
-                after_start = seg["end_index"] + 1
-                end_time = df["time_sec"].iloc[after_start] + 60  # 60-second window
-                after_block = df[(df["time_sec"] > df["time_sec"].iloc[after_start]) & (df["time_sec"] <= end_time)]
-
-                effort_after = {
-                    "duration_sec": float(after_block["time_sec"].iloc[-1] - after_block["time_sec"].iloc[0]) if not after_block.empty else 0,
-                    "distance_m": float(after_block["distance"].iloc[-1] - after_block["distance"].iloc[0]) if "distance" in after_block and not after_block.empty else 0,
-                    "altitude_m": float(after_block["altitude"].iloc[-1] - after_block["altitude"].iloc[0]) if "altitude" in after_block and not after_block.empty else 0,
-                }
-
-                for key in ["heart_rate", "speed", "cadence", "watts"]:
-                    if key in after_block:
-                        try:
-                            numeric = pd.to_numeric(after_block[key], errors="coerce")
-                            if not numeric.dropna().empty:
-                                effort_after[f"avg_{key}"] = float(numeric.mean())
-
-                                seg_df = df.iloc[seg["start_index"]:seg["end_index"] + 1]
-                                if key in seg_df:
-                                    seg_numeric = pd.to_numeric(seg_df[key], errors="coerce")
-                                    if not seg_numeric.dropna().empty:
-                                        seg_avg = float(seg_numeric.mean())
-                                        effort_after[f"delta_{key}"] = float(effort_after[f"avg_{key}"] - seg_avg)
-
-                                slope_col = f"rolling_{key}_trend"
-                                if slope_col in after_block:
-                                    slope_vals = pd.to_numeric(after_block[slope_col], errors="coerce").dropna()
-                                    if not slope_vals.empty:
-                                        effort_after[f"{key}_slope"] = float(slope_vals.iloc[0])
-                        except Exception as sub_e:
-                            print(f"⚠️ Failed metric calc for effort_after[{key}]: {repr(sub_e)}")
-
-                if "time_sec" in df.columns and seg["end_index"] < len(df) - 2:
-                    t_now = df["time_sec"].iloc[seg["end_index"]]
-                    t_next = df["time_sec"].iloc[seg["end_index"] + 1]
-                    effort_after["time_gap_sec"] = float(t_next - t_now) if t_next and t_now else 0
-
-                seg["effort_after"] = effort_after
-
-            # Segment metrics
-            seg_df = df.iloc[seg["start_index"]:seg["end_index"] + 1]
-            for col in df.columns:
-                if col.startswith("delta_") or col.startswith("rolling_"):
-                    continue
-                if col in seg_df:
-                    try:
-                        numeric_col = pd.to_numeric(seg_df[col], errors="coerce")
-                        if isinstance(numeric_col, (pd.Series, np.ndarray)) and not numeric_col.dropna().empty:
-                            seg[f"avg_{col}"] = float(numeric_col.mean())
-                    except Exception as seg_e:
-                        print(f"⚠️ Failed avg calc for seg[{col}]: {repr(seg_e)}")
+                seg["effort_after"] = stats.effort_after(seg)
+
+            seg.update(stats.segment_averages(seg))
         except Exception as seg_outer:
             print(f"❌ Failed to process segment: {repr(seg_outer)}")
 
-        return {"segments": segments, "summary": summary}
+    return {"segments": segments, "summary": summary}
 
 def extract_aggregated_features(activity):
     return {
@@ -261,6 +223,101 @@ def extract_aggregated_features(activity):
         "maxHeartrate": activity.get("maxHeartrate", 0),
     }
 
+# Log-spaced durations from 1 s to 5 h for mean-maximal curves
+MEAN_MAX_DURATIONS = [int(d) for d in np.unique(np.round(np.logspace(0, np.log10(5 * 3600), 40)))]
+MEAN_MAX_CHANNELS = {
+    "Ride": ["watts"],
+    "VirtualRide": ["watts"],
+    "Run": ["speed"],
+}
+# Samples further apart than this are treated as a pause and count as zero output
+MEAN_MAX_MAX_GAP_SEC = 10
+
+
+def resample_to_seconds(time_sec, values, max_gap=MEAN_MAX_MAX_GAP_SEC):
+    """Forward-fills a stream onto a 1 Hz grid so windows are measured in seconds, not samples."""
+    time_sec = np.asarray(time_sec, dtype=float)
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(time_sec)
+    time_sec, values = time_sec[valid], values[valid]
+    if len(time_sec) == 0:
+        return np.array([])
+
+    order = np.argsort(time_sec, kind="stable")
+    time_sec, values = time_sec[order], np.nan_to_num(values[order], nan=0.0)
+    grid = np.arange(np.floor(time_sec[0]), np.floor(time_sec[-1]) + 1)
+    idx = np.searchsorted(time_sec, grid, side="right") - 1
+    resampled = values[idx]
+    resampled[grid - time_sec[idx] > max_gap] = 0.0
+    return resampled
+
+
+def mean_max_curve(values_1hz, durations=MEAN_MAX_DURATIONS):
+    """
+    Best average over every window length using one prefix sum: each duration is
+    a single vectorized difference of the cumulative sum followed by a max.
+    """
+    values_1hz = np.asarray(values_1hz, dtype=float)
+    csum = np.concatenate(([0.0], np.cumsum(values_1hz)))
+    curve = []
+    for duration in durations:
+        if duration > len(values_1hz):
+            curve.append(None)
+            continue
+        window_sums = csum[duration:] - csum[:-duration]
+        curve.append(round(float(window_sums.max() / duration), 3))
+    return curve
+
+
+def extract_mean_max_curves(df, activity):
+    """Mean-maximal power (rides) or speed (runs) curve for the activity, or None."""
+    channels = [
+        ch for ch in MEAN_MAX_CHANNELS.get(activity.get("type"), [])
+        if ch in df and not df[ch].dropna().empty
+    ]
+    if "time_sec" not in df or not channels:
+        return None
+
+    curves = {"durations_sec": MEAN_MAX_DURATIONS}
+    for ch in channels:
+        curves[ch] = mean_max_curve(resample_to_seconds(df["time_sec"], df[ch]))
+    return curves
+
+
+def merge_mean_max_curves(best, curves):
+    """Element-wise max of a running best-of curve and one activity's curves."""
+    if not curves:
+        return best
+    merged = dict(best or {"durations_sec": curves["durations_sec"]})
+    for ch, values in curves.items():
+        if ch == "durations_sec":
+            continue
+        previous = merged.get(ch) or [None] * len(values)
+        merged[ch] = [
+            b if a is None else a if b is None else max(a, b)
+            for a, b in zip(values, previous)
+        ]
+    return merged
+
+
+def build_user_curve_update(curves):
+    """
+    Mongo update that folds an activity's curves into the per-user best-of document
+    incrementally with $max, one field per channel and duration.
+    """
+    if not curves:
+        return None
+    max_fields = {}
+    for ch, values in curves.items():
+        if ch == "durations_sec":
+            continue
+        for duration, value in zip(curves["durations_sec"], values):
+            if value is not None:
+                max_fields[f"{ch}.{duration}"] = value
+    if not max_fields:
+        return None
+    return {"$max": max_fields, "$set": {"durations_sec": curves["durations_sec"]}}
+
 def generate_ml_windows(df, segments):
     return []
 
@@ -277,13 +334,19 @@ def convert_numpy_types(data):
 def trim_stream_df(df: pd.DataFrame) -> pd.DataFrame:
     return df[[col for col in df.columns if not col.startswith("delta_") and not col.startswith("rolling_")]]
 
+LEGACY_STREAM_FIELDS = [
+    "wattsStream", "heartRateStream", "cadenceStream", "altitudeStream",
+    "distanceStream", "timeStream", "speedStream"
+]
+
 def prepare_activity_for_storage(activity: dict, df: pd.DataFrame, segment_result=None) -> dict:
     trimmed = trim_stream_df(df).round(3)
-    activity["stream_data_full"] = trimmed.to_dict(orient="list")
-    for key in [
-        "wattsStream", "heartRateStream", "cadenceStream", "altitudeStream",
-        "distanceStream", "timeStream", "speedStream"
-    ]:
+    stored = activity.get("stream_data_full")
+    # df was parsed from the stored stream (not the raw fallback) and it is already in the
+    # current format: keep the stored blobs so the stream is not rewritten
+    if not (is_current_format(stored) and decode_streams(stored).length >= len(trimmed)):
+        activity["stream_data_full"] = encode_streams(trimmed)
+    for key in LEGACY_STREAM_FIELDS:
         activity.pop(key, None)
 
     activity["stream_summary"] = {
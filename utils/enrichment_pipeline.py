@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+from datetime import datetime, UTC
+
+from utils.segment_detection_rules import rules_by_sport
+from utils.segment_sequencer import infer_segment_sequence
+from utils.best_efforts import compute_best_effort_curve
+from utils.enrichment_helpers import (
+    parse_streams,
+    extract_aggregated_features,
+    extract_mean_max_curves,
+    detect_segments,
+    convert_numpy_types,
+    prepare_activity_for_storage,
+    LEGACY_STREAM_FIELDS,
+)
+
+ENRICHMENT_VERSION = 1.4
+# Bump whenever detector or segment-statistics code changes what gets stored
+DETECTOR_VERSION = 2
+MIN_STREAM_ROWS = 30
+FINGERPRINT_FIELD = "enrichmentFingerprint"
+# "greedy" keeps segments in start order as they fit, "optimal" picks the highest-priority valid sequence
+SEQUENCER_MODE = os.getenv("SEQUENCER_MODE", "greedy")
+
+
+def stream_fingerprint(stream) -> str:
+    """Content hash of stream_data_full as stored, in either the codec or the legacy list format."""
+    digest = hashlib.sha256()
+    if isinstance(stream, dict):
+        for name in sorted(stream):
+            digest.update(name.encode())
+            value = stream[name]
+            if isinstance(value, (bytes, bytearray)):
+                digest.update(value)
+            else:
+                digest.update(json.dumps(value, sort_keys=True, default=str).encode())
+    else:
+        digest.update(json.dumps(stream, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def pipeline_version(sport) -> str:
+    """Changes when the sport's detection rules, the detector code, the sequencer mode or enrichmentVersion change."""
+    key = json.dumps({
+        "rules": rules_by_sport.get(sport, {}),
+        "detector": DETECTOR_VERSION,
+        "enrichment": ENRICHMENT_VERSION,
+        **({"sequencer": SEQUENCER_MODE} if SEQUENCER_MODE != "greedy" else {}),
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def enrichment_fingerprint(activity: dict) -> dict:
+    return {
+        "streams": stream_fingerprint(activity.get("stream_data_full")),
+        "pipeline": pipeline_version(activity.get("type")),
+    }
+
+
+def is_up_to_date(activity: dict) -> bool:
+    """True when the stored fingerprint matches the current streams and pipeline."""
+    stored = activity.get(FINGERPRINT_FIELD)
+    return bool(stored) and stored == enrichment_fingerprint(activity)
+
+
+def build_activity_update(before: dict, after: dict) -> dict:
+    """
+    $set for the fields enrichment added or changed (the stream only when it was
+    re-encoded) and $unset for the legacy *Stream fields it dropped.
+    """
+    changed = {
+        key: value for key, value in after.items()
+        if key != "_id" and (key not in before or before[key] is not value and before[key] != value)
+    }
+    update = {"$set": changed}
+    removed = [key for key in LEGACY_STREAM_FIELDS if key in before and key not in after]
+    if removed:
+        update["$unset"] = {key: "" for key in removed}
+    return update
+
+
+def enrich_activity_document(activity: dict, skip_unchanged: bool = False) -> dict:
+    """
+    Runs the full enrichment pipeline on one activity document without touching
+    Mongo. Returns {"status": "skipped" | "unchanged", "reason": ...} or
+    {"status": "enriched", "activity": <enriched doc>, "update": <$set/$unset of
+    the changed fields>, "meanMaxCurves": ...}.
+    With skip_unchanged, documents whose fingerprint still matches are not reprocessed.
+    """
+    strava_id = activity.get("stravaId")
+    print(f"📌 Processing stravaId={strava_id}")
+
+    if skip_unchanged and is_up_to_date(activity):
+        print(f"⏭ Skipping {strava_id}: streams and pipeline unchanged")
+        return {"status": "unchanged", "reason": "Fingerprint unchanged"}
+
+    if activity.get("type") == "WeightTraining":
+        print("⏭ Skipping WeightTraining activity")
+        return {"status": "skipped", "reason": "WeightTraining activity"}
+
+    before = dict(activity)
+
+    # STEP 1: parse streams
+    print("📊 Parsing streams...")
+    df = parse_streams(activity)
+    print(f"✅ Parsed stream shape: {df.shape}")
+
+    if df.empty or df.shape[0] < MIN_STREAM_ROWS:
+        print(f"⏭ Skipping {strava_id}: insufficient stream data.")
+        return {"status": "skipped", "reason": "Insufficient stream data"}
+
+    # STEP 2: extract aggregated features
+    print("📈 Extracting aggregated features...")
+    aggregated = extract_aggregated_features(activity)
+
+    # STEP 2.1: best-effort curve for fast predictions
+    print("🏁 Computing best-effort curve...")
+    best_effort_curve = compute_best_effort_curve(df)
+
+    # STEP 2.2: mean-maximal power / speed curve
+    print("⚡ Computing mean-maximal curves...")
+    mean_max_curves = extract_mean_max_curves(df, activity)
+
+    # STEP 3: detect segments
+    print("🔍 Detecting segments...")
+    segments_result = detect_segments(df, activity)
+
+    # STEP 3.1: infer sequence
+    print("🧠 Inferring segment sequence...")
+    segment_sequence = infer_segment_sequence(segments_result["segments"], df, mode=SEQUENCER_MODE)
+
+    # STEP 4: cleanup stream and legacy fields
+    print("🧹 Preparing activity for storage...")
+    activity = prepare_activity_for_storage(activity, df, segments_result)
+
+    # STEP 5: Add metadata
+    print("🧬 Injecting metadata...")
+    activity.update({
+        "aggregatedFeatures": convert_numpy_types(aggregated),
+        "segments": convert_numpy_types(segments_result["segments"]),
+        "segmentSummary": convert_numpy_types(segments_result["summary"]),
+        "segmentSequence": convert_numpy_types(segment_sequence),
+        "bestEffortCurve": best_effort_curve,
+        "meanMaxCurves": mean_max_curves,
+        "enriched": True,
+        "enrichmentVersion": ENRICHMENT_VERSION,
+        "updatedAt": datetime.now(UTC)
+    })
+    # Fingerprint of the stream exactly as it will be stored
+    activity[FINGERPRINT_FIELD] = enrichment_fingerprint(activity)
+
+    return {
+        "status": "enriched",
+        "activity": activity,
+        "update": build_activity_update(before, activity),
+        "meanMaxCurves": mean_max_curves,
+    }
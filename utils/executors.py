@@ -0,0 +1,158 @@
+"""
+Executors that keep the FastAPI event loop free.
+
+CPU-bound enrichment (parse_streams, detect_segments, infer_segment_sequence,
+KPI trends) runs in a ProcessPoolExecutor whose workers import the pipeline and
+run it once on a synthetic stream when they start, so the first real request does
+not pay for imports. Blocking pymongo calls run in a thread pool.
+
+Both pools are created by start_executors() in the app lifespan. Outside the app
+(scripts, notebooks) they start on first use: run_db only creates the thread pool,
+and run_cpu spawns and warms the process pool on a helper thread so the event loop
+keeps running meanwhile.
+
+Callers beyond ENRICH_QUEUE_DEPTH wait for a slot; once ENRICH_MAX_WAITING of them
+are already waiting, run_cpu sheds load by raising CpuPoolBusy (a 503 in the API).
+"""
+import asyncio
+import contextlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Worker processes for enrichment; each holds its own pandas/numpy import
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", min(4, os.cpu_count() or 1)))
+# Tasks handed to the process pool at once; further callers wait on the event loop
+ENRICH_QUEUE_DEPTH = int(os.getenv("ENRICH_QUEUE_DEPTH", ENRICH_WORKERS * 2))
+# Callers allowed to wait for one of those slots before run_cpu rejects new work
+ENRICH_MAX_WAITING = int(os.getenv("ENRICH_MAX_WAITING", 256))
+# Seconds a single CPU task may run before the request gives up on it
+ENRICH_TASK_TIMEOUT_SEC = float(os.getenv("ENRICH_TASK_TIMEOUT_SEC", 120))
+# Threads for blocking Mongo calls
+DB_THREADS = int(os.getenv("DB_THREADS", 16))
+
+_process_pool = None
+_thread_pool = None
+_cpu_slots = None
+_cpu_waiting = 0
+_start_lock = threading.Lock()
+
+
+class CpuPoolBusy(RuntimeError):
+    """Raised by run_cpu when ENRICH_MAX_WAITING callers are already queued."""
+
+
+def _warm_worker():
+    """Process-pool initializer: import the pipeline and exercise it once."""
+    import numpy as np
+    from utils.enrichment_pipeline import enrich_activity_document
+    import utils.segment_kpis  # noqa: F401
+
+    t = np.arange(600, dtype=float)
+    watts = 200 + 50 * np.sin(t / 60)
+    streams = {
+        "time_sec": t.tolist(),
+        "watts": watts.tolist(),
+        "heart_rate": (120 + watts / 10).tolist(),
+        "speed": (8 + watts / 100).tolist(),
+        "cadence": [90.0] * len(t),
+        "distance": np.cumsum(8 + watts / 100).tolist(),
+    }
+    with contextlib.redirect_stdout(io.StringIO()):
+        enrich_activity_document({"type": "Ride", "stream_data_full": streams})
+
+
+def _ready():
+    return os.getpid()
+
+
+def _start_thread_pool(db_threads=None):
+    global _thread_pool
+    with _start_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=db_threads or DB_THREADS, thread_name_prefix="mongo")
+
+
+def start_executors(workers=None, db_threads=None):
+    """
+    Creates both pools and waits until every enrichment worker is warm. Blocks for
+    the whole spawn; never call it directly from a coroutine.
+    """
+    global _process_pool, _cpu_slots
+    _start_thread_pool(db_threads)
+    with _start_lock:
+        if _process_pool is not None:
+            return
+
+        workers = workers or ENRICH_WORKERS
+        # spawn, not fork: the parent already runs an event loop and Mongo monitor threads
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker,
+        )
+        pids = {f.result() for f in [pool.submit(_ready) for _ in range(workers)]}
+        _process_pool = pool
+        _cpu_slots = None
+    print(f"✅ Started {len(pids)} warm enrichment workers and {db_threads or DB_THREADS} DB threads")
+
+
+def shutdown_executors():
+    global _process_pool, _thread_pool, _cpu_slots
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+    _process_pool = _thread_pool = _cpu_slots = None
+    print("🛑 Enrichment executors stopped")
+
+
+def _slots():
+    """Queue-depth semaphore, one per event loop (uvicorn runs a single loop)."""
+    global _cpu_slots
+    loop = asyncio.get_running_loop()
+    if _cpu_slots is None or _cpu_slots[0] is not loop:
+        _cpu_slots = (loop, asyncio.Semaphore(ENRICH_QUEUE_DEPTH))
+    return _cpu_slots[1]
+
+
+async def run_cpu(fn, *args, timeout=None, **kwargs):
+    """
+    Runs a picklable, module-level function in the enrichment process pool.
+    Raises CpuPoolBusy when too many callers are already waiting, and
+    asyncio.TimeoutError after `timeout` (ENRICH_TASK_TIMEOUT_SEC) seconds; the
+    worker finishes the abandoned task in the background.
+    """
+    global _cpu_waiting
+    if _process_pool is None:
+        await asyncio.to_thread(start_executors)
+
+    slots = _slots()
+    if slots.locked() and _cpu_waiting >= ENRICH_MAX_WAITING:
+        raise CpuPoolBusy(f"{_cpu_waiting} enrichment tasks already waiting")
+    _cpu_waiting += 1
+    try:
+        await slots.acquire()
+    finally:
+        _cpu_waiting -= 1
+    try:
+        future = _process_pool.submit(partial(fn, *args, **kwargs))
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout or ENRICH_TASK_TIMEOUT_SEC)
+    finally:
+        slots.release()
+
+
+async def run_db(fn, *args, **kwargs):
+    """Runs a blocking (pymongo) call in the DB thread pool."""
+    if _thread_pool is None:
+        _start_thread_pool()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_thread_pool, partial(fn, *args, **kwargs))
+
@@ -1,5 +1,114 @@
+import re
+from datetime import datetime
+
+import numpy as np
 from fitparse import FitFile
 
+# FIT record field -> stream_data_full channel, first field present wins
+FIT_STREAM_CHANNELS = {
+    "distance": ["distance"],
+    "heart_rate": ["heart_rate"],
+    "watts": ["power"],
+    "cadence": ["cadence"],
+    "speed": ["enhanced_speed", "speed"],
+    "altitude": ["enhanced_altitude", "altitude"],
+}
+
+
+def read_fit_file(fit_path, records=False):
+    """
+    Decodes a .fit file once and extracts everything the fit engine uses, in a
+    single pass over its messages:
+    {"start_time", "sport", "planned_blocks"} plus "streams" when records=True.
+    Only plain values are returned, so the result can cross process boundaries.
+    """
+    names = ["session", "workout", "workout_step"] + (["record"] if records else [])
+    messages = {name: [] for name in names}
+    for msg in FitFile(str(fit_path)).get_messages(names):
+        # Samples keep get_values() semantics; the rest is read the way get_value() reads it
+        messages[msg.name].append(msg.get_values() if msg.name == "record" else message_values(msg))
+
+    start_time, sport = fit_start_time_and_type(messages["session"], messages["workout"])
+    result = {
+        "start_time": start_time,
+        "sport": sport,
+        "planned_blocks": schedule_from_steps(messages["workout_step"]),
+    }
+    if records:
+        result["streams"] = streams_from_records(messages["record"])
+    return result
+
+
+def message_values(msg):
+    """
+    {field name: value} that answers like msg.get_value(name): subfields are also
+    reachable under their parent field's name (duration_time as duration_value),
+    and the first field with a name wins.
+    """
+    values = {}
+    for field_data in msg.fields:
+        names = [field_data.name]
+        if field_data.field:
+            names.append(field_data.field.name)
+        if field_data.parent_field:
+            names.append(field_data.parent_field.name)
+        for name in names:
+            values.setdefault(name, field_data.value)
+    return values
+
+
+def fit_start_time_and_type(sessions, workouts):
+    """
+    start_time and sport from session messages, falling back to a date in the
+    workout name (at 12:00). Messages are message_values() dicts.
+    """
+    for msg in sessions:
+        ts = msg.get("start_time")
+        sport = msg.get("sport")
+        if isinstance(ts, datetime):
+            return ts, sport
+
+    # Fallback to workout name
+    for msg in workouts:
+        name = msg.get("wkt_name")
+        sport = msg.get("sport")
+        if isinstance(name, str):
+            match = re.search(r"\d{4}-\d{2}-\d{2}", name)
+            if match:
+                try:
+                    date_only = datetime.strptime(match.group(0), "%Y-%m-%d")
+                    ts = date_only.replace(hour=12)  # Default to 12:00 instead of 00:00
+                    return ts, sport
+                except Exception as e:
+                    print(f"❌ Failed to parse fallback date: {e}")
+    return None, None
+
+
+def streams_from_records(records):
+    """
+    Record samples (get_values() dicts) as {channel: float array} in the stream_data_full layout,
+    time_sec relative to the first sample. Like Strava, channels the device
+    never recorded are left out.
+    """
+    records = [r for r in records if r.get("timestamp") is not None]
+    if not records:
+        return {}
+    start = records[0]["timestamp"]
+    streams = {"time_sec": np.array([(r["timestamp"] - start).total_seconds() for r in records])}
+    for channel, fields in FIT_STREAM_CHANNELS.items():
+        for field in fields:
+            values = np.array([r.get(field) for r in records], dtype=float)
+            if not np.isnan(values).all():
+                streams[channel] = values
+                break
+    return streams
+
+
+def parse_fit_streams(fitfile):
+    """Record samples of an already opened FitFile; see streams_from_records."""
+    return streams_from_records([msg.get_values() for msg in fitfile.get_messages("record")])
+
+
 def parse_fit_schedule(fit_path):
     """
     Parses a .fit file and extracts scheduled workout blocks.
@@ -10,17 +119,21 @@ def parse_fit_schedule(fit_path):
         {"type": "cooldown", "duration_sec": 300}
     ]
     """
-    fitfile = FitFile(fit_path)
-    steps = list(fitfile.get_messages("workout_step"))
+    fitfile = FitFile(str(fit_path))
+    return schedule_from_steps([message_values(msg) for msg in fitfile.get_messages("workout_step")])
+
+
+def schedule_from_steps(steps):
+    """Planned blocks from workout_step messages (message_values() dicts)."""
     blocks = []
 
     warmup_count = 0
     i = 0
     while i < len(steps):
         msg = steps[i]
-        intensity = msg.get_value("intensity")
-        duration_type = msg.get_value("duration_type")
-        duration_value = msg.get_value("duration_value")
+        intensity = msg.get("intensity")
+        duration_type = msg.get("duration_type")
+        duration_value = msg.get("duration_value")
 
         # Skip unsupported steps
         if duration_type != "time" or duration_value is None:
@@ -36,14 +149,14 @@ def parse_fit_schedule(fit_path):
             if warmup_count > 1:
                 block_type = "cooldown"
 
-        repeat_count = msg.get_value("repeat_count")
+        repeat_count = msg.get("repeat_count")
         if repeat_count and repeat_count > 1:
             recovery_step = steps[i + 1] if i + 1 < len(steps) else None
             recovery_duration = None
             if recovery_step:
-                rec_dur_type = recovery_step.get_value("duration_type")
-                rec_dur_value = recovery_step.get_value("duration_value")
-                rec_intensity = recovery_step.get_value("intensity")
+                rec_dur_type = recovery_step.get("duration_type")
+                rec_dur_value = recovery_step.get("duration_value")
+                rec_intensity = recovery_step.get("intensity")
                 if rec_dur_type == "time" and rec_intensity == "rest":
                     recovery_duration = int(rec_dur_value)
 
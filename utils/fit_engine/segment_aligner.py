@@ -1,70 +1,153 @@
-from typing import List, Dict
+import math
+from typing import List, Dict, Callable
 import numpy as np
 
+# Cost of leaving a planned block unmatched / of skipping a detected block.
+# Any allowed match costs less than an unmatched planned block, so the alignment
+# first maximizes matches and then minimizes their type and duration error.
+PLANNED_GAP_COST = 1.0
+DETECTED_GAP_COST = 0.0
+# Relative duration difference above which a pair cannot match
+DURATION_TOLERANCE = 0.5
+
+# Detected segment types that can realize each planned workout block type
+PLANNED_TYPE_COMPATIBILITY = {
+    "warmup": ["warmup"],
+    "cooldown": ["cooldown"],
+    "steady": ["steady"],
+    "long_effort": ["steady"],
+    "tempo_run": ["steady", "interval"],
+    "tempo_interval": ["interval", "acceleration"],
+    "sprint_interval": ["interval", "acceleration"],
+}
+COMPATIBLE_TYPE_COST = 0.25
+
 
 def iou_range(range_a, range_b):
-    """Compute the Intersection over Union of two index ranges."""
-    set_a = set(range(range_a[0], range_a[1] + 1))
-    set_b = set(range(range_b[0], range_b[1] + 1))
-    intersection = set_a & set_b
-    union = set_a | set_b
-    return len(intersection) / len(union) if union else 0
+    """Compute the Intersection over Union of two inclusive index ranges."""
+    len_a = max(range_a[1] - range_a[0] + 1, 0)
+    len_b = max(range_b[1] - range_b[0] + 1, 0)
+    intersection = max(min(range_a[1], range_b[1]) - max(range_a[0], range_b[0]) + 1, 0)
+    union = len_a + len_b - intersection
+    return intersection / union if union else 0
 
 
-def align_planned_to_detected(planned_blocks: List[Dict], detected_blocks: List[Dict]) -> List[Dict]:
-    """
-    Attempts to align planned training blocks (from .fit) with actual detected segmentSequence (from Strava).
-    Returns list of aligned pairs with match quality info.
-    """
-    results = []
-    detected_used = set()
+def exact_type_cost(planned: Dict, detected: Dict) -> float:
+    """Only identical types may match."""
+    return 0.0 if planned["type"] == detected["type"] else math.inf
+
 
-    current_index = 0  # Index into detected_blocks
+def compatible_type_cost(planned: Dict, detected: Dict) -> float:
+    """Identical types match for free, types listed in PLANNED_TYPE_COMPATIBILITY at a small cost."""
+    if planned["type"] == detected["type"]:
+        return 0.0
+    if detected["type"] in PLANNED_TYPE_COMPATIBILITY.get(planned["type"], []):
+        return COMPATIBLE_TYPE_COST
+    return math.inf
 
-    for i, planned in enumerate(planned_blocks):
-        best_match = None
-        best_iou = 0
-        planned_duration = planned.get("duration_sec", 0)
 
-        # Try to find best matching detected block
-        for j in range(current_index, len(detected_blocks)):
-            detected = detected_blocks[j]
-            if j in detected_used:
-                continue
+def duration_tolerance_cost(planned: Dict, detected: Dict) -> float:
+    """Relative duration error, or inf when it exceeds DURATION_TOLERANCE."""
+    planned_duration = planned.get("duration_sec", 0)
+    duration_diff = abs(planned_duration - detected["duration_sec"])
+    if duration_diff > DURATION_TOLERANCE * planned_duration:
+        return math.inf
+    return duration_diff / planned_duration if planned_duration else 0.0
 
-            if planned["type"] != detected["type"]:
-                continue
 
-            detected_duration = detected["duration_sec"]
-            duration_diff = abs(planned_duration - detected_duration)
+def _match_costs(planned_blocks, detected_blocks, type_cost, duration_cost):
+    rows = []
+    for planned in planned_blocks:
+        row = []
+        for detected in detected_blocks:
+            cost = type_cost(planned, detected)
+            row.append(cost if cost == math.inf else cost + duration_cost(planned, detected))
+        rows.append(row)
+    return np.array(rows, dtype=float).reshape(len(planned_blocks), len(detected_blocks))
 
-            # Only consider segments that are not too far off in duration
-            if duration_diff > 0.5 * planned_duration:
-                continue
 
+def _cost_table(costs, planned_gap_cost, detected_gap_cost):
+    """
+    Needleman–Wunsch table: table[i, j] is the cheapest alignment of the first i
+    planned and the first j detected blocks. Skipping detected blocks is a running
+    minimum along the row, so each planned block is filled with NumPy in one pass.
+    """
+    n, m = costs.shape
+    steps = np.arange(m + 1) * detected_gap_cost
+    table = np.empty((n + 1, m + 1))
+    table[0] = steps
+    for i in range(1, n + 1):
+        best = table[i - 1] + planned_gap_cost
+        best[1:] = np.minimum(best[1:], table[i - 1, :-1] + costs[i - 1])
+        table[i] = np.minimum.accumulate(best - steps) + steps
+    return table
+
+
+def _traceback(table, costs, planned_gap_cost, detected_gap_cost):
+    """Detected index matched to each planned block (or None), preferring matches on ties."""
+    i, j = costs.shape
+    table, costs = table.tolist(), costs.tolist()
+    matches = [None] * i
+    while i > 0:
+        if j > 0 and math.isclose(table[i][j], table[i - 1][j - 1] + costs[i - 1][j - 1]):
+            matches[i - 1] = j - 1
+            i, j = i - 1, j - 1
+        elif j > 0 and math.isclose(table[i][j], table[i][j - 1] + detected_gap_cost):
+            j -= 1
+        else:
+            i -= 1
+    return matches
+
+
+def align_blocks(
+    planned_blocks: List[Dict],
+    detected_blocks: List[Dict],
+    type_cost: Callable[[Dict, Dict], float] = exact_type_cost,
+    duration_cost: Callable[[Dict, Dict], float] = duration_tolerance_cost,
+    planned_gap_cost: float = PLANNED_GAP_COST,
+    detected_gap_cost: float = DETECTED_GAP_COST,
+) -> Dict:
+    """
+    Globally optimal monotone alignment of planned blocks (from .fit) to detected
+    segmentSequence blocks, with gaps on both sides. A pair costs
+    type_cost + duration_cost; inf marks pairs that may not match.
+    Returns {"alignment": [row per planned block], "cost": total alignment cost}.
+    """
+    costs = _match_costs(planned_blocks, detected_blocks, type_cost, duration_cost)
+    table = _cost_table(costs, planned_gap_cost, detected_gap_cost)
+    matches = _traceback(table, costs, planned_gap_cost, detected_gap_cost)
+
+    results = []
+    current_index = 0  # End of the previous matched detected block
+    for planned, j in zip(planned_blocks, matches):
+        match = detected_blocks[j] if j is not None else None
+        iou = 0.0
+        if match:
+            planned_duration = planned.get("duration_sec", 0)
             iou = iou_range(
                 (current_index, current_index + planned_duration),
-                (detected["start_index"], detected["end_index"])
+                (match["start_index"], match["end_index"])
             )
-
-            if iou > best_iou:
-                best_match = detected
-                best_iou = iou
+            current_index = match["end_index"]
 
         results.append({
             "planned_type": planned["type"],
             "planned_duration": planned.get("duration_sec"),
-            "matched": bool(best_match),
-            "match_iou": round(best_iou, 2) if best_match else 0.0,
-            "detected_start_index": best_match.get("start_index") if best_match else None,
-            "detected_duration": best_match.get("duration_sec") if best_match else None
+            "matched": bool(match),
+            "match_iou": round(iou, 2) if match else 0.0,
+            "detected_start_index": match.get("start_index") if match else None,
+            "detected_duration": match.get("duration_sec") if match else None
         })
 
-        if best_match:
-            detected_used.add(detected_blocks.index(best_match))
-            current_index = best_match["end_index"]
+    return {"alignment": results, "cost": float(table[-1, -1])}
+
 
-    return results
+def align_planned_to_detected(planned_blocks: List[Dict], detected_blocks: List[Dict], **costs) -> List[Dict]:
+    """
+    Attempts to align planned training blocks (from .fit) with actual detected segmentSequence (from Strava).
+    Returns list of aligned pairs with match quality info.
+    """
+    return align_blocks(planned_blocks, detected_blocks, **costs)["alignment"]
 
 
 def score_segment_accuracy(alignment: List[Dict]) -> Dict:
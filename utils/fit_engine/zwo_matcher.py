@@ -1,17 +1,11 @@
-from pymongo import MongoClient
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-import os
+from mongo_utils import get_collection
 import re
 from pathlib import Path
 
 # Load .env settings
 load_dotenv()
-mongo_url = os.getenv("MONGO_URL")
-db_name = os.getenv("DB_NAME", "test")
-client = MongoClient(mongo_url)
-db = client[db_name]
-collection = db["stravaactivities"]
 
 def extract_date_from_filename(filename):
     match = re.search(r"\d{4}-\d{2}-\d{2}", filename)
@@ -40,7 +34,7 @@ def match_zwo_file_to_activity(filename: str, user_id: str, fallback_sport: str
     }
 
     print(f"🔍 ZWO date-based query: {query}")
-    matches = list(collection.find(query).sort("startDate", 1))
+    matches = list(get_collection().find(query).sort("startDate", 1))
 
     if not matches:
         print(f"❌ No match found on {date_estimate.date()} for sport={fallback_sport}")
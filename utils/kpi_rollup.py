@@ -0,0 +1,252 @@
+"""
+Weekly KPI rollups.
+
+One document per (userId, sport, week) in the kpiweeklyrollups collection:
+
+    {
+        "userId": ..., "sport": "Run", "week": "2024-W09",
+        "activities": {
+            "<activity _id>": {"session": {...}, "stats": {"pace_n": 4, "pace_sum": ..., ...}},
+            ...
+        },
+        "updatedAt": ...
+    }
+
+Each activity keeps its own sufficient statistics (counts, sums, sums of squares),
+so re-enriching an activity simply overwrites its entry; build_rollup_cleanup
+removes the entry from any other week or sport document first, in case the
+activity's startDate or type changed. Week totals are summed
+when read, and weekly_metrics() turns them into the same values
+compute_kpi_trends_with_sessions derives from the raw segment rows.
+
+Enrichment only updates the entries of the activities it touches, so a user's
+rollups are complete only after scripts/rebuild_kpi_rollups.py has run for them.
+That script marks the user {"_id": userId, "complete": True} in kpirollupstatus,
+and readers should fall back to raw activities without that marker. Nothing
+removes the entry of a deleted activity: after deleting activities, re-run
+scripts/rebuild_kpi_rollups.py for their users.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, UTC
+
+import numpy as np
+from dateutil import parser
+
+from utils.segment_kpis import normalize_weekly_kpis
+
+# Counters and sums; every key is additive across segments, activities and sports
+STAT_KEYS = [
+    "rows",
+    "hr_eff_n", "hr_eff_sum", "distance_pos",
+    "pace_n", "pace_sum", "pace_sumsq",
+    "zone_n", "zone_sum", "zone_pos",
+    "duration_n", "duration_sum", "duration_sumsq", "duration_pos",
+    "short_n", "short_watts_n", "short_watts_sum",
+    "load_n", "load_sum",
+    "hr_recovery_n", "hr_recovery_sum",
+    "hr_drift_n", "hr_drift_sum",
+]
+WEEK_FORMAT = "%Y-W%U"
+# Duration below which a segment counts towards high_intensity_watts
+HIGH_INTENSITY_MAX_MIN = 5
+
+
+def _num(value):
+    return float("nan") if value is None else float(value)
+
+
+def _ratio(a, b):
+    """a / b with the pandas/NumPy semantics the KPI code relies on (x/0 -> inf, 0/0 -> nan)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return float(np.float64(a) / np.float64(b))
+
+
+def _add(stats, prefix, value, squares=False):
+    if math.isnan(value):
+        return
+    stats[f"{prefix}_n"] += 1
+    stats[f"{prefix}_sum"] += value
+    if squares:
+        stats[f"{prefix}_sumsq"] += value * value
+
+
+def segment_stats(segments) -> dict:
+    """Sufficient statistics of one activity's segments, mirroring the KPI segment rows."""
+    stats = dict.fromkeys(STAT_KEYS, 0)
+    for seg in segments:
+        hr = _num(seg.get("avg_heart_rate"))
+        pace = _num(seg.get("avg_speed"))
+        watts = _num(seg.get("avg_watts"))
+        duration_min = seg.get("duration_sec", 0) / 60
+        distance_km = seg.get("avg_distance", 0) / 1000
+        zone = _num(seg.get("zone_match_score"))
+
+        stats["rows"] += 1
+        _add(stats, "hr_eff", _ratio(hr, distance_km))
+        stats["distance_pos"] += distance_km > 0
+        if pace > 0:
+            _add(stats, "pace", pace, squares=True)
+        _add(stats, "zone", zone)
+        stats["zone_pos"] += zone > 0
+        _add(stats, "duration", duration_min, squares=True)
+        stats["duration_pos"] += duration_min > 0
+        if duration_min < HIGH_INTENSITY_MAX_MIN:
+            stats["short_n"] += 1
+            _add(stats, "short_watts", watts)
+        _add(stats, "load", _ratio(watts, duration_min))
+        _add(stats, "hr_recovery", _num(seg.get("hr_recovery_60s")))
+        _add(stats, "hr_drift", _num(seg.get("hr_drift_ratio")))
+    return stats
+
+
+def combine_stats(stats_list) -> dict:
+    total = dict.fromkeys(STAT_KEYS, 0)
+    for stats in stats_list:
+        for key in STAT_KEYS:
+            total[key] += stats.get(key, 0)
+    return total
+
+
+def _mean(stats, prefix):
+    n = stats[f"{prefix}_n"]
+    return stats[f"{prefix}_sum"] / n if n else float("nan")
+
+
+def weekly_metrics(stats) -> dict:
+    """One week's KPI values, in the order compute_kpi_trends_with_sessions emits them."""
+    metrics = {}
+    if stats["distance_pos"]:
+        metrics["hr_efficiency"] = _mean(stats, "hr_eff")
+
+    n = stats["pace_n"]
+    if n < 2:
+        metrics["pace_consistency"] = None
+    else:
+        mean = stats["pace_sum"] / n
+        std = math.sqrt(max(stats["pace_sumsq"] / n - mean * mean, 0.0))
+        metrics["pace_consistency"] = 1 - std / mean
+
+    if stats["zone_pos"]:
+        metrics["zone_compliance"] = _mean(stats, "zone")
+    metrics["effort_matching"] = _mean(stats, "zone")
+
+    n = stats["duration_n"]
+    if n < 2:
+        metrics["completion_delta"] = float("nan")
+    else:
+        variance = (stats["duration_sumsq"] - stats["duration_sum"] ** 2 / n) / (n - 1)
+        metrics["completion_delta"] = math.sqrt(max(variance, 0.0))
+
+    if stats["short_n"]:
+        metrics["high_intensity_watts"] = _mean(stats, "short_watts")
+    if stats["duration_pos"]:
+        metrics["load_efficiency"] = _mean(stats, "load")
+    if stats["hr_recovery_n"]:
+        metrics["hr_recovery_60s"] = _mean(stats, "hr_recovery")
+    if stats["hr_drift_n"]:
+        metrics["hr_drift_ratio"] = _mean(stats, "hr_drift")
+    return metrics
+
+
+def week_key(date: datetime) -> str:
+    return date.strftime(WEEK_FORMAT)
+
+
+def activity_week(activity):
+    start_date = activity.get("startDate")
+    if start_date is None:
+        return None, None
+    date = start_date if isinstance(start_date, datetime) else parser.parse(start_date)
+    return date, week_key(date)
+
+
+def activity_entry(activity):
+    """(week, rollup entry) for an activity with segments, else (week, None)."""
+    date, week = activity_week(activity)
+    segments = activity.get("segments") or []
+    if week is None or not segments:
+        return week, None
+    session = {
+        "activity_id": activity.get("stravaId") or activity.get("_id"),
+        "activity_type": activity.get("type"),
+        "activity_name": activity.get("name"),
+        "date": date.isoformat(),
+    }
+    return week, {"session": session, "stats": segment_stats(segments)}
+
+
+def build_rollup_update(activity):
+    """
+    (filter, update) that stores the activity's entry in its week's rollup, or
+    removes it when the activity no longer has segments. None without _id or startDate.
+    """
+    week, entry = activity_entry(activity)
+    if week is None or "_id" not in activity:
+        return None
+    key = f"activities.{activity['_id']}"
+    update = {"$set": {"updatedAt": datetime.now(UTC)}}
+    if entry:
+        update["$set"][key] = entry
+    else:
+        update["$unset"] = {key: ""}
+    return {"userId": activity.get("userId"), "sport": activity.get("type"), "week": week}, update
+
+
+def build_rollup_cleanup(activity):
+    """
+    (filter, update) for update_many that removes the activity's entry from every
+    rollup of its user except the one build_rollup_update writes, so a changed
+    type or startDate does not leave it counted twice. Touches disjoint documents
+    from build_rollup_update, so the two can go in one unordered bulk_write.
+    """
+    if "_id" not in activity:
+        return None
+    _, week = activity_week(activity)
+    key = f"activities.{activity['_id']}"
+    query = {
+        "userId": activity.get("userId"),
+        key: {"$exists": True},
+        "$or": [{"sport": {"$ne": activity.get("type")}}, {"week": {"$ne": week}}],
+    }
+    return query, {"$unset": {key: ""}, "$set": {"updatedAt": datetime.now(UTC)}}
+
+
+def trends_from_week_entries(week_entries) -> list:
+    """KPI trends from {week: [entry, ...]}, matching compute_kpi_trends_with_sessions."""
+    metric_values = defaultdict(list)
+    session_map = {}
+    totals = {}
+    for week in sorted(week_entries):
+        entries = week_entries[week]
+        if not entries:
+            continue
+        session_map[week] = sorted((e["session"] for e in entries), key=lambda s: (s["date"], str(s["activity_id"])))
+        totals[week] = combine_stats(e["stats"] for e in entries)
+        for metric, value in weekly_metrics(totals[week]).items():
+            metric_values[metric].append((week, value))
+    for week, stats in totals.items():
+        metric_values["segment_frequency"].append((week, stats["rows"]))
+
+    if not totals:
+        return []
+    return normalize_weekly_kpis(metric_values, session_map)
+
+
+def trends_from_rollups(rollup_docs, boundary_activities=(), boundary_weeks=()):
+    """
+    (entries used, trends) from weekly rollup documents. Weeks in boundary_weeks
+    (the partial first and last week of a date range) are rebuilt from
+    boundary_activities instead of their rollup document.
+    """
+    week_entries = defaultdict(list)
+    for doc in rollup_docs:
+        if doc["week"] not in boundary_weeks:
+            week_entries[doc["week"]].extend((doc.get("activities") or {}).values())
+    for activity in boundary_activities:
+        week, entry = activity_entry(activity)
+        if entry and week in boundary_weeks:
+            week_entries[week].append(entry)
+
+    used = sum(len(entries) for entries in week_entries.values())
+    return used, trends_from_week_entries(week_entries)
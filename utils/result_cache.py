@@ -0,0 +1,178 @@
+"""
+Result cache for read endpoints (/ml/analyze-trends, /ml/predict-user).
+
+Keys combine the endpoint, a hash of the request parameters and the user's data
+version. Enriching an activity through the API bumps that version; old entries
+simply age out of the LRU.
+
+RESULT_CACHE_BACKEND:
+    "memory"  bounded in-process LRU with TTL (default). Data versions live in
+              the process too, so only enrichment by the same API worker
+              invalidates; after offline re-enrichment (rerun_enrichment,
+              backfill_enrichment, fit_align_runner) results can be stale for
+              up to RESULT_CACHE_TTL_SEC
+    "mongo"   the same LRU in front of a Mongo TTL collection shared by every
+              worker; data versions are kept in Mongo too, so a bump from any
+              worker or script invalidates everywhere. Scripts only bump
+              versions with this backend
+    "off"     no caching
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, UTC
+
+from dotenv import load_dotenv
+
+import mongo_utils as mongo
+from mongo_utils import RESULT_CACHE, DATA_VERSIONS
+from utils.enrichment_helpers import convert_numpy_types
+from utils.executors import run_db
+
+load_dotenv()
+
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 1024))
+RESULT_CACHE_TTL_SEC = float(os.getenv("RESULT_CACHE_TTL_SEC", 300))
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (expires_at, value)
+_versions = {}            # user_id -> data version (memory backend)
+_indexes_ready = False
+stats = {"hits": 0, "shared_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+
+def _bump(counter):
+    with _lock:
+        stats[counter] += 1
+
+
+def _shared():
+    """The shared cache collection, with its TTL index created on first use."""
+    global _indexes_ready
+    collection = mongo.get_collection(RESULT_CACHE)
+    if not _indexes_ready:
+        collection.create_index("expiresAt", expireAfterSeconds=0)
+        _indexes_ready = True
+    return collection
+
+
+# Data versions
+
+def user_version(user_id) -> int:
+    if RESULT_CACHE_BACKEND == "mongo":
+        doc = mongo.get_collection(DATA_VERSIONS).find_one({"_id": user_id}, {"version": 1})
+        return doc["version"] if doc else 0
+    with _lock:
+        return _versions.get(user_id, 0)
+
+
+def bump_user_version(user_id):
+    """
+    Invalidates every cached result for the user; call after their activities change.
+    With the memory backend this only reaches the calling process.
+    """
+    if RESULT_CACHE_BACKEND == "mongo":
+        mongo.get_collection(DATA_VERSIONS).update_one({"_id": user_id}, {"$inc": {"version": 1}}, upsert=True)
+        return
+    with _lock:
+        _versions[user_id] = _versions.get(user_id, 0) + 1
+
+
+async def invalidate_user(user_id):
+    if RESULT_CACHE_BACKEND == "mongo":
+        await run_db(bump_user_version, user_id)
+    elif RESULT_CACHE_BACKEND != "off":
+        bump_user_version(user_id)
+
+
+# Entries
+
+def cache_key(endpoint, user_id, params, version) -> str:
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return f"{endpoint}:{user_id}:v{version}:{digest}"
+
+
+def get_local(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del _entries[key]
+            stats["expired"] += 1
+            return None
+        _entries.move_to_end(key)
+        stats["hits"] += 1
+        return entry
+
+
+def put_local(key, value):
+    with _lock:
+        _entries[key] = (time.monotonic() + RESULT_CACHE_TTL_SEC, value)
+        _entries.move_to_end(key)
+        stats["stores"] += 1
+        while len(_entries) > RESULT_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            stats["evictions"] += 1
+
+
+def get_shared(key):
+    doc = _shared().find_one({"_id": key, "expiresAt": {"$gt": datetime.now(UTC)}})
+    return doc["value"] if doc else None
+
+
+def put_shared(key, value):
+    expires_at = datetime.now(UTC) + timedelta(seconds=RESULT_CACHE_TTL_SEC)
+    document = {"_id": key, "value": convert_numpy_types(value), "expiresAt": expires_at}
+    _shared().replace_one({"_id": key}, document, upsert=True)
+
+
+async def get_or_compute(endpoint, user_id, params, compute):
+    """
+    Returns the cached result for (endpoint, params, user's data version) or awaits
+    compute() and caches it. Exceptions from compute() are not cached.
+    """
+    if RESULT_CACHE_BACKEND == "off":
+        return await compute()
+
+    shared = RESULT_CACHE_BACKEND == "mongo"
+    version = await run_db(user_version, user_id) if shared else user_version(user_id)
+    key = cache_key(endpoint, user_id, params, version)
+
+    entry = get_local(key)
+    if entry is not None:
+        return entry[1]
+
+    if shared:
+        value = await run_db(get_shared, key)
+        if value is not None:
+            _bump("shared_hits")
+            put_local(key, value)
+            return value
+
+    _bump("misses")
+    value = await compute()
+    put_local(key, value)
+    if shared:
+        await run_db(put_shared, key, value)
+    return value
+
+
+def cache_stats():
+    with _lock:
+        counters = dict(stats)
+        size = len(_entries)
+    lookups = counters["hits"] + counters["shared_hits"] + counters["misses"]
+    return {
+        "backend": RESULT_CACHE_BACKEND,
+        "size": size,
+        "max_entries": RESULT_CACHE_MAX_ENTRIES,
+        "ttl_sec": RESULT_CACHE_TTL_SEC,
+        **counters,
+        "hit_ratio": (counters["hits"] + counters["shared_hits"]) / lookups if lookups else None,
+    }
@@ -0,0 +1,35 @@
+import numpy as np
+
+
+def mask_runs(mask, closed_only=True):
+    """
+    Start (inclusive) and end (exclusive) positions of every run of True in a
+    boolean mask. With closed_only, a run still open at the end of the stream is
+    dropped, matching detectors that only emit a block once it has finished.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    starts, ends = edges[0::2], edges[1::2]
+    if closed_only and len(ends) and ends[-1] == len(mask):
+        starts, ends = starts[:-1], ends[:-1]
+    return starts, ends
+
+
+def latched_mask(on, off):
+    """
+    State of a switch that turns on where `on`, off where `off` and otherwise keeps
+    its previous value (starting off). Samples that are neither, such as NaN
+    comparisons, extend whatever run they fall in.
+    """
+    on = np.asarray(on, dtype=bool)
+    off = np.asarray(off, dtype=bool)
+    has_event = on | off
+    last_event = np.where(has_event, np.arange(len(on)), -1)
+    np.maximum.accumulate(last_event, out=last_event)
+    return (last_event >= 0) & on[np.maximum(last_event, 0)]
+
+
+def run_durations(time_sec, starts, ends):
+    """Elapsed time between run boundary positions, taken from the time stream."""
+    time_sec = np.asarray(time_sec, dtype=float)
+    return time_sec[ends] - time_sec[starts]
@@ -3,7 +3,17 @@ from collections import defaultdict
 from datetime import datetime
 from dateutil import parser
 import numpy as np
-from typing import List, Optional
+from typing import Iterable, List, Optional
+
+# Every activity and segment field compute_kpi_trends_with_sessions reads, as a Mongo projection
+KPI_SEGMENT_FIELDS = [
+    "avg_heart_rate", "avg_speed", "avg_watts", "duration_sec", "avg_distance",
+    "zone_match_score", "hr_recovery_60s", "hr_drift_ratio",
+]
+KPI_PROJECTION = {
+    "startDate": 1, "type": 1, "name": 1, "stravaId": 1,
+    **{f"segments.{field}": 1 for field in KPI_SEGMENT_FIELDS},
+}
 
 def calculate_pace_consistency(paces: List[float]) -> Optional[float]:
     if not paces or len(paces) < 2:
@@ -13,139 +23,165 @@ def calculate_pace_consistency(paces: List[float]) -> Optional[float]:
         return None
     return 1 - (np.std(paces) / np.mean(paces))  # normalized consistency score
 
-def compute_kpi_trends_with_sessions(activities: List[dict], start_date: Optional[str] = None, end_date: Optional[str] = None, activity_type: Optional[str] = None):
+def _nanmean(values: np.ndarray) -> float:
+    """Series.mean() on a float array, with the same summation so results are bit-identical."""
+    mask = np.isnan(values)
+    count = values.size - mask.sum()
+    if not count:
+        return np.nan
+    return np.where(mask, 0, values).sum(dtype=np.float64) / count
+
+def _dropna_mean(values: np.ndarray) -> float:
+    """Series.dropna().mean(): sums the compacted values, which can round differently from _nanmean."""
+    return _nanmean(values[~np.isnan(values)])
+
+def _nanstd(values: np.ndarray) -> float:
+    """Series.std() (ddof=1) on a float array, computed the way pandas does."""
+    mask = np.isnan(values)
+    count = values.size - mask.sum()
+    if count < 2:
+        return np.nan
+    avg = np.where(mask, 0, values).sum(dtype=np.float64) / count
+    with np.errstate(invalid="ignore"):
+        squares = (avg - values) ** 2
+    squares[mask] = 0
+    return np.sqrt(squares.sum(dtype=np.float64) / (count - 1))
+
+def _segment_column(segments: list, field: str) -> np.ndarray:
+    return np.array([seg.get(field) for seg in segments], dtype=float)
+
+def compute_kpi_trends_with_sessions(activities: Iterable[dict], start_date: Optional[str] = None, end_date: Optional[str] = None, activity_type: Optional[str] = None):
+    start_bound = parser.parse(start_date) if start_date else None
+    end_bound = parser.parse(end_date) if end_date else None
 
-    segment_rows = []
     session_map = defaultdict(list)
-    total_segments = 0
-    valid_segments = 0
-    logged_example = False
+    segments = []
+    segment_weeks = []
+    scanned = 0
 
+    # Iterated once, so a Mongo cursor can be passed directly
     for activity in activities:
+        scanned += 1
         if activity_type and activity.get("type") != activity_type:
             continue
 
         start_date_raw = activity.get("startDate")
         date = start_date_raw if isinstance(start_date_raw, datetime) else parser.parse(start_date_raw)
 
-        if start_date and date < parser.parse(start_date):
+        if start_bound and date < start_bound:
             continue
-        if end_date and date > parser.parse(end_date):
+        if end_bound and date > end_bound:
             continue
 
         week = date.strftime("%Y-W%U")
-        iso_date = date.strftime("%Y-%m-%d")
-        activity_id = activity.get("stravaId") or activity.get("_id")
 
         # Store metadata for plotting
         session_map[week].append({
-            "activity_id": activity_id,
+            "activity_id": activity.get("stravaId") or activity.get("_id"),
             "activity_type": activity.get("type"),
             "activity_name": activity.get("name"),
             "date": date.isoformat(),
         })
 
-        for seg in activity.get("segments", []):
-            total_segments += 1
+        activity_segments = activity.get("segments", [])
+        segments.extend(activity_segments)
+        segment_weeks.extend([week] * len(activity_segments))
 
-            if not logged_example:
-                print("🔎 Example segment keys:", seg.keys())
-                print("🔎 Example segment content:", seg)
-                logged_example = True
+    if segments:
+        print("🔎 Example segment keys:", segments[0].keys())
+        print("🔎 Example segment content:", segments[0])
+    print(f"✅ Processed {len(segments)} segment rows from {scanned} activities.")
+    print(f"🔎 Total segments scanned: {len(segments)}, valid segments used: {len(segments)}")
 
-            hr_avg = seg.get("avg_heart_rate")
-            pace = seg.get("avg_speed")
-            watts_avg = seg.get("avg_watts")
-            duration_min = seg.get("duration_sec", 0) / 60
-            distance_km = seg.get("avg_distance", 0) / 1000
-            zone_score = seg.get("zone_match_score")
-            hr_recovery = seg.get("hr_recovery_60s")
-            hr_drift = seg.get("hr_drift_ratio")
-
-            segment_rows.append({
-                "week": week,
-                "date": iso_date,
-                "hr": hr_avg,
-                "watts": watts_avg,
-                "pace": pace,
-                "distance_km": distance_km,
-                "duration_min": duration_min,
-                "zone_score": zone_score,
-                "activity_type": activity.get("type"),
-                "activity_id": activity_id,
-                "hr_recovery_60s": hr_recovery,
-                "hr_drift_ratio": hr_drift,
-            })
-            valid_segments += 1
-
-    print(f"✅ Processed {len(segment_rows)} segment rows from {len(activities)} activities.")
-    print(f"🔎 Total segments scanned: {total_segments}, valid segments used: {valid_segments}")
-
-    df = pd.DataFrame(segment_rows)
-    if df.empty:
+    if not segments:
         print("⚠️ No segment rows found after filtering. Returning empty trends.")
         return []
 
-    df_by_week = df.groupby("week")
-    print(f"📊 KPI groups by week: {df_by_week.size().to_dict()}")
+    # One flattened frame, one row per segment
+    df = pd.DataFrame({
+        "week": segment_weeks,
+        "hr": _segment_column(segments, "avg_heart_rate"),
+        "watts": _segment_column(segments, "avg_watts"),
+        "pace": _segment_column(segments, "avg_speed"),
+        "distance_km": np.array([seg.get("avg_distance", 0) for seg in segments], dtype=float) / 1000,
+        "duration_min": np.array([seg.get("duration_sec", 0) for seg in segments], dtype=float) / 60,
+        "zone_score": _segment_column(segments, "zone_match_score"),
+        "hr_recovery_60s": _segment_column(segments, "hr_recovery_60s"),
+        "hr_drift_ratio": _segment_column(segments, "hr_drift_ratio"),
+    })
+    df["hr_per_km"] = df["hr"] / df["distance_km"]
+    df["watts_per_min"] = df["watts"] / df["duration_min"]
+    df["high_intensity"] = df["duration_min"] < 5
+
+    weekly = df.assign(
+        has_distance=df["distance_km"] > 0,
+        has_zone=df["zone_score"] > 0,
+        has_duration=df["duration_min"] > 0,
+    ).groupby("week").agg(
+        count=("week", "size"),
+        has_distance=("has_distance", "any"),
+        has_zone=("has_zone", "any"),
+        has_duration=("has_duration", "any"),
+        high_intensity=("high_intensity", "any"),
+        has_recovery=("hr_recovery_60s", "count"),
+        has_drift=("hr_drift_ratio", "count"),
+    )
+    print(f"📊 KPI groups by week: {weekly['count'].to_dict()}")
+
+    # Rows sorted by week, keeping their order within a week, so every
+    # week is a contiguous slice; float reductions then match per-group pandas exactly
+    order = np.argsort(pd.Categorical(df["week"], categories=weekly.index).codes, kind="stable")
+    columns = {col: df[col].to_numpy()[order] for col in df.columns if col != "week"}
+    bounds = np.concatenate([[0], np.cumsum(weekly["count"].to_numpy())])
+    weekly_flags = {name: weekly[name].to_numpy() for name in weekly.columns}
 
-    all_trends = []
     metric_values = defaultdict(list)
-
-    for week, group in df_by_week:
+    for i, week in enumerate(weekly.index):
+        flags = {name: values[i] for name, values in weekly_flags.items()}
+        rows = slice(bounds[i], bounds[i + 1])
+        col = {name: values[rows] for name, values in columns.items()}
         metrics = {}
-        dates = group["date"].tolist()
-        rep_date = sorted(dates)[-1] if dates else week  # use most recent date of the week
 
-        if (group["distance_km"] > 0).any():
-            hr_eff = (group["hr"] / group["distance_km"]).mean()
-            metrics["hr_efficiency"] = hr_eff
+        if flags["has_distance"]:
+            metrics["hr_efficiency"] = _nanmean(col["hr_per_km"])
 
-        metrics["pace_consistency"] = calculate_pace_consistency(group["pace"].dropna().tolist())
+        paces = col["pace"]
+        metrics["pace_consistency"] = calculate_pace_consistency(paces[~np.isnan(paces)].tolist())
 
-        if (group["zone_score"] > 0).any():
-            metrics["zone_compliance"] = group["zone_score"].mean()
+        if flags["has_zone"]:
+            metrics["zone_compliance"] = _nanmean(col["zone_score"])
 
-        metrics["effort_matching"] = group["zone_score"].mean()
-        metrics["completion_delta"] = group["duration_min"].std()
+        metrics["effort_matching"] = _nanmean(col["zone_score"])
+        metrics["completion_delta"] = _nanstd(col["duration_min"])
 
-        high_intensity = group[group["duration_min"] < 5]
-        if not high_intensity.empty:
-            metrics["high_intensity_watts"] = high_intensity["watts"].mean()
+        if flags["high_intensity"]:
+            metrics["high_intensity_watts"] = _nanmean(col["watts"][col["high_intensity"]])
 
-        if (group["duration_min"] > 0).any():
-            metrics["load_efficiency"] = (group["watts"] / group["duration_min"]).mean()
+        if flags["has_duration"]:
+            metrics["load_efficiency"] = _nanmean(col["watts_per_min"])
 
-        if (group["hr_recovery_60s"].notna()).any():
-            metrics["hr_recovery_60s"] = group["hr_recovery_60s"].dropna().mean()
+        if flags["has_recovery"]:
+            metrics["hr_recovery_60s"] = _dropna_mean(col["hr_recovery_60s"])
 
-        if (group["hr_drift_ratio"].notna()).any():
-            metrics["hr_drift_ratio"] = group["hr_drift_ratio"].dropna().mean()
+        if flags["has_drift"]:
+            metrics["hr_drift_ratio"] = _dropna_mean(col["hr_drift_ratio"])
 
         for metric, value in metrics.items():
-            all_trends.append({
-                "metric": metric,
-                "week": week,
-                "date": rep_date,
-                "value": value,
-                "sessions": session_map[week]
-            })
             metric_values[metric].append((week, value))
 
     # Segment count
-    segment_counts = df.groupby("week").size().reset_index(name='count')
-    for _, row in segment_counts.iterrows():
-        rep_date = sorted([s["date"] for s in session_map[row["week"]]])[-1]
-        all_trends.append({
-            "metric": "segment_frequency",
-            "week": row["week"],
-            "date": rep_date,
-            "value": row["count"],
-            "sessions": session_map[row["week"]]
-        })
-        metric_values["segment_frequency"].append((row["week"], row["count"]))
+    metric_values["segment_frequency"] = list(zip(weekly.index, weekly["count"].to_numpy()))
+
+    return normalize_weekly_kpis(metric_values, session_map)
+
+def normalize_weekly_kpis(metric_values: dict, session_map: dict) -> List[dict]:
+    """
+    Min-max normalizes each metric's weekly values ({metric: [(week, value), ...]})
+    and adds the composite fitness index. Shared by the raw-segment and rollup paths.
+    """
+    # Most recent session date per week, computed once
+    rep_dates = {week: max(s["date"] for s in sessions) for week, sessions in session_map.items()}
 
-    # Normalize
     normalized_trends = []
     for metric, week_values in metric_values.items():
         filtered = [(week, v) for week, v in week_values if v is not None]
@@ -162,11 +198,10 @@ def compute_kpi_trends_with_sessions(activities: List[dict], start_date: Optiona
             norm_values = [(v - min_v) / (max_v - min_v) for v in values]
 
         for week, norm in zip(weeks, norm_values):
-            rep_date = sorted([s["date"] for s in session_map[week]])[-1]
             normalized_trends.append({
                 "metric": metric + "_norm",
                 "week": week,
-                "date": rep_date,
+                "date": rep_dates[week],
                 "value": norm,
                 "sessions": session_map[week]
             })
@@ -187,11 +222,10 @@ def compute_kpi_trends_with_sessions(activities: List[dict], start_date: Optiona
 
     for week, val in fitness_index.items():
         score = val["sum"] / val["weight"]
-        rep_date = sorted([s["date"] for s in session_map[week]])[-1]
         normalized_trends.append({
             "metric": "fitness_index",
             "week": week,
-            "date": rep_date,
+            "date": rep_dates[week],
             "value": score,
             "sessions": session_map[week]
         })
@@ -1,20 +1,18 @@
 import numpy as np
 import pandas as pd
 from utils.segment_detection_rules import rules_by_sport
+from utils.stream_frame import as_stream_frame
+from utils.run_length import mask_runs, latched_mask, run_durations
 
-def safe_series(data, name=""):
-    try:
-        series = pd.to_numeric(data, errors="coerce")
-        if not isinstance(series, (pd.Series, np.ndarray)) or series.dropna().empty:
-            print(f"⚠️ {name} is not a valid non-empty Series.")
-            return None
-        return series
-    except Exception as e:
-        print(f"❌ Failed to coerce {name}: {e}")
-        return None
 
-def detect_warmup(df, activity_type="Run"):
-    rule = rules_by_sport.get(activity_type, {}).get("warmup", {})
+def sport_rule(rules, activity_type, segment_type):
+    """One detector's thresholds from `rules` (defaults to segment_detection_rules.rules_by_sport)."""
+    return (rules_by_sport if rules is None else rules).get(activity_type, {}).get(segment_type, {})
+
+
+def detect_warmup(df, activity_type="Run", rules=None):
+    df = as_stream_frame(df).df
+    rule = sport_rule(rules, activity_type, "warmup")
     if "time_sec" not in df or df.shape[0] < 30:
         return []
     max_time = df["time_sec"].max()
@@ -27,109 +25,97 @@ def detect_warmup(df, activity_type="Run"):
         return []
     return [{"type": "warmup", "start_index": 0, "end_index": int(warmup_end), "duration_sec": int(duration)}]
 
-def detect_intervals(df, activity_type="Run"):
+def detect_intervals(df, activity_type="Run", rules=None):
     print("🔍 Running detect_intervals")
-    rule = rules_by_sport.get(activity_type, {}).get("interval", {})
+    rule = sport_rule(rules, activity_type, "interval")
     min_duration = rule.get("min_duration_sec", 30)
-    speed = safe_series(df.get("rolling_speed_mean"), "rolling_speed_mean")
-    if speed is None:
+    sf = as_stream_frame(df)
+    if sf.series("rolling_speed_mean") is None:
         return []
-    mean_speed = speed.mean()
-    std_speed = speed.std()
-    threshold = mean_speed + std_speed
-    intervals = []
-    in_interval = False
-    start_idx = 0
-    for i, val in enumerate(speed):
-        if val > threshold and not in_interval:
-            start_idx = i
-            in_interval = True
-        elif val <= threshold and in_interval:
-            end_idx = i
-            duration = df["time_sec"].iloc[end_idx] - df["time_sec"].iloc[start_idx]
-            if duration >= min_duration:
-                intervals.append({"type": "interval", "start_index": start_idx, "end_index": end_idx, "duration_sec": int(duration)})
-            in_interval = False
-    return intervals
+    threshold = sf.mean("rolling_speed_mean") + sf.std("rolling_speed_mean")
+    speed = sf.values("rolling_speed_mean")
+    # NaN samples neither open nor close an interval
+    in_interval = latched_mask(speed > threshold, speed <= threshold)
+    starts, ends = mask_runs(in_interval)
+    durations = run_durations(sf.time, starts, ends)
+    return [
+        {"type": "interval", "start_index": int(start), "end_index": int(end), "duration_sec": int(duration)}
+        for start, end, duration in zip(starts, ends, durations)
+        if duration >= min_duration
+    ]
 
-def detect_acceleration_blocks(df, activity_type="Run"):
+def detect_acceleration_blocks(df, activity_type="Run", rules=None):
     print("🔍 Running detect_acceleration_blocks")
-    rule = rules_by_sport.get(activity_type, {}).get("acceleration", {})
-    delta = safe_series(df.get("delta_speed"), "delta_speed")
-    if delta is None:
+    rule = sport_rule(rules, activity_type, "acceleration")
+    sf = as_stream_frame(df)
+    if sf.series("delta_speed") is None:
         return []
-    threshold = delta.mean() + rule.get("delta_threshold_std", 1.0) * delta.std()
+    threshold = sf.mean("delta_speed") + rule.get("delta_threshold_std", 1.0) * sf.std("delta_speed")
+    delta = sf.values("delta_speed")
+    time = sf.time
+    n = len(sf)
     acc_blocks = []
-    for i in range(1, len(df)):
-        if delta.iloc[i] > threshold:
+    for i in range(1, n):
+        if delta[i] > threshold:
             start_idx = max(0, i - 5)
-            end_idx = min(len(df) - 1, i + 5)
-            duration = df["time_sec"].iloc[end_idx] - df["time_sec"].iloc[start_idx]
+            end_idx = min(n - 1, i + 5)
+            duration = time[end_idx] - time[start_idx]
             if duration > 0:
                 acc_blocks.append({"type": "acceleration", "start_index": start_idx, "end_index": end_idx, "duration_sec": int(duration)})
     return acc_blocks
 
-def detect_steady_state_blocks(df, activity_type="Run"):
+def detect_steady_state_blocks(df, activity_type="Run", rules=None):
     print("🔍 Running detect_steady_state_blocks")
-    rule = rules_by_sport.get(activity_type, {}).get("steady", {})
+    rule = sport_rule(rules, activity_type, "steady")
     threshold = rule.get("threshold_pct", 0.1)
     min_len = rule.get("min_len", 30)
-    speed = safe_series(df.get("rolling_speed_mean"), "rolling_speed_mean")
-    hr = safe_series(df.get("rolling_heart_rate_mean"), "rolling_heart_rate_mean")
+    sf = as_stream_frame(df)
+    speed = sf.values("rolling_speed_mean")
+    hr = sf.values("rolling_heart_rate_mean")
     if speed is None or hr is None:
         return []
-    mask = (speed > speed.mean() * (1 - threshold)) & (speed < speed.mean() * (1 + threshold)) & \
-           (hr > hr.mean() * (1 - threshold)) & (hr < hr.mean() * (1 + threshold))
-    blocks = []
-    current = []
-    for i, val in enumerate(mask):
-        if val:
-            current.append(i)
-        elif current:
-            if len(current) > min_len:
-                blocks.append({"type": "steady", "start_index": current[0], "end_index": current[-1],
-                               "duration_sec": int(df["time_sec"].iloc[current[-1]] - df["time_sec"].iloc[current[0]])})
-            current = []
-    return blocks
+    mean_speed = sf.mean("rolling_speed_mean")
+    mean_hr = sf.mean("rolling_heart_rate_mean")
+    mask = sf.memo(("steady_mask", threshold), lambda: (
+        (speed > mean_speed * (1 - threshold)) & (speed < mean_speed * (1 + threshold)) &
+        (hr > mean_hr * (1 - threshold)) & (hr < mean_hr * (1 + threshold))
+    ))
+    starts, ends = mask_runs(mask)
+    lasts = ends - 1
+    durations = run_durations(sf.time, starts, lasts)
+    return [
+        {"type": "steady", "start_index": int(start), "end_index": int(last), "duration_sec": int(duration)}
+        for start, last, duration in zip(starts, lasts, durations)
+        if last - start + 1 > min_len
+    ]
 
-def detect_recovery_blocks(df, known_segments=None, activity_type="Run"):
+def detect_recovery_blocks(df, known_segments=None, activity_type="Run", rules=None):
     print("🔍 Running detect_recovery_blocks")
-    rule = rules_by_sport.get(activity_type, {}).get("recovery", {})
-    hr = safe_series(df.get("rolling_heart_rate_mean"), "heart rate")
-    speed = safe_series(df.get("rolling_speed_mean"), "speed")
-    watts = safe_series(df.get("rolling_power_mean"), "power")
-    thresholds = {}
-    if hr is not None:
-        thresholds["hr"] = hr.mean() * rule.get("hr", 0.85)
-    if speed is not None:
-        thresholds["speed"] = speed.mean() * rule.get("speed", 0.85)
-    if watts is not None:
-        thresholds["watts"] = watts.mean() * rule.get("watts", 0.75)
-    def is_below(i):
-        count = 0
-        if hr is not None and hr.iloc[i] < thresholds["hr"]: count += 1
-        if speed is not None and speed.iloc[i] < thresholds["speed"]: count += 1
-        if watts is not None and watts.iloc[i] < thresholds["watts"]: count += 1
-        return count >= 2
-    recovery = []
-    in_block = False
-    start_idx = 0
-    for i in range(len(df)):
-        if is_below(i):
-            if not in_block:
-                start_idx = i
-                in_block = True
-        elif in_block:
-            end_idx = i
-            duration = df["time_sec"].iloc[end_idx] - df["time_sec"].iloc[start_idx]
-            if rule.get("min_duration", 30) <= duration <= rule.get("max_duration", 900):
-                recovery.append({"type": "recovery", "start_index": start_idx, "end_index": end_idx, "duration_sec": int(duration)})
-            in_block = False
-    return recovery
+    rule = sport_rule(rules, activity_type, "recovery")
+    sf = as_stream_frame(df)
+    channels = [
+        ("rolling_heart_rate_mean", rule.get("hr", 0.85)),
+        ("rolling_speed_mean", rule.get("speed", 0.85)),
+        ("rolling_power_mean", rule.get("watts", 0.75)),
+    ]
+    below = []
+    for col, factor in channels:
+        if sf.series(col) is not None:
+            below.append(sf.memo(("below", col, factor), lambda: sf.values(col) < sf.mean(col) * factor))
+    below_count = np.sum(below, axis=0) if below else np.zeros(len(sf), dtype=int)
+    starts, ends = mask_runs(below_count >= 2)
+    durations = run_durations(sf.time, starts, ends)
+    min_duration, max_duration = rule.get("min_duration", 30), rule.get("max_duration", 900)
+    return [
+        {"type": "recovery", "start_index": int(start), "end_index": int(end), "duration_sec": int(duration)}
+        for start, end, duration in zip(starts, ends, durations)
+        if min_duration <= duration <= max_duration
+    ]
 
-def detect_cooldown(df, activity_type="Run"):
+def detect_cooldown(df, activity_type="Run", rules=None):
     print("🔍 Running detect_cooldown")
-    rule = rules_by_sport.get(activity_type, {}).get("cooldown", {})
+    df = as_stream_frame(df).df
+    rule = sport_rule(rules, activity_type, "cooldown")
     if "time_sec" not in df or df.shape[0] < 30:
         return []
     end_time = df["time_sec"].iloc[-1]
@@ -144,6 +130,7 @@ def detect_cooldown(df, activity_type="Run"):
 
 def detect_swimming_blocks(df, activity_type="Swim"):
     print("🔍 Running detect_swimming_blocks")
+    df = as_stream_frame(df).df
     if "time_sec" not in df or df.shape[0] < 30:
         return []
     duration = df["time_sec"].iloc[-1] - df["time_sec"].iloc[0]
@@ -1,3 +1,5 @@
+from bisect import bisect_left
+
 SEGMENT_PRIORITY = {
     "interval": 5,
     "steady": 4,
@@ -16,11 +18,24 @@ EXPECTED_FLOW = {
     "cooldown": [],
 }
 
-def infer_segment_sequence(segments, df):
-    """
-    Constructs a non-overlapping, logically ordered sequence of training segments.
-    Uses transition rules and prioritization to reflect actual workout structure.
-    """
+# Types each segment type may directly follow
+ALLOWED_PREVIOUS = {
+    seg_type: [prev for prev, following in EXPECTED_FLOW.items() if prev is not None and seg_type in following]
+    for seg_type in SEGMENT_PRIORITY
+}
+
+SEQUENCER_MODES = ("greedy", "optimal")
+
+
+def _accept(seg, last_type):
+    seg = seg.copy()
+    seg["primary"] = True
+    if last_type:
+        seg["after"] = last_type
+    return seg
+
+
+def _greedy_sequence(segments):
     # Sort by start_index and prioritize by strength
     sorted_segments = sorted(
         segments,
@@ -28,28 +43,95 @@ def infer_segment_sequence(segments, df):
     )
 
     sequence = []
-    occupied = set()
+    # Candidates come in start order, so one overlaps an accepted segment iff it starts before the furthest accepted end
+    max_end = -1
     last_type = None
 
     for seg in sorted_segments:
-        seg = seg.copy()
-        seg_range = set(range(seg["start_index"], seg["end_index"] + 1))
         seg_type = seg["type"]
 
         # Skip if overlapping with previous accepted segment
-        if not seg_range.isdisjoint(occupied):
+        if seg["start_index"] <= max_end:
             continue
 
         # Check logical transition
         if last_type is not None and seg_type not in EXPECTED_FLOW.get(last_type, []):
             continue
 
-        # Accept the segment
-        seg["primary"] = True
-        if last_type:
-            seg["after"] = last_type
+        sequence.append(_accept(seg, last_type))
         last_type = seg_type
-        occupied.update(seg_range)
-        sequence.append(seg)
+        max_end = max(max_end, seg["end_index"])
 
     return sequence
+
+
+def _optimal_sequence(segments):
+    """
+    Weighted interval scheduling with transition constraints: the non-overlapping
+    chain with the highest total SEGMENT_PRIORITY (ties: more segments) in which
+    every segment may follow the previous one under EXPECTED_FLOW. O(k log k).
+    """
+    if not segments:
+        return []
+    by_start = sorted(
+        range(len(segments)),
+        key=lambda i: (segments[i]["start_index"], -SEGMENT_PRIORITY.get(segments[i]["type"], 0))
+    )
+    by_end = sorted(range(len(segments)), key=lambda i: segments[i]["end_index"])
+    ends = [segments[i]["end_index"] for i in by_end]
+
+    score = [None] * len(segments)     # (priority sum, count) of the best chain ending at i
+    previous = [None] * len(segments)
+    best_by_type = {}                  # type -> index of best finished chain ending in that type
+    inserted = 0
+
+    for j in by_start:
+        seg = segments[j]
+        # Every chain ending strictly before this segment starts can precede it
+        cutoff = bisect_left(ends, seg["start_index"])
+        while inserted < cutoff:
+            i = by_end[inserted]
+            seg_type = segments[i]["type"]
+            if seg_type not in best_by_type or score[i] > score[best_by_type[seg_type]]:
+                best_by_type[seg_type] = i
+            inserted += 1
+
+        best_prev = None
+        for prev_type in ALLOWED_PREVIOUS.get(seg["type"], []):
+            i = best_by_type.get(prev_type)
+            if i is not None and (best_prev is None or score[i] > score[best_prev]):
+                best_prev = i
+
+        weight = SEGMENT_PRIORITY.get(seg["type"], 0)
+        if best_prev is None:
+            score[j] = (weight, 1)
+        else:
+            score[j] = (score[best_prev][0] + weight, score[best_prev][1] + 1)
+            previous[j] = best_prev
+
+    last = max(by_start, key=lambda i: score[i])
+    chain = []
+    while last is not None:
+        chain.append(last)
+        last = previous[last]
+
+    sequence = []
+    last_type = None
+    for i in reversed(chain):
+        sequence.append(_accept(segments[i], last_type))
+        last_type = segments[i]["type"]
+    return sequence
+
+
+def infer_segment_sequence(segments, df, mode="greedy"):
+    """
+    Constructs a non-overlapping, logically ordered sequence of training segments.
+    Uses transition rules and prioritization to reflect actual workout structure.
+    mode="greedy" takes segments in start order as they fit; mode="optimal" finds
+    the highest-priority valid sequence.
+    """
+    if mode == "greedy":
+        return _greedy_sequence(segments)
+    if mode == "optimal":
+        return _optimal_sequence(segments)
+    raise ValueError(f"Unknown sequencer mode: {mode!r} (expected one of {SEQUENCER_MODES})")
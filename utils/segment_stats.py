@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+
+EFFORT_KEYS = ["heart_rate", "speed", "cadence", "watts"]
+AFTER_WINDOW_SEC = 60
+
+
+class SegmentStats:
+    """
+    Window statistics over a parsed stream. Each channel gets NaN-aware prefix
+    sums and counts (plus first/last valid-sample lookups) once, after which any
+    [lo, hi) window mean is O(1). Windows are positional, like df.iloc[lo:hi],
+    and the effort-after window is found with searchsorted whenever time_sec is
+    sorted.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.n = len(df)
+        self.columns = list(df.columns)
+        self._values = {}
+        self._prefix = {}
+        self._last_valid = {}
+        self._next_valid = {}
+        self._time_sorted = None
+
+    def __contains__(self, col):
+        return col in self.df
+
+    def values(self, col):
+        if col not in self._values:
+            self._values[col] = pd.to_numeric(self.df[col], errors="coerce").to_numpy(dtype=float)
+        return self._values[col]
+
+    def _clamp(self, lo, hi):
+        lo = min(max(lo, 0), self.n)
+        return lo, min(max(hi, lo), self.n)
+
+    def _sums(self, col):
+        if col not in self._prefix:
+            values = self.values(col)
+            valid = ~np.isnan(values)
+            # Centre on the first valid sample so long cumulative sums keep their precision
+            offset = values[np.argmax(valid)] if valid.any() else 0.0
+            csum = np.concatenate(([0.0], np.cumsum(np.where(valid, values - offset, 0.0))))
+            ccount = np.concatenate(([0], np.cumsum(valid)))
+            self._prefix[col] = (csum, ccount, offset)
+        return self._prefix[col]
+
+    def count(self, col, lo, hi):
+        lo, hi = self._clamp(lo, hi)
+        _, ccount, _ = self._sums(col)
+        return int(ccount[hi] - ccount[lo])
+
+    def mean(self, col, lo, hi):
+        """Mean of the valid samples in rows [lo, hi), or None if there are none."""
+        lo, hi = self._clamp(lo, hi)
+        csum, ccount, offset = self._sums(col)
+        count = ccount[hi] - ccount[lo]
+        if count == 0:
+            return None
+        return float((csum[hi] - csum[lo]) / count + offset)
+
+    def last_valid(self, col, hi):
+        """Last valid sample before row `hi`, or None."""
+        if col not in self._last_valid:
+            valid = ~np.isnan(self.values(col))
+            idx = np.where(valid, np.arange(self.n), -1)
+            self._last_valid[col] = np.maximum.accumulate(idx) if self.n else idx
+        hi = min(max(hi, 0), self.n)
+        if hi == 0:
+            return None
+        idx = self._last_valid[col][hi - 1]
+        return None if idx < 0 else float(self.values(col)[idx])
+
+    def first_valid(self, col, lo, hi):
+        """First valid sample in rows [lo, hi), or None."""
+        if col not in self._next_valid:
+            valid = ~np.isnan(self.values(col))
+            idx = np.where(valid, np.arange(self.n), self.n)
+            self._next_valid[col] = np.minimum.accumulate(idx[::-1])[::-1] if self.n else idx
+        lo, hi = self._clamp(lo, hi)
+        if lo >= hi:
+            return None
+        idx = self._next_valid[col][lo]
+        return None if idx >= hi else float(self.values(col)[idx])
+
+    @property
+    def time_sorted(self):
+        if self._time_sorted is None:
+            self._time_sorted = bool(np.all(np.diff(self.values("time_sec")) >= 0))
+        return self._time_sorted
+
+    def after_rows(self, start, seconds=AFTER_WINDOW_SEC):
+        """Rows with time in (time[start], time[start] + seconds], as a slice when time is sorted."""
+        time = self.values("time_sec")
+        if self.time_sorted:
+            lo = int(np.searchsorted(time, time[start], side="right"))
+            hi = int(np.searchsorted(time, time[start] + seconds, side="right"))
+            return slice(lo, max(hi, lo))
+        # Paused or reset recordings can step back in time, so fall back to a mask
+        return np.flatnonzero((time > time[start]) & (time <= time[start] + seconds))
+
+    def rows_mean(self, col, rows):
+        if isinstance(rows, slice):
+            return self.mean(col, rows.start, rows.stop)
+        values = self.values(col)[rows]
+        values = values[~np.isnan(values)]
+        return float(values.mean()) if len(values) else None
+
+    def rows_first_valid(self, col, rows):
+        if isinstance(rows, slice):
+            return self.first_valid(col, rows.start, rows.stop)
+        values = self.values(col)[rows]
+        values = values[~np.isnan(values)]
+        return float(values[0]) if len(values) else None
+
+    def effort_before(self, seg):
+        start = seg["start_index"]
+        prior_hi = min(start, self.n)
+        last = prior_hi - 1
+        effort = {
+            "duration_sec": float(self.values("time_sec")[last]),
+            "distance_m": float(self.values("distance")[last]) if "distance" in self else 0,
+            "altitude_m": float(self.values("altitude")[last]) if "altitude" in self else 0,
+        }
+        self._fill_effort(
+            effort, seg,
+            window_mean=lambda col: self.mean(col, 0, prior_hi),
+            pick_slope=lambda col: self.last_valid(col, prior_hi),
+        )
+
+        time = self.values("time_sec")
+        t_now, t_prev = time[start], time[start - 1]
+        effort["time_gap_sec"] = float(t_now - t_prev) if t_now and t_prev else 0
+        return effort
+
+    def effort_after(self, seg):
+        end = seg["end_index"]
+        rows = self.after_rows(end + 1)
+        nonempty = len(self.values("time_sec")[rows]) > 0
+
+        def span(col):
+            values = self.values(col)[rows]
+            return float(values[-1] - values[0])
+
+        effort = {
+            "duration_sec": span("time_sec") if nonempty else 0,
+            "distance_m": span("distance") if "distance" in self and nonempty else 0,
+            "altitude_m": span("altitude") if "altitude" in self and nonempty else 0,
+        }
+        self._fill_effort(
+            effort, seg,
+            window_mean=lambda col: self.rows_mean(col, rows),
+            pick_slope=lambda col: self.rows_first_valid(col, rows),
+        )
+
+        time = self.values("time_sec")
+        t_now, t_next = time[end], time[end + 1]
+        effort["time_gap_sec"] = float(t_next - t_now) if t_next and t_now else 0
+        return effort
+
+    def _fill_effort(self, effort, seg, window_mean, pick_slope):
+        seg_lo, seg_hi = seg["start_index"], seg["end_index"] + 1
+        for key in EFFORT_KEYS:
+            if key not in self:
+                continue
+            avg = window_mean(key)
+            if avg is None:
+                continue
+            effort[f"avg_{key}"] = avg
+
+            seg_avg = self.mean(key, seg_lo, seg_hi)
+            if seg_avg is not None:
+                effort[f"delta_{key}"] = float(avg - seg_avg)
+
+            slope_col = f"rolling_{key}_trend"
+            if slope_col in self:
+                slope = pick_slope(slope_col)
+                if slope is not None:
+                    effort[f"{key}_slope"] = slope
+
+    def segment_averages(self, seg):
+        """avg_<col> for every raw channel with at least one valid sample in the segment."""
+        lo, hi = seg["start_index"], seg["end_index"] + 1
+        averages = {}
+        for col in self.columns:
+            if col.startswith("delta_") or col.startswith("rolling_"):
+                continue
+            avg = self.mean(col, lo, hi)
+            if avg is not None:
+                averages[f"avg_{col}"] = avg
+        return averages
@@ -0,0 +1,157 @@
+"""
+Compact binary columnar storage for `stream_data_full`.
+
+Legacy documents store every sample as a BSON double inside a list. Encoded
+documents keep one entry per channel (so `stream_data_full.<channel>` projections
+keep working) holding a typed, optionally delta-encoded, zlib-compressed blob:
+
+    {
+        "_codec": {"name": "columnar-zlib", "version": 1, "length": 3600},
+        "heart_rate": b"<16-byte header><zlib payload>",
+        ...
+    }
+
+Channels are decoded lazily, one at a time, into float64 NumPy arrays.
+"""
+import struct
+import zlib
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+CODEC_KEY = "_codec"
+CODEC_NAME = "columnar-zlib"
+CODEC_VERSION = 1
+COMPRESSION_LEVEL = 6
+
+# channel: (storage dtype, scale applied before quantizing, delta-encode)
+CHANNEL_SPECS = {
+    "time_sec": ("int32", 1000, True),     # milliseconds
+    "distance": ("int32", 100, True),      # centimetres
+    "altitude": ("int32", 100, True),      # centimetres
+    "heart_rate": ("int16", 1, False),
+    "watts": ("uint16", 1, False),
+    "cadence": ("uint16", 1, False),
+    "speed": ("uint16", 1000, False),      # mm/s
+}
+DEFAULT_SPEC = ("float32", 1, False)
+
+DTYPE_CODES = {"int16": 1, "uint16": 2, "int32": 3, "float32": 4}
+DTYPES_BY_CODE = {code: name for name, code in DTYPE_CODES.items()}
+
+FLAG_DELTA = 0b01
+FLAG_NULLS = 0b10
+
+# version, dtype code, flags, padding, sample count, scale
+HEADER = struct.Struct("<BBBxId")
+
+
+def is_encoded_streams(streams) -> bool:
+    return isinstance(streams, dict) and isinstance(streams.get(CODEC_KEY), dict)
+
+
+def is_current_format(streams) -> bool:
+    """Encoded with this codec name and version, so re-encoding would not change the storage format."""
+    if not is_encoded_streams(streams):
+        return False
+    codec = streams[CODEC_KEY]
+    return codec.get("name") == CODEC_NAME and codec.get("version") == CODEC_VERSION
+
+
+def _forward_fill(values, nulls):
+    """Fills NaNs with the previous valid sample (0 before the first) so deltas stay small."""
+    idx = np.where(nulls, 0, np.arange(len(values)))
+    np.maximum.accumulate(idx, out=idx)
+    filled = values[idx]
+    filled[np.isnan(filled)] = 0.0
+    return filled
+
+
+def encode_channel(values, name: str = "") -> bytes:
+    values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+    dtype, scale, delta = CHANNEL_SPECS.get(name, DEFAULT_SPEC)
+    nulls = np.isnan(values)
+    flags = (FLAG_DELTA if delta else 0) | (FLAG_NULLS if nulls.any() else 0)
+
+    if np.issubdtype(np.dtype(dtype), np.floating):
+        stored = values.astype(dtype)
+    else:
+        quantized = np.round(_forward_fill(values, nulls) * scale)
+        if delta:
+            quantized = np.diff(quantized, prepend=0.0)
+        info = np.iinfo(dtype)
+        stored = np.clip(quantized, info.min, info.max).astype(dtype)
+
+    payload = stored.tobytes()
+    if flags & FLAG_NULLS:
+        payload += np.packbits(nulls).tobytes()
+
+    header = HEADER.pack(CODEC_VERSION, DTYPE_CODES[dtype], flags, len(values), float(scale))
+    return header + zlib.compress(payload, COMPRESSION_LEVEL)
+
+
+def decode_channel(blob) -> np.ndarray:
+    version, dtype_code, flags, length, scale = HEADER.unpack_from(blob)
+    if version > CODEC_VERSION:
+        raise ValueError(f"Unsupported stream codec version {version}")
+
+    dtype = np.dtype(DTYPES_BY_CODE[dtype_code])
+    payload = zlib.decompress(bytes(blob[HEADER.size:]))
+    data_size = dtype.itemsize * length
+    values = np.frombuffer(payload[:data_size], dtype=dtype).astype(float)
+
+    if flags & FLAG_DELTA:
+        values = np.cumsum(values)
+    if scale != 1:
+        values = values / scale
+    if flags & FLAG_NULLS:
+        nulls = np.unpackbits(np.frombuffer(payload[data_size:], dtype=np.uint8), count=length).astype(bool)
+        values[nulls] = np.nan
+    return values
+
+
+def encode_streams(streams) -> dict:
+    """Encodes a DataFrame or {channel: samples} mapping into the columnar format."""
+    if isinstance(streams, pd.DataFrame):
+        streams = {col: streams[col] for col in streams.columns}
+
+    encoded = {name: encode_channel(values, name) for name, values in streams.items() if name != CODEC_KEY}
+    length = max((len(v) for k, v in streams.items() if k != CODEC_KEY), default=0)
+    encoded[CODEC_KEY] = {"name": CODEC_NAME, "version": CODEC_VERSION, "length": length}
+    return encoded
+
+
+class EncodedStreams(Mapping):
+    """Read-only {channel: np.ndarray} view that decodes each channel on first access."""
+
+    def __init__(self, encoded: dict):
+        self._encoded = encoded
+        self._decoded = {}
+
+    def __getitem__(self, name):
+        if name == CODEC_KEY or name not in self._encoded:
+            raise KeyError(name)
+        if name not in self._decoded:
+            self._decoded[name] = decode_channel(self._encoded[name])
+        return self._decoded[name]
+
+    def __iter__(self):
+        return (name for name in self._encoded if name != CODEC_KEY)
+
+    def __len__(self):
+        return sum(1 for name in self._encoded if name != CODEC_KEY)
+
+    @property
+    def length(self) -> int:
+        return self._encoded[CODEC_KEY].get("length", 0)
+
+
+def decode_streams(streams):
+    """
+    Returns a {channel: samples} mapping for either storage format: encoded
+    documents become a lazy EncodedStreams, legacy list dicts are returned as-is.
+    """
+    if is_encoded_streams(streams):
+        return EncodedStreams(streams)
+    return streams
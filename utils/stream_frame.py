@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+ROLLING_WINDOW = 30
+
+
+def safe_series(data, name=""):
+    try:
+        series = pd.to_numeric(data, errors="coerce")
+        if not isinstance(series, (pd.Series, np.ndarray)) or series.dropna().empty:
+            print(f"⚠️ {name} is not a valid non-empty Series.")
+            return None
+        return series
+    except Exception as e:
+        print(f"❌ Failed to coerce {name}: {e}")
+        return None
+
+
+def rolling_nanmean(values, window=ROLLING_WINDOW):
+    """
+    Trailing rolling mean ignoring NaNs (pandas rolling(window, min_periods=1).mean())
+    from one cumulative sum and one cumulative count.
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return np.full(len(values), np.nan)
+
+    # Centre on the first sample to keep the cumulative sum small on long rides
+    offset = values[np.argmax(valid)]
+    csum = np.concatenate(([0.0], np.cumsum(np.where(valid, values - offset, 0.0))))
+    ccount = np.concatenate(([0], np.cumsum(valid)))
+    upper = np.arange(1, len(values) + 1)
+    lower = np.maximum(upper - window, 0)
+    counts = ccount[upper] - ccount[lower]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, (csum[upper] - csum[lower]) / counts + offset, np.nan)
+
+
+class StreamFrame:
+    """
+    A parsed activity stream shared by every segment detector. Coerced columns,
+    derived features, summary statistics, thresholds and masks are computed on
+    first access and cached, so each one is built once per enrichment however
+    many rules read it.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def __contains__(self, name):
+        return name in self.df
+
+    @property
+    def shape(self):
+        return self.df.shape
+
+    def memo(self, key, compute):
+        """Caches an arbitrary derived value (threshold, mask, ...) under `key`."""
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def series(self, name):
+        """Numeric column, or None when missing or all-NaN (see safe_series)."""
+        return self.memo(("series", name), lambda: safe_series(self.df.get(name), name))
+
+    def values(self, name):
+        """Numeric column as a float64 array, or None."""
+        def compute():
+            series = self.series(name)
+            return None if series is None else series.to_numpy(dtype=float)
+        return self.memo(("values", name), compute)
+
+    @property
+    def time(self):
+        return self.memo("time", lambda: self.df["time_sec"].to_numpy(dtype=float))
+
+    def mean(self, name):
+        return self.memo(("mean", name), lambda: self.series(name).mean())
+
+    def std(self, name):
+        return self.memo(("std", name), lambda: self.series(name).std())
+
+
+def as_stream_frame(data):
+    """Detectors accept either a DataFrame or an already shared StreamFrame."""
+    return data if isinstance(data, StreamFrame) else StreamFrame(data)